@@ -1,60 +1,344 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from typing import Any, List
-import shutil
+from fastapi import APIRouter, Header, HTTPException, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import base64
+import csv
+import io
+import json
 import os
+import time
 import uuid
-from app.core.orchestrator import ForensicsOrchestrator
+import zlib
+from sqlalchemy import Integer, case, cast, func, literal, select, tuple_
 from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.models import AnalysisLog
+from app.core.artifacts import ela_artifacts
+from app.core.cache import result_cache
+from app.core.config import settings
+from app.core.database import get_db, SessionLocal
+from app.core.jobs import job_manager
+from app.core.log_writer import analysis_log
+from app.core.metrics import ANALYSES, BYTES_PROCESSED, STAGE_DURATION
+from app.core.storage import storage
+from app.core.uploads import receive_upload
+from app.models import LAYER_SCORE_COLUMNS, AnalysisLog
 
 router = APIRouter()
-orchestrator = ForensicsOrchestrator()
 
-UPLOAD_DIR = "uploads"
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
+# The body is read by receive_upload(); documents the form for /docs
+UPLOAD_FORM = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "properties": {"file": {"type": "string", "format": "binary"}},
+    "required": ["file"],
+}}}}}
 
-@router.post("/analyze", response_model=Any)
+def _log_analysis(filename: str, file_ext: str, results: Dict[str, Any]):
+    media_type = "video" if file_ext.lower() in ['.mp4', '.avi', '.mov'] else "image"
+    ANALYSES.inc(media_type=media_type, verdict=results["verdict"], cache=results.get("cache", "miss"))
+    # Written behind the request by the background log writer
+    analysis_log.submit(dict(
+        filename=filename,
+        media_type=media_type,
+        verdict=results["verdict"],
+        confidence=results["confidence"],
+        layer_scores=results["layer_scores"],
+        **AnalysisLog.score_columns(results["layer_scores"])
+    ))
+
+@router.post("/analyze", response_model=Any, openapi_extra=UPLOAD_FORM)
 async def analyze_media(
-    file: UploadFile = File(...), 
-    db: Session = Depends(get_db)
+    request: Request,
+    async_mode: bool = Query(False, alias="async"),
+    profile: bool = Query(False),
+    x_profile: Optional[str] = Header(None)
 ):
     """
     Upload an image or video for deepfake analysis.
+    With ?async=true, returns a job id immediately; poll GET /jobs/{job_id}.
+    With ?profile=true (or an "X-Profile: 1" header) and PROFILING_ENABLED,
+    the analysis is profiled and bypasses the result cache; the timing tree
+    is returned in details.profile.
     """
+    profile = profile or (x_profile or "").lower() in ("1", "true", "yes")
+    if profile and not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled (set PROFILING_ENABLED)")
+
+    upload_started = time.perf_counter()
+    try:
+        # Images up to IN_MEMORY_UPLOAD_MAX_BYTES stay in memory; only derived
+        # artifacts touch the disk. Videos and larger images stream into storage.
+        upload = await receive_upload(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    STAGE_DURATION.observe(time.perf_counter() - upload_started, stage="upload")
+    BYTES_PROCESSED.inc(upload.size, media_type="video" if upload.is_video else "image")
+
     # Generate unique filename
-    file_ext = os.path.splitext(file.filename)[1]
+    file_ext = upload.ext
     filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
+    media, content_hash = upload.media, upload.content_hash
+    # Original stored on disk (pinned while in use), None for in-memory images
+    file_path = upload.path
+
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Run analysis
-        results = orchestrator.analyze_media(file_path)
-        
-        # Save to DB
-        db_log = AnalysisLog(
-            filename=file.filename,
-            media_type="video" if file_ext.lower() in ['.mp4', '.avi', '.mov'] else "image",
-            verdict=results["verdict"],
-            confidence=results["confidence"],
-            layer_scores=results["layer_scores"]
-        )
-        db.add(db_log)
-        db.commit()
-        db.refresh(db_log)
-        
+        if profile:
+            # Always a fresh run, never shared with or stored in the cache
+            future = job_manager.start(media, filename, content_hash, profile=True)
+        elif settings.RESULT_CACHE_ENABLED:
+            key = result_cache.key(content_hash, file_ext)
+            cached = await run_in_threadpool(result_cache.get, key)
+            if cached is not None:
+                # Same bytes already analysed by this pipeline version and configuration
+                future = Future()
+                future.set_result({**cached, "cache": "hit"})
+            else:
+                # An identical upload already in flight is shared instead of re-run
+                future, _ = result_cache.get_or_submit(key, lambda: job_manager.start(media, filename, content_hash))
+        else:
+            future = job_manager.start(media, filename, content_hash)
+
+        if not upload.is_video:
+            # Lets GET /ela/{hash} render the ELA image later, from memory or the stored original
+            ela_artifacts.register(content_hash, media, filename)
+
+        # Our pin on the original is dropped once the analysis we wait for is over
+        pinned, file_path = file_path, None
+        future.add_done_callback(lambda _: storage.release(pinned))
+
+        if async_mode:
+            original_name = upload.filename
+
+            def on_complete(done):
+                if done.exception() is None:
+                    _log_analysis(original_name, file_ext, done.result())
+
+            job_id = job_manager.track(future, on_complete=on_complete)
+            return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+
+        # Run analysis on the worker pool, off the event loop
+        results = await asyncio.wrap_future(future)
+
+        # Save to DB (queued; never waits on the database)
+        _log_analysis(upload.filename, file_ext, results)
+
         return results
-        
+
     except Exception as e:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        storage.release(file_path)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/jobs/{job_id}", response_model=Any)
+def get_job(job_id: str):
+    """
+    Status, per-layer progress and (once done) the result of an async analysis.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/ela/{content_hash}")
+def get_ela_image(content_hash: str):
+    """
+    Error Level Analysis image of an analysed upload. Rendered on the first
+    request and served from disk afterwards.
+    """
+    path = ela_artifacts.path(content_hash)
+    if path is None:
+        raise HTTPException(status_code=404, detail="ELA image not available; re-upload the file to analyse it again")
+    return FileResponse(path, media_type="image/png")
+
+@router.get("/model/batching", response_model=Any)
+def get_batching_stats():
+    """
+    Batch-size and queue-wait statistics of the Layer 4 dynamic batcher.
+    With the process executor each worker keeps its own batcher; per-request
+    figures are then reported in the result's details.ai_model.batch.
+    """
+    stats = job_manager.batcher_stats()
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Model batching is not active in this process")
+    return stats
+
+def _encode_cursor(log: AnalysisLog) -> str:
+    raw = f"{log.timestamp.isoformat(sep=' ')}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Timestamps are stored as naive UTC
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _in_range(query, start: Optional[datetime], end: Optional[datetime]):
+    if start is not None:
+        query = query.filter(AnalysisLog.timestamp >= _as_utc(start))
+    if end is not None:
+        query = query.filter(AnalysisLog.timestamp < _as_utc(end))
+    return query
+
 @router.get("/history", response_model=List[Any])
-def get_history(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    logs = db.query(AnalysisLog).order_by(AnalysisLog.timestamp.desc()).offset(skip).limit(limit).all()
-    return logs
+def get_history(
+    response: Response,
+    limit: int = Query(10, ge=1, le=500),
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    db: Session = Depends(get_db)
+):
+    """
+    Analyses, newest first. When more rows follow, the X-Next-Cursor header
+    holds the ?cursor= value of the next page; each page is one index seek
+    on (timestamp, id), however deep. ?skip= still works but scans.
+    """
+    # Include analyses that finished moments ago and are still queued for writing
+    analysis_log.flush()
+    query = db.query(AnalysisLog).order_by(AnalysisLog.timestamp.desc(), AnalysisLog.id.desc())
+    if cursor:
+        timestamp, log_id = _decode_cursor(cursor)
+        # Typed bind: the timestamp must be rendered in the column's storage format
+        query = query.filter(tuple_(AnalysisLog.timestamp, AnalysisLog.id)
+                             < tuple_(literal(timestamp, AnalysisLog.timestamp.type), log_id))
+    elif skip:
+        query = query.offset(skip)
+    logs = query.limit(limit).all()
+    if len(logs) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(logs[-1])
+    return [log.to_dict() for log in logs]
+
+def _histogram(db: Session, column, bins: int, start, end) -> List[int]:
+    """Counts of column values in `bins` equal bins over [0, 1]; out-of-range values go to the end bins."""
+    bucket = cast(column * bins, Integer)
+    bucket = case((bucket < 0, 0), (bucket >= bins, bins - 1), else_=bucket)
+    rows = _in_range(db.query(bucket, func.count()).filter(column.isnot(None)), start, end).group_by(bucket).all()
+    counts = [0] * bins
+    for index, count in rows:
+        counts[int(index)] = count
+    return counts
+
+@router.get("/stats", response_model=Any)
+def get_stats(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bins: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    Aggregates over the analyses in [start, end), computed in SQL: verdict
+    and media type counts, confidence and per-layer score histograms, and
+    per-layer averages.
+    """
+    analysis_log.flush()
+    layer_columns = {name: getattr(AnalysisLog, column) for name, column in LAYER_SCORE_COLUMNS.items()}
+    totals = _in_range(db.query(
+        func.count(AnalysisLog.id),
+        func.avg(AnalysisLog.confidence),
+        *[func.avg(column) for column in layer_columns.values()],
+        *[func.count(column) for column in layer_columns.values()]
+    ), start, end).one()
+    total, mean_confidence = totals[0], totals[1]
+    means = totals[2:2 + len(layer_columns)]
+    counts = totals[2 + len(layer_columns):]
+
+    def grouped(column):
+        return dict(_in_range(db.query(column, func.count()), start, end).group_by(column).all())
+
+    return {
+        "start": start,
+        "end": end,
+        "total": total,
+        "verdicts": grouped(AnalysisLog.verdict),
+        "media_types": grouped(AnalysisLog.media_type),
+        "histogram_edges": [round(i / bins, 4) for i in range(bins + 1)],
+        "confidence": {
+            "mean": mean_confidence,
+            "histogram": _histogram(db, AnalysisLog.confidence, bins, start, end),
+        },
+        "layers": {
+            name: {"mean": mean, "count": count, "histogram": _histogram(db, column, bins, start, end)}
+            for (name, column), mean, count in zip(layer_columns.items(), means, counts)
+        },
+    }
+
+# Columns of GET /export, in order; CSV carries the per-layer score columns, NDJSON the layer_scores object
+EXPORT_COLUMNS = ["id", "timestamp", "filename", "media_type", "verdict", "confidence"]
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+def _export_lines(fmt: str, start: Optional[datetime], end: Optional[datetime], verdicts: Optional[List[str]]):
+    """Yields export lines, reading rows through a cursor EXPORT_FETCH_SIZE at a time."""
+    score_columns = list(LAYER_SCORE_COLUMNS.values())
+    columns = [getattr(AnalysisLog, name) for name in EXPORT_COLUMNS]
+    columns += [getattr(AnalysisLog, name) for name in score_columns] if fmt == "csv" else [AnalysisLog.layer_scores]
+    query = select(*columns).order_by(AnalysisLog.timestamp, AnalysisLog.id)
+    if start is not None:
+        query = query.where(AnalysisLog.timestamp >= _as_utc(start))
+    if end is not None:
+        query = query.where(AnalysisLog.timestamp < _as_utc(end))
+    if verdicts:
+        query = query.where(AnalysisLog.verdict.in_(verdicts))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(EXPORT_COLUMNS + score_columns)
+
+    # Own session: the response outlives the request's dependencies
+    db = SessionLocal()
+    try:
+        rows = db.execute(query.execution_options(yield_per=settings.EXPORT_FETCH_SIZE))
+        for row in rows:
+            values = list(row)
+            values[1] = values[1].isoformat(sep=" ") if values[1] else None
+            if fmt == "csv":
+                writer.writerow(values)
+            else:
+                record = dict(zip(EXPORT_COLUMNS + ["layer_scores"], values))
+                buffer.write(json.dumps(record) + "\n")
+            if buffer.tell() >= settings.EXPORT_CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    finally:
+        db.close()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+@router.get("/export")
+def export_history(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    verdict: Optional[List[str]] = Query(None),
+    gzip: bool = False
+):
+    """
+    Streams the analyses in [start, end) as CSV or NDJSON, oldest first,
+    optionally filtered by verdict (repeatable). Rows are read and sent
+    in bounded batches, so exports of any size run in constant memory.
+    With ?gzip=true the body is gzip-encoded on the fly.
+    """
+    analysis_log.flush()
+    lines = _export_lines(format, start, end, verdict)
+    body = _gzipped(lines) if gzip else (chunk.encode() for chunk in lines)
+    stamp = "_".join(v.strftime("%Y%m%d") for v in (start, end) if v is not None)
+    headers = {"Content-Disposition": f'attachment; filename="analysis_history{"_" + stamp if stamp else ""}.{format}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=EXPORT_FORMATS[format], headers=headers)
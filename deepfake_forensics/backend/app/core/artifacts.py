@@ -0,0 +1,143 @@
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.core.storage import storage
+
+logger = logging.getLogger(__name__)
+
+CONTENT_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def ela_url(content_hash: str) -> str:
+    """API path that renders (or serves) the ELA image of an analysed upload."""
+    return f"{settings.API_V1_STR}/ela/{content_hash}"
+
+
+class ELAArtifacts:
+    """
+    ELA images rendered on demand instead of on every request.
+    - register() remembers the original of an analysed upload, keyed by
+      content hash: its bytes (LRU, bounded by ELA_SOURCE_CACHE_MB) or its path.
+      With ELA_PERSIST_SOURCES on, in-memory uploads are also written to
+      storage (kind "originals") by a background thread, so the ELA image
+      can still be rendered after eviction, a restart, or on another worker
+    - path() renders the ELA image the first time it is asked for and keeps
+      the PNG in storage (kind "ela") for every later request, subject to
+      the storage retention policy
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = int(settings.ELA_SOURCE_CACHE_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self._sources: "OrderedDict[str, Tuple[Union[bytes, str], str]]" = OrderedDict()
+        self._source_bytes = 0
+        self._lock = threading.Lock()
+        self._render_locks: Dict[str, threading.Lock] = {}
+        self._writer: Optional[ThreadPoolExecutor] = None
+
+    def register(self, content_hash: str, media: Union[bytes, str], filename: str):
+        """media: upload bytes or the path of the saved upload; filename gives its type."""
+        size = len(media) if isinstance(media, (bytes, memoryview)) else 0
+        if size and settings.ELA_PERSIST_SOURCES:
+            try:
+                self._writer_pool().submit(self._persist, content_hash, media, os.path.splitext(filename)[1])
+            except RuntimeError:
+                pass # Interpreter shutting down; the in-memory copy still serves this process
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if content_hash in self._sources:
+                self._sources.move_to_end(content_hash)
+                return
+            self._sources[content_hash] = (media, filename)
+            self._source_bytes += size
+            while self._source_bytes > self.max_bytes:
+                _, (old, _) = self._sources.popitem(last=False)
+                if isinstance(old, (bytes, memoryview)):
+                    self._source_bytes -= len(old)
+
+    def flush(self):
+        """Waits for the originals queued so far to be written."""
+        with self._lock:
+            writer = self._writer
+        if writer is not None:
+            writer.submit(lambda: None).result()
+
+    def shutdown(self):
+        """Writes out queued originals and stops the writer thread."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+
+    def path(self, content_hash: str) -> Optional[str]:
+        """Path of the rendered PNG, or None when the original is no longer available."""
+        if not CONTENT_HASH_PATTERN.match(content_hash):
+            return None
+        target = storage.path("ela", content_hash, ".png")
+        if os.path.exists(target):
+            storage.touch(target)
+            return target
+
+        with self._lock:
+            render_lock = self._render_locks.setdefault(content_hash, threading.Lock())
+        # Concurrent first requests for the same image wait for one render
+        with render_lock:
+            try:
+                if os.path.exists(target):
+                    return target
+                png = self._render(content_hash)
+                if png is None:
+                    return None
+                return storage.write("ela", content_hash, ".png", png)
+            finally:
+                with self._lock:
+                    self._render_locks.pop(content_hash, None)
+
+    def _render(self, content_hash: str) -> Optional[bytes]:
+        from app.core.media import MediaContext
+        from app.layers.layer7_ela import ELAAnalyzer
+
+        with self._lock:
+            source = self._sources.get(content_hash)
+        if source is None:
+            # Evicted, or registered by another process: the stored original
+            stored = storage.find("originals", content_hash)
+            if stored is None:
+                return None
+            source = (stored, os.path.basename(stored))
+        media, filename = source
+        if isinstance(media, str):
+            if not os.path.exists(media):
+                return None
+            ctx = MediaContext(media)
+        else:
+            ctx = MediaContext.from_bytes(media, filename)
+        try:
+            return ELAAnalyzer().render(ctx)
+        finally:
+            ctx.close()
+
+    def _persist(self, content_hash: str, data: Union[bytes, memoryview], ext: str):
+        try:
+            target = storage.path("originals", content_hash, ext)
+            if os.path.exists(target):
+                storage.touch(target)
+            else:
+                storage.write("originals", content_hash, ext, bytes(data))
+        except OSError:
+            logger.exception("ELA source write failed")
+
+    def _writer_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ela-source-writer")
+            return self._writer
+
+
+ela_artifacts = ELAArtifacts()
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class DynamicBatcher:
+    """
+    Collects model inputs from concurrent callers and runs them as one batch.
+    - A batch is closed when it reaches max_batch_size rows or when the oldest
+      queued input has waited max_wait_ms; an input never straddles two
+      batches, so one that does not fit waits for the next (an input larger
+      than max_batch_size runs on its own)
+    - Per process: it only merges requests analysed in the same process
+    - Each caller gets a Future resolving to (its rows of the output, batch info)
+    - Keeps batch-size and queue-wait statistics for tuning
+    """
+
+    def __init__(self, forward: Callable[[Any], Any], max_batch_size: int = 16, max_wait_ms: float = 10.0):
+        self.forward = forward
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self._batches = 0
+        self._rows = 0
+        self._requests = 0
+        self._batch_sizes: Dict[int, int] = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, inputs) -> Future:
+        """inputs: tensor of shape (N, C, H, W); resolves to the N matching output rows."""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((inputs, future, time.monotonic()))
+        return future
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "requests": self._requests,
+                "rows": self._rows,
+                "mean_batch_size": self._rows / self._batches if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "mean_queue_wait_ms": 1000.0 * self._wait_total / self._requests if self._requests else 0.0,
+                "max_queue_wait_ms": 1000.0 * self._wait_max,
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": 1000.0 * self.max_wait,
+            }
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="model-batcher", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        carry = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            batch = [first]
+            rows = len(first[0])
+            deadline = first[2] + self.max_wait
+            while rows < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    # Past the deadline we still take whatever is already queued
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if rows + len(item[0]) > self.max_batch_size:
+                    # A multi-row input (e.g. video frames) that does not fit opens the next batch
+                    carry = item
+                    break
+                batch.append(item)
+                rows += len(item[0])
+            self._run(batch, rows)
+
+    def _run(self, batch: List[Tuple[Any, Future, float]], rows: int):
+        import torch
+
+        started = time.monotonic()
+        waits = [started - enqueued for _, _, enqueued in batch]
+        with self._lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._rows += rows
+            self._batch_sizes[rows] = self._batch_sizes.get(rows, 0) + 1
+            self._wait_total += sum(waits)
+            self._wait_max = max(self._wait_max, max(waits))
+
+        try:
+            outputs = self.forward(torch.cat([inputs for inputs, _, _ in batch], dim=0))
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for (inputs, future, _), wait in zip(batch, waits):
+            n = len(inputs)
+            info = {"batch_size": rows, "queue_wait_ms": round(1000.0 * wait, 3)}
+            future.set_result((outputs[offset:offset + n], info))
+            offset += n
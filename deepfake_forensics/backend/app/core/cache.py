@@ -0,0 +1,183 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def _to_builtin(value):
+    # numpy scalars (np.float64, np.bool_, ...) expose .item()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def cacheable(result: Dict[str, Any]) -> bool:
+    """
+    Only final results are cached: not errors, and not runs where a layer
+    timed out (a later run may score it). Layers the cascade skipped could
+    not have changed the verdict, so its early exits are cached.
+    """
+    return "error" not in result and not result.get("details", {}).get("timed_out_layers")
+
+
+def settings_digest(ext: str) -> str:
+    """
+    Short digest of what, besides the bytes and the pipeline version, decides
+    a result: the upload's type (by extension), the enabled layers, the
+    execution mode and the Layer 4 model.
+    """
+    parts = [
+        ext.lower(),
+        ",".join(sorted(settings.ENABLED_LAYERS)),
+        settings.LAYER_EXECUTION_MODE,
+        settings.MODEL_WEIGHTS_PATH,
+        str(settings.MODEL_ALLOW_UNTRAINED),
+    ]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    Content-addressed cache of analysis results.
+    - Keyed by (SHA-256 of the upload, pipeline version + settings_digest())
+    - In-memory LRU tier on top of a persistent tier in the SQLite database
+    - Concurrent requests for the same bytes share one in-flight computation
+    - Finished results are stored by a background writer thread, never on the
+      thread that completes the analysis
+    """
+
+    def __init__(self, max_items: int = None, persistent: bool = None):
+        self.max_items = settings.RESULT_CACHE_MEMORY_ITEMS if max_items is None else max_items
+        self.persistent = settings.RESULT_CACHE_PERSISTENT if persistent is None else persistent
+        self._memory: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self._writer: Optional[ThreadPoolExecutor] = None
+
+    @staticmethod
+    def key(content_hash: str, ext: str = "") -> Tuple[str, str]:
+        """ext: the upload's extension, which decides how the bytes are analysed."""
+        return content_hash, f"{settings.PIPELINE_VERSION}:{settings_digest(ext)}"
+
+    def get(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        if not self.persistent:
+            return None
+
+        result = self._load(key)
+        if result is not None:
+            self._remember(key, result)
+        return result
+
+    def put(self, key: Tuple[str, str], result: Dict[str, Any]):
+        result = json.loads(json.dumps(result, default=_to_builtin))
+        self._remember(key, result)
+        if self.persistent:
+            self._store(key, result)
+
+    def get_or_submit(self, key: Tuple[str, str], submit: Callable[[], Future]) -> Tuple[Future, bool]:
+        """
+        Returns (future, shared). When an identical upload is already being
+        analysed its future is returned with shared=True instead of starting
+        another run. Complete results are written to the cache in the
+        background; the run stays shareable until they are.
+        """
+        with self._lock:
+            if key in self._inflight:
+                return self._inflight[key], True
+            future = submit()
+            self._inflight[key] = future
+
+        def finish(done: Future):
+            try:
+                if done.exception() is None and cacheable(done.result()):
+                    self.put(key, done.result())
+            except Exception:
+                logger.exception("Result cache error")
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+        def on_done(done: Future):
+            # Runs on the thread that completed the analysis: no SQLite here
+            try:
+                self._writer_pool().submit(finish, done)
+            except RuntimeError:
+                # Interpreter shutting down; the result is simply not cached
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+        future.add_done_callback(on_done)
+        return future, False
+
+    def flush(self):
+        """Waits for the results queued so far to be written."""
+        with self._lock:
+            writer = self._writer
+        if writer is not None:
+            writer.submit(lambda: None).result()
+
+    def shutdown(self):
+        """Writes out queued results and stops the writer thread."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+
+    def _writer_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._writer is None:
+                # One thread: writes are serialized and never contend with each other
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-cache-writer")
+            return self._writer
+
+    def _remember(self, key, result):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def _load(self, key) -> Optional[Dict[str, Any]]:
+        from app.models import CachedResult
+
+        db = SessionLocal()
+        try:
+            row = db.query(CachedResult).filter(
+                CachedResult.content_hash == key[0],
+                CachedResult.pipeline_version == key[1]
+            ).first()
+            return row.result if row is not None else None
+        finally:
+            db.close()
+
+    def _store(self, key, result):
+        from app.models import CachedResult
+
+        db = SessionLocal()
+        try:
+            exists = db.query(CachedResult.id).filter(
+                CachedResult.content_hash == key[0],
+                CachedResult.pipeline_version == key[1]
+            ).first()
+            if exists is None:
+                db.add(CachedResult(content_hash=key[0], pipeline_version=key[1], result=result))
+                db.commit()
+        finally:
+            db.close()
+
+
+result_cache = ResultCache()
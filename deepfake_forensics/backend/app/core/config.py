@@ -5,4 +5,149 @@ class Settings:
     API_V1_STR: str = "/api/v1"
     ALLOWED_ORIGINS: list = ["*"]
 
+    # Uploads and served artifacts (ELA images)
+    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
+    # Image uploads up to this size are received into memory and analysed from
+    # there, never written to disk; videos and larger images stream into storage
+    IN_MEMORY_UPLOAD_MAX_BYTES: int = int(os.getenv("IN_MEMORY_UPLOAD_MAX_BYTES", str(64 * 1024 * 1024)))
+
+    # Layer execution: "sequential" runs layers 1-7 one after another,
+    # "concurrent" runs them at the same time on a bounded thread pool,
+    # "cascade" runs them cheapest first and stops as soon as the verdict
+    # can no longer change (or a C2PA manifest verifies)
+    LAYER_EXECUTION_MODE: str = os.getenv("LAYER_EXECUTION_MODE", "sequential")
+    # Smoothing of the per-layer run time estimates that order the cascade
+    CASCADE_COST_ALPHA: float = float(os.getenv("CASCADE_COST_ALPHA", "0.2"))
+    LAYER_MAX_WORKERS: int = int(os.getenv("LAYER_MAX_WORKERS", "4"))
+    # Per-layer timeout (seconds), overridable per layer by score key,
+    # e.g. {"biology_rppg": 45.0}
+    LAYER_TIMEOUT_SECONDS: float = float(os.getenv("LAYER_TIMEOUT_SECONDS", "30"))
+    LAYER_TIMEOUTS: dict = {}
+    # Overall deadline for all layers of one request (seconds)
+    REQUEST_DEADLINE_SECONDS: float = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+    # Layers to run, by score key (comma-separated). A disabled layer is never
+    # imported, so neither are its dependencies (e.g. torch for "ai_model").
+    ENABLED_LAYERS: set = set(filter(None, os.getenv(
+        "ENABLED_LAYERS",
+        "metadata,biology_rppg,math_forensics,ai_model,physics,early_signature,ela"
+    ).replace(" ", "").split(",")))
+
+    # Process pool running the analyses behind /analyze and /jobs
+    ANALYSIS_POOL_WORKERS: int = int(os.getenv("ANALYSIS_POOL_WORKERS", "2"))
+    # Number of job records kept in memory for GET /jobs/{id}
+    JOB_RETENTION: int = int(os.getenv("JOB_RETENTION", "1000"))
+
+    # "process" isolates analyses in worker processes; "thread" runs them in
+    # this process, so concurrent requests can share the Layer 4 batcher
+    ANALYSIS_EXECUTOR: str = os.getenv("ANALYSIS_EXECUTOR", "process")
+
+    # Layer 4 network: local checkpoint (HybridForensicsModel or torchvision ResNet-50
+    # state dict). Nothing is downloaded unless MODEL_ALLOW_DOWNLOAD is set.
+    MODEL_WEIGHTS_PATH: str = os.getenv("MODEL_WEIGHTS_PATH", "")
+    MODEL_ALLOW_DOWNLOAD: bool = os.getenv("MODEL_ALLOW_DOWNLOAD", "false").lower() == "true"
+    # The network only scores uploads once a trained checkpoint (backbone and
+    # fusion head) has loaded; until then Layer 4 uses its blur/entropy
+    # heuristics. MODEL_ALLOW_UNTRAINED scores with a seeded, untrained
+    # network anyway (benchmarks only: its scores mean nothing).
+    MODEL_ALLOW_UNTRAINED: bool = os.getenv("MODEL_ALLOW_UNTRAINED", "false").lower() == "true"
+    # Load the model and run one dummy inference in every worker at startup
+    MODEL_WARMUP: bool = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+    # CPU inference: intra-op threads per worker (0 = torch default), NHWC
+    # memory layout, and int8 quantization: "none", "head" (dynamic int8
+    # fusion head) or "full" (head + static int8 backbone calibrated on the
+    # images in MODEL_CALIBRATION_DIR, or on synthetic images when unset)
+    MODEL_INFERENCE_THREADS: int = int(os.getenv("MODEL_INFERENCE_THREADS", "0"))
+    MODEL_CHANNELS_LAST: bool = os.getenv("MODEL_CHANNELS_LAST", "true").lower() == "true"
+    MODEL_QUANTIZATION: str = os.getenv("MODEL_QUANTIZATION", "none")
+    MODEL_CALIBRATION_DIR: str = os.getenv("MODEL_CALIBRATION_DIR", "")
+
+    # Cross-request dynamic micro-batching for the Layer 4 model. The batcher
+    # lives in the process running the analysis, so it only merges requests
+    # with ANALYSIS_EXECUTOR="thread"; with "process" each worker batches
+    # nothing but its own request's frames.
+    MODEL_BATCHING_ENABLED: bool = os.getenv("MODEL_BATCHING_ENABLED", "false").lower() == "true"
+    MODEL_BATCH_MAX_SIZE: int = int(os.getenv("MODEL_BATCH_MAX_SIZE", "16"))
+    MODEL_BATCH_MAX_WAIT_MS: float = float(os.getenv("MODEL_BATCH_MAX_WAIT_MS", "10"))
+
+    # SQLite database (analysis history, persistent result cache)
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./forensics.db")
+    # How long a connection waits for SQLite's write lock before failing (ms)
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    # Analysis history is written behind the request: rows are queued and
+    # inserted in one transaction per batch or per interval, whichever comes first
+    ANALYSIS_LOG_BATCH_SIZE: int = int(os.getenv("ANALYSIS_LOG_BATCH_SIZE", "200"))
+    ANALYSIS_LOG_FLUSH_SECONDS: float = float(os.getenv("ANALYSIS_LOG_FLUSH_SECONDS", "1.0"))
+    # Rows queued beyond this are dropped (and counted) rather than slowing requests
+    ANALYSIS_LOG_MAX_QUEUE: int = int(os.getenv("ANALYSIS_LOG_MAX_QUEUE", "10000"))
+    # GET /export: rows fetched from the database per round trip, and
+    # approximate size of each chunk streamed to the client
+    EXPORT_FETCH_SIZE: int = int(os.getenv("EXPORT_FETCH_SIZE", "1000"))
+    EXPORT_CHUNK_BYTES: int = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+
+    # Per-request profiling (?profile=true or an "X-Profile: 1" header): the
+    # response gets a per-layer / per-stage timing tree and a link to the
+    # full cProfile dump. Requests asking for it are refused unless enabled.
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+
+    # Bump whenever a change to the layers alters results; cached verdicts are keyed on it
+    PIPELINE_VERSION: str = os.getenv("PIPELINE_VERSION", "2")
+    # Content-addressed result cache: in-memory LRU size and SQLite-backed tier
+    RESULT_CACHE_ENABLED: bool = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_MEMORY_ITEMS: int = int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", "1024"))
+    RESULT_CACHE_PERSISTENT: bool = os.getenv("RESULT_CACHE_PERSISTENT", "true").lower() == "true"
+
+    # Video frame sampling for Layer 2: "first", "uniform" or "keyframes"
+    VIDEO_SAMPLING_STRATEGY: str = os.getenv("VIDEO_SAMPLING_STRATEGY", "first")
+    # Frame budget for Layer 2; 0 analyses the whole clip
+    VIDEO_MAX_FRAMES: int = int(os.getenv("VIDEO_MAX_FRAMES", "300"))
+    # Frames decoded for a video layer that has not read them yet; a reading
+    # layer this far behind holds the shared decoding pass back
+    VIDEO_FRAME_BUFFER: int = int(os.getenv("VIDEO_FRAME_BUFFER", "64"))
+    # Layer 4 on video: frames sampled uniformly over the clip and scored as
+    # one batch; the per-frame scores are combined by "mean", "max" or
+    # "topk" (mean of the VIDEO_MODEL_TOP_K highest)
+    VIDEO_MODEL_FRAMES: int = int(os.getenv("VIDEO_MODEL_FRAMES", "8"))
+    VIDEO_MODEL_AGGREGATION: str = os.getenv("VIDEO_MODEL_AGGREGATION", "topk")
+    VIDEO_MODEL_TOP_K: int = int(os.getenv("VIDEO_MODEL_TOP_K", "3"))
+    # Layer 2 face ROI: "detect" runs Haar on every full-resolution frame,
+    # "track" detects on a downscaled frame every FACE_DETECT_INTERVAL frames
+    # (or on tracking loss) and follows the face in between
+    FACE_ROI_MODE: str = os.getenv("FACE_ROI_MODE", "detect")
+    FACE_DETECT_INTERVAL: int = int(os.getenv("FACE_DETECT_INTERVAL", "10"))
+    FACE_DETECT_MAX_SIDE: int = int(os.getenv("FACE_DETECT_MAX_SIDE", "320"))
+    # Streaming rPPG: sliding spectral window, hop between windows, and the
+    # minimum share of band power the pulse peak must hold
+    RPPG_WINDOW_SECONDS: float = float(os.getenv("RPPG_WINDOW_SECONDS", "10"))
+    RPPG_HOP_SECONDS: float = float(os.getenv("RPPG_HOP_SECONDS", "1"))
+    RPPG_MIN_PULSE_SNR: float = float(os.getenv("RPPG_MIN_PULSE_SNR", "0.2"))
+
+    # Threads used by the shared spectral engine (scipy.fft workers; -1 = all cores)
+    FFT_WORKERS: int = int(os.getenv("FFT_WORKERS", "-1"))
+
+    # Large images: whole-image transforms above this working-set budget run
+    # tile by tile (or on a downscaled pyramid level) to bound peak memory
+    IMAGE_MEMORY_BUDGET_MB: float = float(os.getenv("IMAGE_MEMORY_BUDGET_MB", "512"))
+    # Overlap in pixels between neighbouring spectral analysis windows
+    TILE_OVERLAP: int = int(os.getenv("TILE_OVERLAP", "64"))
+
+    # Upload / artifact retention under UPLOAD_DIR (0 disables a limit)
+    STORAGE_KEEP_ORIGINALS: bool = os.getenv("STORAGE_KEEP_ORIGINALS", "true").lower() == "true"
+    STORAGE_TTL_HOURS: float = float(os.getenv("STORAGE_TTL_HOURS", "168"))
+    STORAGE_QUOTA_MB: float = float(os.getenv("STORAGE_QUOTA_MB", "10240"))
+    STORAGE_SWEEP_INTERVAL_SECONDS: float = float(os.getenv("STORAGE_SWEEP_INTERVAL_SECONDS", "600"))
+    # Storage kinds served publicly under /uploads ("ela", "originals",
+    # "profiles"); profiles are also served while PROFILING_ENABLED is on
+    STORAGE_PUBLIC_KINDS: set = set(filter(None, os.getenv("STORAGE_PUBLIC_KINDS", "ela").replace(" ", "").split(",")))
+
+    # Originals kept in memory so ELA images can be rendered when first requested
+    ELA_SOURCE_CACHE_MB: float = float(os.getenv("ELA_SOURCE_CACHE_MB", "256"))
+    # Also write in-memory originals to storage ("originals") so their ELA
+    # image can be rendered after eviction, a restart, or on another worker
+    ELA_PERSIST_SOURCES: bool = os.getenv("ELA_PERSIST_SOURCES", "false").lower() == "true"
+
+    # Read JPEG DCT coefficients directly (jpeglib), in-memory uploads through
+    # an anonymous memory file; when off or failing, the decoded pixels are
+    # transformed and requantized instead
+    JPEG_COMPRESSED_DOMAIN: bool = os.getenv("JPEG_COMPRESSED_DOMAIN", "true").lower() == "true"
+
 settings = Settings()
@@ -0,0 +1,310 @@
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.core.metrics import Gauge, metrics
+
+logger = logging.getLogger(__name__)
+
+# Worker-process state, set up once per process by _init_worker
+_worker_orchestrator = None
+_worker_progress = None
+# Warmup status per worker PID, shared with the API process
+_worker_status = None
+# True in pool processes: their metrics are shipped back with every result
+_worker_isolated = False
+
+
+def _init_worker(progress, workers, warm: bool = False, isolated: bool = False):
+    global _worker_orchestrator, _worker_progress, _worker_status, _worker_isolated
+    from app.core.orchestrator import ForensicsOrchestrator
+    _worker_orchestrator = ForensicsOrchestrator()
+    _worker_orchestrator.track_peak_memory = isolated
+    _worker_progress = progress
+    _worker_status = workers
+    _worker_isolated = isolated
+    if warm:
+        # Every process warms its own model before taking any job
+        _ensure_warm()
+
+
+def _ensure_warm() -> int:
+    """
+    Warms this worker's model unless it already is, and records the outcome
+    under its PID for /readyz. A failure must not break the pool. Returns the PID.
+    """
+    pid = os.getpid()
+    if _worker_status.get(pid, {}).get("status") == "ready":
+        return pid
+    _worker_status[pid] = {"status": "warming"}
+    try:
+        _worker_status[pid] = {"status": "ready", "model": _warm_model()}
+    except Exception as e:
+        logger.exception("Model warmup failed")
+        _worker_status[pid] = {"status": "failed", "error": str(e)}
+    return pid
+
+
+def _warm_model() -> Dict[str, Any]:
+    """Loads and warms this worker's Layer 4 model; returns its status."""
+    if "ai_model" not in settings.ENABLED_LAYERS:
+        # Nothing to warm, and torch must not be imported
+        return {"loaded": False, "warmed": False, "disabled": True}
+    return _worker_orchestrator.layer4.warmup()
+
+
+def _run_analysis(progress_key: str, media: Union[str, bytes], filename: Optional[str],
+                  media_id: Optional[str] = None,
+                  profile: bool = False) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, dict]],
+                                                  Optional[BaseException]]:
+    """
+    Runs inside a pool worker; reports per-layer progress back to the API
+    process. Returns (result, metrics delta, error): the delta holds what a
+    pool process recorded since its previous job, and is shipped back even
+    when the analysis raised, so a failed job's error counts are not lost.
+    """
+    layers: Dict[str, str] = {}
+    # Set once the analysis returns: a layer abandoned on timeout that finishes
+    # later must not write the key back after the API process removed it
+    finished = False
+    progress_lock = threading.Lock()
+
+    def on_progress(layer: str, status: str):
+        with progress_lock:
+            if finished:
+                return
+            layers[layer] = status
+            _worker_progress[progress_key] = dict(layers)
+
+    result, error = None, None
+    try:
+        result = _worker_orchestrator.analyze_media(media, filename=filename, progress=on_progress,
+                                                    media_id=media_id, profile=profile)
+    except Exception as e:
+        error = e
+    finally:
+        with progress_lock:
+            finished = True
+    delta = metrics.drain() if _worker_isolated else None
+    return result, delta, error
+
+
+class _JobFuture(Future):
+    """
+    The caller-facing future of a pool job: resolves to the analysis result
+    once the metrics shipped with it have been merged into this process.
+    """
+
+    def __init__(self, inner: Future):
+        super().__init__()
+        self._inner = inner
+        # Final per-layer progress, moved here from the shared dict once the job ends
+        self.progress: Optional[Dict[str, str]] = None
+
+    def running(self) -> bool:
+        return self._inner.running()
+
+    def cancel(self) -> bool:
+        return self._inner.cancel() and super().cancel()
+
+
+class JobManager:
+    """
+    Runs analyses on a worker pool so CPU-bound work never blocks the event loop.
+    - start() + track(): a job polled through get(); several requests may
+      track one running analysis
+    The pool is a process pool by default; ANALYSIS_EXECUTOR="thread" runs
+    jobs on threads sharing one in-process orchestrator instead.
+    """
+
+    def __init__(self, max_workers: int = None, max_jobs: int = None):
+        self.max_workers = max_workers or settings.ANALYSIS_POOL_WORKERS
+        self.max_jobs = max_jobs or settings.JOB_RETENTION
+        self._pool: Optional[Executor] = None
+        self._manager = None
+        self._progress = None
+        self._workers = None
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._warmups: Optional[List[Future]] = None
+        self._in_flight = 0
+
+    @property
+    def pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None and settings.ANALYSIS_EXECUTOR == "thread":
+                self._progress = {}
+                self._workers = {}
+                _init_worker(self._progress, self._workers)
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="forensics-job"
+                )
+            elif self._pool is None:
+                if settings.MODEL_BATCHING_ENABLED:
+                    logger.warning("MODEL_BATCHING_ENABLED has no effect across requests with "
+                                   "ANALYSIS_EXECUTOR=%r: each worker process batches on its own; "
+                                   "use ANALYSIS_EXECUTOR='thread' to share one batcher",
+                                   settings.ANALYSIS_EXECUTOR)
+                # Spawn rather than fork: the API process runs threads and may hold torch state
+                mp_context = multiprocessing.get_context("spawn")
+                self._manager = mp_context.Manager()
+                self._progress = self._manager.dict()
+                self._workers = self._manager.dict()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=mp_context,
+                    initializer=_init_worker,
+                    initargs=(self._progress, self._workers, settings.MODEL_WARMUP, True)
+                )
+            return self._pool
+
+    def start(self, media: Union[str, bytes], filename: Optional[str] = None,
+              media_id: Optional[str] = None, profile: bool = False) -> Future:
+        """
+        Starts an analysis of a path or of in-memory upload bytes (named by
+        filename) that reports progress; attach it to jobs with track().
+        media_id is the upload's content hash, used to name its artifacts.
+        profile=True profiles the analysis (see ForensicsOrchestrator.analyze_media).
+        """
+        progress_key = str(uuid.uuid4())
+        inner = self.pool.submit(_run_analysis, progress_key, media, filename, media_id, profile)
+        future = _JobFuture(inner)
+        future.progress_key = progress_key
+        with self._lock:
+            self._in_flight += 1
+
+        def relay(done: Future):
+            with self._lock:
+                self._in_flight -= 1
+                if self._progress is not None:
+                    # Kept with the future, so a job tracked after it ended still reports it
+                    future.progress = dict(self._progress.pop(progress_key, {}))
+            if done.cancelled():
+                Future.cancel(future)
+            elif done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                result, delta, error = done.result()
+                metrics.merge(delta)
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+        inner.add_done_callback(relay)
+        return future
+
+    def track(self, future: Future, on_complete: Optional[Callable[[Future], None]] = None) -> str:
+        """Registers a future as a pollable job; several jobs may share one future."""
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._jobs[job_id] = {"future": future, "progress_key": getattr(future, "progress_key", None)}
+            self._evict()
+        if on_complete:
+            future.add_done_callback(on_complete)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            future: Future = job["future"]
+            progress = getattr(future, "progress", None)
+            if progress is None and self._progress is not None and job["progress_key"]:
+                progress = self._progress.get(job["progress_key"], {})
+
+        status = {"job_id": job_id, "status": "queued", "progress": dict(progress or {}), "result": None, "error": None}
+
+        if future.done():
+            error = future.exception()
+            if error is not None:
+                status["status"] = "failed"
+                status["error"] = str(error)
+            else:
+                status["status"] = "done"
+                status["result"] = future.result()
+        elif future.running() or status["progress"]:
+            status["status"] = "running"
+        return status
+
+    def warmup(self):
+        """
+        Starts the workers and warms their models in the background. With the
+        process pool, one task per worker makes the pool spawn all of them;
+        each process warms itself in its initializer and records its status
+        by PID, whichever of the tasks it ends up running.
+        """
+        pool = self.pool
+        with self._lock:
+            if self._warmups is not None:
+                return
+            count = 1 if settings.ANALYSIS_EXECUTOR == "thread" else self.max_workers
+            self._warmups = [pool.submit(_ensure_warm) for _ in range(count)]
+
+    def readiness(self) -> Dict[str, Any]:
+        """
+        Ready once every worker reported a warm model (immediately when
+        warmup is disabled).
+        """
+        with self._lock:
+            warmups, workers = self._warmups, self._workers
+        if warmups is None:
+            return {"ready": not settings.MODEL_WARMUP, "workers": []}
+
+        statuses = [{"pid": pid, **status} for pid, status in sorted(dict(workers).items())]
+        expected = 1 if settings.ANALYSIS_EXECUTOR == "thread" else self.max_workers
+        for future in warmups:
+            # A worker that never came up (e.g. a broken pool) has no PID to report under
+            if future.done() and future.exception() is not None:
+                statuses.append({"status": "failed", "error": str(future.exception())})
+        statuses += [{"status": "starting"}] * (expected - len(statuses))
+        return {"ready": all(status["status"] == "ready" for status in statuses), "workers": statuses}
+
+    def in_flight(self) -> int:
+        """Analyses submitted to the pool and not finished yet (queued or running)."""
+        with self._lock:
+            return self._in_flight
+
+    def batcher_stats(self) -> Optional[Dict[str, Any]]:
+        """Layer 4 batcher statistics; only visible here when jobs run in this process."""
+        # vars(): only look at a Layer 4 that exists, never create one here
+        if _worker_orchestrator is None or "layer4" not in vars(_worker_orchestrator):
+            return None
+        if _worker_orchestrator.layer4.batcher is None:
+            return None
+        return _worker_orchestrator.layer4.batcher.stats()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            manager, self._manager = self._manager, None
+            self._warmups = None
+            self._workers = None
+        # Outside the lock: cancelling queued jobs runs their relay callbacks
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+    def _evict(self):
+        # Forget the oldest finished jobs once we hold more than max_jobs
+        while len(self._jobs) > self.max_jobs:
+            oldest = next(iter(self._jobs.values()))
+            if not oldest["future"].done():
+                break
+            self._jobs.popitem(last=False)
+
+
+job_manager = JobManager()
+metrics.register(Gauge("forensics_jobs_in_flight", "Analyses queued or running on the worker pool.",
+                       job_manager.in_flight))
+metrics.register(Gauge("forensics_model_batch_queue_depth", "Inputs waiting for the Layer 4 batcher (thread executor only).",
+                       lambda: (job_manager.batcher_stats() or {}).get("queue_depth")))
@@ -0,0 +1,177 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import STAGE_DURATION, Gauge, metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _FlushRequest:
+    """Queued by flush(); answered once the rows ahead of it are written (ok) or a write failed."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+
+    def finish(self, ok: bool):
+        self.ok = ok
+        self.done.set()
+
+
+class AnalysisLogWriter:
+    """
+    Write-behind writer for the analysis history (AnalysisLog rows).
+    - submit() only enqueues; requests never wait on SQLite's write lock
+    - A background thread inserts queued rows in one transaction per batch,
+      at most every flush_seconds or batch_size rows
+    - A failed batch (e.g. database locked) is kept and retried
+    - flush() waits until the rows queued so far are written; readers of
+      the history call it so a just-finished analysis is already listed.
+      It returns at once when nothing is queued, and with False while writes
+      are failing, so readers never wait out the timeout on a locked database
+    - stop() flushes everything still queued; call it on shutdown
+    """
+
+    def __init__(self, batch_size: int = None, flush_seconds: float = None, max_queue: int = None):
+        self.batch_size = max(1, batch_size or settings.ANALYSIS_LOG_BATCH_SIZE)
+        self.flush_seconds = settings.ANALYSIS_LOG_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue or settings.ANALYSIS_LOG_MAX_QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self._written = 0
+        self._batches = 0
+        self._dropped = 0
+        self._failures = 0
+        # Rows queued or being written, and whether the last write failed
+        self._unwritten = 0
+        self._failing = False
+
+    def submit(self, row: Dict[str, Any]):
+        """Queues one AnalysisLog row (column -> value); never blocks."""
+        row.setdefault("timestamp", datetime.now(timezone.utc).replace(tzinfo=None))
+        self._ensure_started()
+        with self._lock:
+            self._unwritten += 1
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self._unwritten -= 1
+                self._dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Writes out the rows queued before this call without waiting for the
+        next batch interval. Returns False if they were not written within
+        timeout or the last write failed (e.g. the database is locked).
+        """
+        with self._lock:
+            if self._thread is None or self._unwritten == 0:
+                return True
+            if self._failing:
+                return False # The retry is pending; the caller reads what is already written
+        request = _FlushRequest()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        return request.done.wait(timeout) and request.ok
+
+    def stop(self, timeout: float = 10.0):
+        """Writes out every queued row and stops the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "written": self._written,
+                "batches": self._batches,
+                "dropped": self._dropped,
+                "failed_commits": self._failures,
+                "queue_depth": self._queue.qsize(),
+            }
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="analysis-log-writer", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        pending: List[Dict[str, Any]] = []
+        stopping = False
+        while not stopping:
+            deadline = time.monotonic() + self.flush_seconds
+            # flush() calls waiting on this batch
+            flushes: List[_FlushRequest] = []
+            while len(pending) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                if isinstance(item, _FlushRequest):
+                    flushes.append(item)
+                    break
+                pending.append(item)
+
+            if not pending:
+                for request in flushes:
+                    request.finish(True)
+                continue
+            written = self._write(pending)
+            # Never leave a reader waiting on a failed batch: it gets False now
+            for request in flushes:
+                request.finish(written)
+            if written:
+                pending = []
+            elif stopping:
+                logger.error("Analysis log: %d rows lost on shutdown", len(pending))
+            else:
+                # Keep the batch (new rows wait in the bounded queue) and back off
+                time.sleep(self.flush_seconds)
+
+    def _write(self, rows: List[Dict[str, Any]]) -> bool:
+        from app.models import AnalysisLog
+
+        db = SessionLocal()
+        try:
+            with STAGE_DURATION.time(stage="db_commit"):
+                db.bulk_insert_mappings(AnalysisLog, rows)
+                db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._failures += 1
+                self._failing = True
+            logger.exception("Analysis log write error")
+            return False
+        finally:
+            db.close()
+        with self._lock:
+            self._written += len(rows)
+            self._batches += 1
+            self._unwritten -= len(rows)
+            self._failing = False
+        return True
+
+
+analysis_log = AnalysisLogWriter()
+metrics.register(Gauge("forensics_analysis_log_queue_depth", "History rows waiting to be written.",
+                       lambda: analysis_log.stats()["queue_depth"]))
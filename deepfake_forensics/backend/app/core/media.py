@@ -0,0 +1,245 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import numpy as np
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Dict, Iterator, Optional, Union
+from app.core.metrics import STAGE_DURATION
+from app.core.profiling import span
+from app.core.spectral import Spectrum
+from app.core.video import FrameSource
+
+if TYPE_CHECKING:
+    from PIL import Image # Imported on first use of pil_rgb
+
+# OpenCV is imported by the methods that decode or convert pixels, so
+# importing the orchestrator (and this module) stays cheap
+
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv']
+
+
+class MediaContext:
+    """
+    Per-request view of one piece of media.
+    - Decodes the upload at most once
+    - Lazily derives and memoizes the views layers ask for
+      (gray, HSV V-channel, RGB PIL image, downscaled copies)
+    - Safe to share between layers running on different threads
+    - Backed by a file path or by the upload bytes held in memory
+    - close() waits for every holder (see retain()) before releasing the
+      decoder and spill files, so a layer abandoned on timeout can finish safely
+    """
+
+    def __init__(self, file_path: Optional[str] = None, image: Optional[np.ndarray] = None,
+                 data: Optional[Union[bytes, memoryview]] = None, name: Optional[str] = None):
+        self.file_path = file_path
+        self.data = data
+        # Name used for artifacts derived from this media (e.g. the ELA image)
+        self.name = name or (os.path.basename(file_path) if file_path else None)
+        self.ext = os.path.splitext(self.name)[1].lower() if self.name else ""
+        self.is_video = self.ext in VIDEO_EXTENSIONS
+        self._cache: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._spilled_path: Optional[str] = None
+        self._holders = 0
+        self._close_requested = False
+        if image is not None:
+            self._cache["bgr"] = image
+
+    @classmethod
+    def from_array(cls, image: np.ndarray) -> "MediaContext":
+        """Wraps an already decoded BGR frame (e.g. a video frame)."""
+        return cls(image=image)
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, memoryview], name: str) -> "MediaContext":
+        """Wraps upload bytes; name (e.g. "<uuid>.jpg") supplies the type and artifact name."""
+        return cls(data=data, name=name)
+
+    @classmethod
+    def of(cls, media: Union["MediaContext", str]) -> "MediaContext":
+        """Lets layers keep accepting a plain path as well as a shared context."""
+        if isinstance(media, MediaContext):
+            return media
+        return cls(media)
+
+    def open_stream(self) -> BinaryIO:
+        """Binary file-like object over the encoded media."""
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        return open(self.file_path, "rb")
+
+    def local_path(self) -> Optional[str]:
+        """
+        A filesystem path for libraries that only read files (VideoCapture, c2pa).
+        In-memory media is spilled to a temporary file on first use; close() removes it.
+        """
+        if self.file_path or self.data is None:
+            return self.file_path
+
+        def spill():
+            fd, path = tempfile.mkstemp(suffix=self.ext)
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.data)
+            self._spilled_path = path
+            return path
+        return self._memo("local_path", spill)
+
+    def retain(self):
+        """Marks a user (e.g. a layer thread) that must finish before close() takes effect."""
+        with self._lock:
+            self._holders += 1
+
+    def release(self):
+        """Ends a retain(); performs a close() requested while the context was held."""
+        with self._lock:
+            self._holders -= 1
+            deferred = self._holders == 0 and self._close_requested
+        if deferred:
+            self._close_now()
+
+    @contextlib.contextmanager
+    def scoped_path(self) -> Iterator[Optional[str]]:
+        """
+        A path valid for the duration of the block, for one read by a library
+        that only opens files (e.g. jpeglib). In-memory media is exposed as an
+        anonymous in-memory file (memfd) where the OS has them, else as a
+        temporary file; unlike local_path(), nothing outlives the block.
+        """
+        if self.file_path or self.data is None or "local_path" in self._cache:
+            yield self.local_path()
+            return
+        if hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd"):
+            fd = os.memfd_create("upload")
+            try:
+                with open(fd, "wb", closefd=False) as f:
+                    f.write(self.data)
+                yield f"/proc/self/fd/{fd}"
+            finally:
+                os.close(fd)
+            return
+        fd, path = tempfile.mkstemp(suffix=self.ext)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.data)
+            yield path
+        finally:
+            os.remove(path)
+
+    def close(self):
+        with self._lock:
+            self._close_requested = True
+            if self._holders:
+                return # The last release() closes
+        self._close_now()
+
+    def _close_now(self):
+        if "video" in self._cache:
+            self._cache.pop("video").release()
+        if self._spilled_path and os.path.exists(self._spilled_path):
+            os.remove(self._spilled_path)
+        self._spilled_path = None
+        self._cache.pop("local_path", None)
+
+    def _memo(self, key: str, factory: Callable[[], Any]) -> Any:
+        if key in self._cache:
+            return self._cache[key]
+        # One lock per view, so concurrent layers wait for a single decode
+        # while unrelated views can still be built in parallel
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._cache:
+                self._cache[key] = factory()
+        return self._cache[key]
+
+    @property
+    def bgr(self) -> Optional[np.ndarray]:
+        """Full-resolution BGR pixels, or None for videos / undecodable files."""
+        return self._memo("bgr", self._decode)
+
+    @property
+    def gray(self) -> Optional[np.ndarray]:
+        def build():
+            import cv2
+            return self._convert(cv2.COLOR_BGR2GRAY)
+        return self._memo("gray", build)
+
+    @property
+    def hsv_v(self) -> Optional[np.ndarray]:
+        # The HSV value channel is max(B, G, R); no need to build the full HSV image
+        def build():
+            img = self.bgr
+            if img is None:
+                return None
+            with span("color_conversion"):
+                return np.max(img, axis=2)
+        return self._memo("hsv_v", build)
+
+    @property
+    def pil_rgb(self) -> Optional["Image.Image"]:
+        def build():
+            import cv2
+            from PIL import Image
+            img = self.bgr
+            if img is None:
+                return None
+            with span("color_conversion"):
+                return Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        return self._memo("pil_rgb", build)
+
+    def spectrum(self) -> Optional[Spectrum]:
+        """Frequency-domain view of the full-resolution gray image, computed once."""
+        def build():
+            gray = self.gray
+            return Spectrum(gray) if gray is not None else None
+        return self._memo("spectrum", build)
+
+    @property
+    def video(self) -> FrameSource:
+        """The request's single streaming decoder, shared by every video consumer."""
+        return self._memo("video", lambda: FrameSource(self.local_path()))
+
+    @property
+    def first_frame(self) -> Optional[np.ndarray]:
+        """First decoded frame of a video."""
+        return self.video.first_frame
+
+    def downscaled(self, max_side: int, gray: bool = False) -> Optional[np.ndarray]:
+        """
+        Copy whose longest side is at most max_side (aspect ratio preserved).
+        Returns the original array when it is already small enough.
+        """
+        def build():
+            import cv2
+            img = self.gray if gray else self.bgr
+            if img is None:
+                return None
+            h, w = img.shape[:2]
+            scale = max_side / float(max(h, w))
+            if scale >= 1.0:
+                return img
+            size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+            return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        return self._memo(f"downscaled:{max_side}:{int(gray)}", build)
+
+    def _decode(self) -> Optional[np.ndarray]:
+        if self.is_video:
+            return None
+        import cv2
+        with STAGE_DURATION.time(stage="decode"), span("decode"):
+            if self.data is not None:
+                return cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if not self.file_path:
+                return None
+            return cv2.imread(self.file_path)
+
+    def _convert(self, code: int) -> Optional[np.ndarray]:
+        img = self.bgr
+        if img is None:
+            return None
+        import cv2
+        with span("color_conversion"):
+            return cv2.cvtColor(img, code)
@@ -0,0 +1,217 @@
+import math
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MEMORY_BUCKETS = tuple(float(2 ** p) * 1024 * 1024 for p in range(6, 14)) # 64 MB ... 8 GB
+
+LabelValues = Tuple[str, ...]
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self.kind = "counter"
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def drain(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: Dict[LabelValues, float]):
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, LabelValues, Tuple, float]]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, key, (), value
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self.kind = "histogram"
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (count per bucket (non-cumulative, +Inf last), sum)
+        self._values: Dict[LabelValues, tuple] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[label]) for label in self.labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def drain(self) -> Dict[LabelValues, tuple]:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: Dict[LabelValues, tuple]):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                mine, my_total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+                self._values[key] = ([a + b for a, b in zip(mine, counts)], my_total + total)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield self.name + "_bucket", key, (("le", _format_value(bound)),), cumulative
+            yield self.name + "_sum", key, (), total
+            yield self.name + "_count", key, (), cumulative
+
+
+class Gauge:
+    """Value read from a callback when metrics are rendered (e.g. a queue depth)."""
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Optional[float]]):
+        self.name, self.documentation, self.labels = name, documentation, ()
+        self.kind = "gauge"
+        self.read = read
+
+    def samples(self):
+        try:
+            value = self.read()
+        except Exception:
+            value = None
+        if value is not None:
+            yield self.name, (), (), float(value)
+
+
+class Registry:
+    """
+    Process-local metrics in the Prometheus text format.
+    Analysis workers run in other processes: they drain() their counters and
+    histograms after each job and the API process merge()s the delta, so
+    /metrics covers every worker without shared state.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering a name (e.g. a gauge bound to a new object) replaces it
+            self._metrics[metric.name] = metric
+        return metric
+
+    def drain(self) -> Dict[str, dict]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.drain() for m in metrics if hasattr(m, "drain")}
+
+    def merge(self, delta: Optional[Dict[str, dict]]):
+        if not delta:
+            return
+        with self._lock:
+            metrics = dict(self._metrics)
+        for name, values in delta.items():
+            if name in metrics and values:
+                metrics[name].merge(values)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, values, extra, value in metric.samples():
+                labels = list(zip(metric.labels, values)) + list(extra)
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{sample}{{{label_text}}} {_format_value(value)}" if labels
+                             else f"{sample} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value)) + ".0"
+
+
+class PeakMemory:
+    """
+    Peak resident memory of this process over one request. On Linux the
+    high-water mark is reset per request (/proc/self/clear_refs); elsewhere
+    the lifetime peak is reported. Only meaningful when the process runs
+    one analysis at a time (the process-pool workers).
+    """
+
+    def reset(self):
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+    def read(self) -> float:
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return float(line.split()[1]) * 1024
+        except OSError:
+            pass
+        try:
+            import resource
+        except ImportError: # Windows
+            return 0.0
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return float(peak if sys.platform == "darwin" else peak * 1024)
+
+
+metrics = Registry()
+peak_memory = PeakMemory()
+
+LAYER_DURATION = metrics.register(Histogram(
+    "forensics_layer_duration_seconds", "Run time of one layer for one analysis.", ("layer", "media_type")))
+LAYER_ERRORS = metrics.register(Counter(
+    "forensics_layer_errors_total", "Layer runs that raised or reported an error.", ("layer", "media_type")))
+LAYER_SKIPPED = metrics.register(Counter(
+    "forensics_layer_skipped_total", "Layers not run (cascade early exit or timeout).", ("layer", "reason")))
+ANALYSIS_DURATION = metrics.register(Histogram(
+    "forensics_analysis_duration_seconds", "Run time of all layers of one analysis.", ("media_type",)))
+ANALYSIS_PEAK_MEMORY = metrics.register(Histogram(
+    "forensics_analysis_peak_memory_bytes", "Peak resident memory of a worker process during one analysis.",
+    ("media_type",), buckets=MEMORY_BUCKETS))
+STAGE_DURATION = metrics.register(Histogram(
+    "forensics_stage_duration_seconds", "Run time of request stages (upload, decode, db_commit).", ("stage",)))
+BYTES_PROCESSED = metrics.register(Counter(
+    "forensics_bytes_processed_total", "Bytes of uploaded media received for analysis.", ("media_type",)))
+ANALYSES = metrics.register(Counter(
+    "forensics_analyses_total", "Completed /analyze requests.", ("media_type", "verdict", "cache")))
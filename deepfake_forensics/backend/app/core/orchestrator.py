@@ -1,51 +1,145 @@
+import importlib
+import logging
 import os
-import cv2
+import threading
+import time
 import numpy as np
-from PIL import Image
-from typing import Dict, Any
-
-try:
-    import torch
-    from torchvision import transforms
-    HAS_TORCH = True
-except ImportError:
-    HAS_TORCH = False
-
-from app.layers.layer1_metadata import MetadataAnalyzer
-from app.layers.layer2_biology import BiologicalAnalyzer
-from app.layers.layer3_math import MathAnalyzer
-from app.layers.layer4_hybrid_model import AIModelAnalyzer
-from app.layers.layer5_physics import PhysicsAnalyzer
-from app.layers.layer6_early_signature import EarlySignatureAnalyzer
-from app.layers.layer7_ela import ELAAnalyzer
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, Callable, List, Optional, Tuple, Union
+
+from app.core.artifacts import ela_url
+from app.core.config import settings
+from app.core.media import MediaContext
+from app.core.metrics import (ANALYSIS_DURATION, ANALYSIS_PEAK_MEMORY, LAYER_DURATION, LAYER_ERRORS,
+                              LAYER_SKIPPED, peak_memory)
+from app.core.profiling import RequestProfile, span
+
+logger = logging.getLogger(__name__)
+
+# Layer attribute -> (module, class). Modules, and the heavy dependencies they
+# import (torch, scipy, ...), are only loaded when the layer is first used.
+LAYER_CLASSES = {
+    "layer1": ("app.layers.layer1_metadata", "MetadataAnalyzer"),
+    "layer2": ("app.layers.layer2_biology", "BiologicalAnalyzer"),
+    "layer3": ("app.layers.layer3_math", "MathAnalyzer"),
+    "layer4": ("app.layers.layer4_hybrid_model", "AIModelAnalyzer"),
+    "layer5": ("app.layers.layer5_physics", "PhysicsAnalyzer"),
+    "layer6": ("app.layers.layer6_early_signature", "EarlySignatureAnalyzer"),
+    "layer7": ("app.layers.layer7_ela", "ELAAnalyzer"),
+}
+
+# Weighted average used for the final verdict
+LAYER_WEIGHTS = {
+    "metadata": 0.1,
+    "biology_rppg": 0.2,
+    "math_forensics": 0.3,
+    "ai_model": 0.3,
+    "physics": 0.05,
+    "early_signature": 0.05
+}
+
+# Layers whose full result is echoed back under results["details"]
+DETAIL_KEYS = {
+    "metadata": "metadata",
+    "biology_rppg": "biology",
+    "math_forensics": "math",
+    "ai_model": "ai_model",
+    "ela": "ela",
+}
+
+EMPTY_RESULT = {"score": 0, "details": {}, "anomalies": []}
+
+# Verdict bands of the final score: > 0.75 AI-Generated, > 0.4 Suspicious, else Real
+VERDICT_THRESHOLDS = (0.4, 0.75)
+
+# Range a layer score can take; early_signature's FFT term goes negative on flat images
+LAYER_SCORE_RANGES = {"early_signature": (-1.0, 1.0)}
+DEFAULT_SCORE_RANGE = (0.0, 1.0)
+
+# Starting run time estimates (seconds) for the cascade order, per media kind,
+# refined with measured run times as requests are served
+DEFAULT_LAYER_COSTS = {
+    False: {"metadata": 0.005, "biology_rppg": 0.07, "math_forensics": 0.1, "ai_model": 0.15,
+            "physics": 0.07, "early_signature": 0.02, "ela": 0.1},
+    True: {"metadata": 0.005, "biology_rppg": 5.0, "math_forensics": 0.1, "ai_model": 1.0,
+           "physics": 0.0, "early_signature": 0.05},
+}
+
+# Called as progress(layer_name, status) with status "running", "done" or "timed_out"
+ProgressCallback = Callable[[str, str], None]
+
 
 class ForensicsOrchestrator:
     def __init__(self):
-        self.layer1 = MetadataAnalyzer()
-        self.layer2 = BiologicalAnalyzer()
-        self.layer3 = MathAnalyzer()
-        self.layer4 = AIModelAnalyzer()
-        self.layer5 = PhysicsAnalyzer()
-        self.layer6 = EarlySignatureAnalyzer()
-        self.layer7 = ELAAnalyzer()
-        
-        if HAS_TORCH:
-            self.transform = transforms.Compose([
-                transforms.Resize((224, 224)),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-            ])
+        # layer1 ... layer7 are created on first access (see __getattr__)
+        self._layers_lock = threading.Lock()
+
+        # Shared, bounded pool for the concurrent execution mode (created on first use)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # Record each analysis's peak memory; only true where one analysis runs
+        # per process at a time (set by the process-pool workers)
+        self.track_peak_memory = False
+        # Smoothed run time per layer, by is_video, for the cascade mode
+        self._layer_costs = {kind: dict(costs) for kind, costs in DEFAULT_LAYER_COSTS.items()}
+        self._cost_samples: Dict[Tuple[bool, str], int] = {}
+        self._costs_lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        if name not in LAYER_CLASSES:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        with self.__dict__["_layers_lock"]:
+            if name not in self.__dict__:
+                module, cls = LAYER_CLASSES[name]
+                self.__dict__[name] = getattr(importlib.import_module(module), cls)()
+        return self.__dict__[name]
+
+    def analyze_media(self, media: Union[str, bytes, memoryview], filename: Optional[str] = None,
+                      progress: Optional[ProgressCallback] = None, media_id: Optional[str] = None,
+                      profile: bool = False) -> Dict[str, Any]:
+        """
+        Analyzes a file path, or upload bytes held in memory. For bytes,
+        filename (e.g. "<uuid>.jpg") gives the media type. media_id (the
+        upload's content hash) names the on-demand ELA image in ela_url.
+        With profile=True, details["profile"] holds the per-layer and
+        per-stage timing tree and a link to the full cProfile dump.
+        """
+        if isinstance(media, str):
+            if not os.path.exists(media):
+                return {"error": "File not found"}
+            # Decode once; every layer shares the same context and derived views
+            ctx = MediaContext(media)
         else:
-            self.transform = None
+            ctx = MediaContext.from_bytes(media, filename)
+
+        media_type = "video" if ctx.is_video else "image"
+        if self.track_peak_memory:
+            peak_memory.reset()
+        started = time.perf_counter()
+        try:
+            if profile:
+                return self._analyze_profiled(ctx, progress, media_id)
+            return self._analyze(ctx, progress, media_id)
+        finally:
+            ctx.close()
+            ANALYSIS_DURATION.observe(time.perf_counter() - started, media_type=media_type)
+            if self.track_peak_memory:
+                ANALYSIS_PEAK_MEMORY.observe(peak_memory.read(), media_type=media_type)
 
-    def analyze_media(self, file_path: str) -> Dict[str, Any]:
-        if not os.path.exists(file_path):
-            return {"error": "File not found"}
+    def _analyze_profiled(self, ctx: MediaContext, progress: Optional[ProgressCallback],
+                          media_id: Optional[str] = None) -> Dict[str, Any]:
+        # The profiler only sees this thread, so concurrent layers run in turn here
+        mode = settings.LAYER_EXECUTION_MODE
+        if mode == "concurrent":
+            mode = "sequential"
+        with RequestProfile() as profile:
+            results = self._analyze(ctx, progress, media_id, mode=mode)
+        results["details"]["profile"] = {"execution_mode": mode, **profile.report()}
+        return results
+
+    def _analyze(self, ctx: MediaContext, progress: Optional[ProgressCallback],
+                 media_id: Optional[str] = None, mode: Optional[str] = None) -> Dict[str, Any]:
 
-        # Determine type
-        ext = os.path.splitext(file_path)[1].lower()
-        is_video = ext in ['.mp4', '.avi', '.mov', '.mkv']
-        
         results = {
             "verdict": "Inconclusive",
             "confidence": 0.0,
@@ -54,125 +148,349 @@ class ForensicsOrchestrator:
             "details": {},
             "ela_url": None
         }
-        
-        # Layer 1: Metadata
-        l1_res = self.layer1.analyze(file_path)
-        results["layer_scores"]["metadata"] = l1_res["score"]
-        results["details"]["metadata"] = l1_res
-        
-        # Bubble up verification status
-        results["is_verified"] = l1_res["details"].get("provenance_verified", False)
-        results["c2pa_data"] = l1_res["details"].get("c2pa", {})
-        
-        # Layer 2: Biology
-        if is_video:
-            l2_res = self.layer2.analyze_video(file_path)
-        else:
-            l2_res = self.layer2.analyze_image(file_path)
-        results["layer_scores"]["biology_rppg"] = l2_res["score"]
-        results["details"]["biology"] = l2_res
-        
-        # Layer 3: Math (Image only for now, or first frame of video)
-        if is_video:
-            # Extract first frame
-            cap = cv2.VideoCapture(file_path)
-            ret, frame = cap.read()
-            cap.release()
-            if ret:
-                temp_img_path = file_path + "_frame0.jpg"
-                cv2.imwrite(temp_img_path, frame)
-                l3_res = self.layer3.analyze(temp_img_path)
-                os.remove(temp_img_path)
-            else:
-                l3_res = {"score": 0, "details": {}, "anomalies": []}
+
+        media_type = "video" if ctx.is_video else "image"
+        tasks = [(name, self._instrumented(name, fn, media_type)) for name, fn in self._layer_tasks(ctx)]
+        if progress:
+            tasks = [(name, self._with_progress(name, fn, progress)) for name, fn in tasks]
+        skipped = {}
+        mode = mode or settings.LAYER_EXECUTION_MODE
+        if mode == "concurrent":
+            layer_results, timed_out = self._run_concurrent(tasks, ctx)
+        elif mode == "cascade":
+            layer_results, timed_out, skipped = self._run_cascade(tasks, ctx.is_video)
         else:
-            l3_res = self.layer3.analyze(file_path)
-        results["layer_scores"]["math_forensics"] = l3_res["score"]
-        results["details"]["math"] = l3_res
-        
-        # Layer 4: AI Model
-        try:
-            if HAS_TORCH and self.transform:
-                if is_video:
-                    # Use first frame
-                    cap = cv2.VideoCapture(file_path)
-                    ret, frame = cap.read()
-                    cap.release()
-                    if ret:
-                        img_pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                    else:
-                        img_pil = Image.new('RGB', (224, 224))
-                else:
-                    img_pil = Image.open(file_path).convert('RGB')
-                    
-                img_tensor = self.transform(img_pil).unsqueeze(0)
-                l4_score = self.layer4.analyze(img_tensor)
+            layer_results, timed_out = self._run_sequential(tasks)
+        for name in timed_out:
+            LAYER_SKIPPED.inc(layer=name, reason="timeout")
+        for name in skipped:
+            LAYER_SKIPPED.inc(layer=name, reason="cascade")
+        if progress:
+            for name in timed_out:
+                progress(name, "timed_out")
+            for name in skipped:
+                progress(name, "skipped")
+
+        for name, res in layer_results.items():
+            if name == "ela":
+                # Rendered by GET {ela_url} the first time someone looks at it
+                if media_id and res.pop("renderable", False):
+                    results["ela_url"] = ela_url(media_id)
             else:
-                # Fallback to path-based analysis (Statistical)
-                l4_score = self.layer4.analyze(file_path)
-            results["layer_scores"]["ai_model"] = l4_score
-        except Exception as e:
-            print(f"Layer 4 error: {e}")
-            results["layer_scores"]["ai_model"] = 0.5 # Neutral
-            
-        # Layer 5: Physics
-        if is_video:
-             # Skip for video in this simplified version
-             l5_res = {"score": 0, "details": {}, "anomalies": []}
-        else:
-            l5_res = self.layer5.analyze(file_path)
-        results["layer_scores"]["physics"] = l5_res["score"]
-        
-        # Layer 6: Early Signature
-        l6_res = self.layer6.analyze(file_path)
-        results["layer_scores"]["early_signature"] = l6_res["score"]
+                results["layer_scores"][name] = res["score"]
+            if name in DETAIL_KEYS:
+                results["details"][DETAIL_KEYS[name]] = res
+
+        # Bubble up verification status
+        l1_details = layer_results.get("metadata", EMPTY_RESULT)["details"]
+        results["is_verified"] = l1_details.get("provenance_verified", False)
+        results["c2pa_data"] = l1_details.get("c2pa", {})
+
+        if timed_out:
+            # Overrunning layers are reported and left out of the weighted average
+            results["details"]["timed_out_layers"] = timed_out
+        if skipped:
+            # Left out by the cascade; reason per layer
+            results["details"]["skipped_layers"] = skipped
 
-        # Layer 7: ELA (Image only)
-        if not is_video:
-            output_dir = os.path.dirname(file_path)
-            l7_res = self.layer7.analyze(file_path, output_dir)
-            results["ela_url"] = l7_res["ela_image_path"]
-        
         # Final Aggregation
         # Weighted average
-        weights = {
-            "metadata": 0.1,
-            "biology_rppg": 0.2,
-            "math_forensics": 0.3,
-            "ai_model": 0.3,
-            "physics": 0.05,
-            "early_signature": 0.05
-        }
-        
         total_score = 0
         total_weight = 0
-        
-        for key, weight in weights.items():
+
+        for key, weight in LAYER_WEIGHTS.items():
             if key in results["layer_scores"]:
                 total_score += results["layer_scores"][key] * weight
                 total_weight += weight
-                
+
         final_score = total_score / total_weight if total_weight > 0 else 0
         results["confidence"] = round(final_score, 3)
-        
-        if final_score > 0.75:
-            results["verdict"] = "AI-Generated"
-        elif final_score > 0.4:
-            results["verdict"] = "Suspicious / Inconclusive"
-        else:
-            results["verdict"] = "Real"
-            
+
+        results["verdict"] = self._verdict(final_score)
+
         # Generate Explanation
         anomalies = []
-        anomalies.extend(l1_res.get("anomalies", []))
-        anomalies.extend(l2_res.get("anomalies", []))
-        anomalies.extend(l3_res.get("anomalies", []))
-        
+        for name in ("metadata", "biology_rppg", "math_forensics"):
+            anomalies.extend(layer_results.get(name, EMPTY_RESULT).get("anomalies", []))
+
         if not anomalies and final_score < 0.3:
             results["explanation"] = "No significant artifacts found. Content appears authentic."
         elif not anomalies and final_score >= 0.3:
             results["explanation"] = "No specific anomalies flagged, but statistical models indicate potential manipulation."
         else:
             results["explanation"] = f"Flagged as {results['verdict']} due to: " + "; ".join(anomalies)
-            
+
         return results
+
+    def _layer_tasks(self, ctx: MediaContext) -> List[Tuple[str, Callable[[], Dict[str, Any]]]]:
+        """
+        Builds the independent per-layer jobs for one request, keyed by the
+        name each layer's score is reported under.
+        """
+        is_video = ctx.is_video
+        enabled = settings.ENABLED_LAYERS
+        if is_video:
+            # Declared before any layer reads, so one decoding pass serves both
+            # video layers whatever order they run in
+            if "biology_rppg" in enabled:
+                ctx.video.subscribe(settings.VIDEO_SAMPLING_STRATEGY, settings.VIDEO_MAX_FRAMES or None)
+            if "ai_model" in enabled:
+                ctx.video.subscribe("uniform", max(1, settings.VIDEO_MODEL_FRAMES))
+
+        # Layer 1: Metadata
+        def metadata():
+            return self.layer1.analyze(ctx)
+
+        # Layer 2: Biology
+        def biology():
+            if is_video:
+                return self.layer2.analyze_video(ctx)
+            return self.layer2.analyze_image(ctx)
+
+        # Layer 3: Math (Image only for now, or first frame of video)
+        def math():
+            if is_video:
+                # First frame, analysed in memory
+                frame = ctx.first_frame
+                if frame is None:
+                    return dict(EMPTY_RESULT)
+                return self.layer3.analyze(MediaContext.from_array(frame))
+            return self.layer3.analyze(ctx)
+
+        # Layer 4: AI Model
+        def ai_model_heuristic():
+            # Blur/entropy heuristics (first frame of a video)
+            if is_video:
+                frame = ctx.first_frame
+                if frame is None:
+                    return {"score": 0.5, "details": {"scoring": "heuristic"}}
+                return self.layer4.analyze_detailed(MediaContext.from_array(frame))
+            return self.layer4.analyze_detailed(ctx)
+
+        def ai_model():
+            layer4 = self.layer4
+            error = None
+            try:
+                if not layer4.uses_torch:
+                    return ai_model_heuristic()
+                if not is_video:
+                    return layer4.analyze_detailed(layer4.to_tensor(ctx.pil_rgb))
+                # K frames spread over the clip, scored as one batch
+                sampled = list(ctx.video.frames("uniform", max(1, settings.VIDEO_MODEL_FRAMES)))
+                if sampled:
+                    return layer4.analyze_frames([f for _, f in sampled], [i for i, _ in sampled])
+                fallback = "no frames could be sampled from the video"
+            except Exception as e:
+                logger.exception("Layer 4 network scoring failed; falling back to heuristics")
+                fallback, error = "network scoring failed", str(e)
+            res = ai_model_heuristic()
+            # The response shows the network did not score this upload
+            res["details"]["fallback"] = fallback
+            if error is not None:
+                res["details"]["error"] = error
+            return res
+
+        # Layer 5: Physics
+        def physics():
+            if is_video:
+                # Skip for video in this simplified version
+                return dict(EMPTY_RESULT)
+            return self.layer5.analyze(ctx)
+
+        # Layer 6: Early Signature
+        def early_signature():
+            return self.layer6.analyze(ctx)
+
+        # Layer 7: ELA (Image only)
+        def ela():
+            return self.layer7.analyze(ctx)
+
+        tasks = [
+            ("metadata", metadata),
+            ("biology_rppg", biology),
+            ("math_forensics", math),
+            ("ai_model", ai_model),
+            ("physics", physics),
+            ("early_signature", early_signature),
+        ]
+        if not is_video:
+            tasks.append(("ela", ela))
+        # Disabled layers are never instantiated, so their dependencies never load
+        return [(name, fn) for name, fn in tasks if name in enabled]
+
+    @staticmethod
+    def _verdict(score: float) -> str:
+        suspicious, ai_generated = VERDICT_THRESHOLDS
+        if score > ai_generated:
+            return "AI-Generated"
+        elif score > suspicious:
+            return "Suspicious / Inconclusive"
+        return "Real"
+
+    @staticmethod
+    def _instrumented(name: str, fn: Callable[[], Dict[str, Any]], media_type: str):
+        """Times a layer and counts it as failed when it raises or reports an error."""
+        def run():
+            started = time.perf_counter()
+            try:
+                with span(name):
+                    res = fn()
+            except Exception:
+                LAYER_ERRORS.inc(layer=name, media_type=media_type)
+                raise
+            finally:
+                LAYER_DURATION.observe(time.perf_counter() - started, layer=name, media_type=media_type)
+            if isinstance(res, dict) and "error" in res.get("details", {}):
+                LAYER_ERRORS.inc(layer=name, media_type=media_type)
+            return res
+        return run
+
+    @staticmethod
+    def _with_progress(name: str, fn: Callable[[], Dict[str, Any]], progress: ProgressCallback):
+        def run():
+            progress(name, "running")
+            res = fn()
+            progress(name, "done")
+            return res
+        return run
+
+    def _run_sequential(self, tasks) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        return {name: fn() for name, fn in tasks}, []
+
+    def _run_cascade(self, tasks, is_video: bool) -> Tuple[Dict[str, Dict[str, Any]], List[str], Dict[str, str]]:
+        """
+        Runs layers one at a time, metadata first, then by expected cost per
+        unit of verdict weight. After each weighted layer the final score is
+        bounded by assuming the worst and best scores for the layers still to
+        run; once both bounds give the same verdict, the remaining weighted
+        layers are skipped. A verified C2PA manifest ends the cascade right
+        after metadata. Unweighted layers (ELA) feed the response, not the
+        verdict, and always run.
+        """
+        costs = self._layer_costs[is_video]
+
+        def priority(item):
+            name = item[0]
+            if name == "metadata":
+                return (0, 0.0)
+            weight = LAYER_WEIGHTS.get(name)
+            if not weight:
+                return (2, costs.get(name, 0.0))
+            return (1, costs.get(name, 0.0) / weight)
+
+        ordered = sorted(tasks, key=priority)
+        remaining_weight = sum(LAYER_WEIGHTS.get(name, 0.0) for name, _ in ordered)
+        layer_results: Dict[str, Dict[str, Any]] = {}
+        skipped: Dict[str, str] = {}
+        decided = None
+
+        for name, fn in ordered:
+            weight = LAYER_WEIGHTS.get(name, 0.0)
+            if decided and weight:
+                skipped[name] = decided
+                continue
+
+            started = time.perf_counter()
+            layer_results[name] = fn()
+            self._record_cost(is_video, name, time.perf_counter() - started)
+            if not weight:
+                continue
+            remaining_weight -= weight
+
+            if name == "metadata" and layer_results[name]["details"].get("provenance_verified"):
+                decided = "provenance verified (C2PA)"
+            elif remaining_weight > 0:
+                low, high = self._score_bounds(layer_results, [n for n, _ in ordered if n not in layer_results])
+                if self._verdict(low) == self._verdict(high):
+                    decided = f"verdict settled: final score bounded to [{low:.3f}, {high:.3f}]"
+        return layer_results, [], skipped
+
+    @staticmethod
+    def _score_bounds(layer_results: Dict[str, Dict[str, Any]], pending: List[str]) -> Tuple[float, float]:
+        """Lowest and highest final score reachable whatever the pending layers return."""
+        total = weight_done = 0.0
+        for name, res in layer_results.items():
+            if name in LAYER_WEIGHTS:
+                total += res["score"] * LAYER_WEIGHTS[name]
+                weight_done += LAYER_WEIGHTS[name]
+        low = high = total
+        weight_all = weight_done
+        for name in pending:
+            if name in LAYER_WEIGHTS:
+                lo, hi = LAYER_SCORE_RANGES.get(name, DEFAULT_SCORE_RANGE)
+                low += lo * LAYER_WEIGHTS[name]
+                high += hi * LAYER_WEIGHTS[name]
+                weight_all += LAYER_WEIGHTS[name]
+        if weight_all <= 0:
+            return 0.0, 0.0
+        return low / weight_all, high / weight_all
+
+    def _record_cost(self, is_video: bool, name: str, seconds: float):
+        alpha = settings.CASCADE_COST_ALPHA
+        with self._costs_lock:
+            samples = self._cost_samples.get((is_video, name), 0)
+            self._cost_samples[(is_video, name)] = samples + 1
+            if samples == 0:
+                # The first run pays for imports and model loading; not a cost estimate
+                return
+            costs = self._layer_costs[is_video]
+            previous = costs.get(name)
+            costs[name] = seconds if previous is None else (1 - alpha) * previous + alpha * seconds
+
+    def _run_concurrent(self, tasks, ctx: Optional[MediaContext] = None) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """
+        Runs every layer at once on the shared pool. Each layer gets its own
+        timeout, counted from when a worker starts it (not while it waits for
+        one) and bounded by the overall request deadline. Python threads cannot
+        be interrupted, so an overrunning layer keeps its worker until it
+        returns; its result is simply discarded. Every submitted layer holds
+        ctx until it finishes, so closing the request's context waits for
+        the abandoned ones.
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.LAYER_MAX_WORKERS,
+                    thread_name_prefix="forensics-layer"
+                )
+
+        started: Dict[str, float] = {}
+
+        def timed(name, fn):
+            started[name] = time.monotonic()
+            return fn()
+
+        request_deadline = time.monotonic() + settings.REQUEST_DEADLINE_SECONDS
+        timeouts = {name: settings.LAYER_TIMEOUTS.get(name, settings.LAYER_TIMEOUT_SECONDS) for name, _ in tasks}
+        pending = {}
+        for name, fn in tasks:
+            if ctx is not None:
+                ctx.retain()
+            future = self._executor.submit(timed, name, fn)
+            if ctx is not None:
+                # Also runs when a queued layer is cancelled
+                future.add_done_callback(lambda _: ctx.release())
+            pending[future] = name
+
+        results = {}
+        timed_out = []
+        while pending:
+            now = time.monotonic()
+            # A queued layer's clock has not started: its deadline is at least now + timeout
+            deadlines = {future: min(started.get(name, now) + timeouts[name], request_deadline)
+                         for future, name in pending.items()}
+            for future, deadline in deadlines.items():
+                if deadline <= now and not future.done():
+                    future.cancel()
+                    timed_out.append(pending.pop(future))
+            if not pending:
+                break
+            done, _ = wait(list(pending), timeout=max(0.0, min(deadlines[f] for f in pending) - now),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+
+        # Report in task order, whatever order the layers finished in
+        layer_results = {name: results[name] for name, _ in tasks if name in results}
+        timed_out.sort(key=[name for name, _ in tasks].index)
+        return layer_results, timed_out
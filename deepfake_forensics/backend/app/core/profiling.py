@@ -0,0 +1,131 @@
+import cProfile
+import hashlib
+import marshal
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Optional
+
+# Active trace of the request being profiled on this thread (None otherwise)
+_local = threading.local()
+_NO_SPAN = nullcontext()
+
+# cProfile allows one active profiler at a time; profiled requests take turns
+_profile_lock = threading.Lock()
+
+HOTSPOT_COUNT = 25
+
+
+def span(name: str):
+    """
+    Times a block as a node of the current request's trace. Outside a
+    profiled request this is a shared no-op context manager.
+    """
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return _NO_SPAN
+    return trace.span(name)
+
+
+class Trace:
+    """
+    Timing tree of one analysis. Repeated spans with the same name under the
+    same parent (e.g. face detection on every video frame) are merged into
+    one node with a call count.
+    """
+
+    def __init__(self, name: str = "analysis"):
+        self.root = self._node(name)
+        self._stack = [self.root]
+
+    @staticmethod
+    def _node(name: str) -> Dict[str, Any]:
+        return {"name": name, "ms": 0.0, "calls": 0, "children": {}}
+
+    @contextmanager
+    def span(self, name: str):
+        parent = self._stack[-1]
+        node = parent["children"].get(name)
+        if node is None:
+            node = parent["children"][name] = self._node(name)
+        self._stack.append(node)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            node["ms"] += (time.perf_counter() - started) * 1000
+            node["calls"] += 1
+            self._stack.pop()
+
+    def to_dict(self, node: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        node = node or self.root
+        children = [self.to_dict(child) for child in node["children"].values()]
+        out = {"name": node["name"], "ms": round(node["ms"], 3), "calls": node["calls"]}
+        if children:
+            # Time spent in this node outside any of its spans
+            out["self_ms"] = round(node["ms"] - sum(c["ms"] for c in children), 3)
+            out["children"] = children
+        return out
+
+
+class RequestProfile:
+    """
+    Profiles one analysis on the calling thread: cProfile for the full call
+    graph, plus the span trace (layers and stages) for the response.
+    Work handed to other threads (the concurrent layer pool, the Layer 4
+    batcher) is outside cProfile's view, so the orchestrator runs profiled
+    requests' layers on this thread.
+    """
+
+    def __init__(self):
+        self.trace = Trace()
+        self.profiler = cProfile.Profile()
+        self._started = 0.0
+
+    def __enter__(self):
+        _profile_lock.acquire()
+        _local.trace = self.trace
+        self._started = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        self.trace.root["ms"] = (time.perf_counter() - self._started) * 1000
+        self.trace.root["calls"] = 1
+        _local.trace = None
+        _profile_lock.release()
+        return False
+
+    def dump(self) -> bytes:
+        """The profile in the pstats file format (load with pstats.Stats or snakeviz)."""
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
+
+    def hotspots(self, count: int = HOTSPOT_COUNT) -> List[Dict[str, Any]]:
+        """Functions with the most cumulative time."""
+        stats = pstats.Stats(self.profiler)
+        rows = []
+        for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{filename}:{line}({function})",
+                "calls": calls,
+                "own_ms": round(tottime * 1000, 3),
+                "cumulative_ms": round(cumtime * 1000, 3),
+            })
+        rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+        return rows[:count]
+
+    def report(self) -> Dict[str, Any]:
+        """Trace and hotspots for the response; the full profile is saved to storage."""
+        from app.core.storage import storage
+
+        data = self.dump()
+        content_hash = hashlib.sha256(data).hexdigest()
+        storage.write("profiles", content_hash, ".prof", data)
+        return {
+            "trace": self.trace.to_dict(),
+            "hotspots": self.hotspots(),
+            "profile_url": f"/uploads/profiles/{content_hash}.prof",
+        }
@@ -0,0 +1,137 @@
+import functools
+import numpy as np
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.profiling import span
+from app.core.tiling import Moments, iter_windows, tile_side
+
+# Rough working set of one Spectrum: float64 input copy, complex half-spectrum,
+# magnitude, shifted copy and one log-magnitude
+SPECTRUM_BYTES_PER_PIXEL = 32
+
+
+@functools.lru_cache(maxsize=32)
+def _half_geometry(h: int, w: int):
+    """
+    Squared radius of every bin of a row-shifted rfft2 half-spectrum, and the
+    number of full-spectrum bins each one stands for (real input is Hermitian:
+    every column except DC and Nyquist has a mirror image on the other side).
+    """
+    ky = np.arange(h) - h // 2
+    kx = np.arange(w // 2 + 1)
+    radius_sq = ky[:, None] ** 2 + kx[None, :] ** 2
+
+    col_weights = np.full(w // 2 + 1, 2.0)
+    col_weights[0] = 1.0
+    if w % 2 == 0:
+        col_weights[-1] = 1.0
+    weights = np.broadcast_to(col_weights, (h, w // 2 + 1))
+
+    radius_sq.setflags(write=False)
+    return radius_sq, weights
+
+
+@functools.lru_cache(maxsize=64)
+def radial_mask(h: int, w: int, radius: float) -> np.ndarray:
+    """High-pass mask (True outside `radius`) for the half-spectrum of an h x w image."""
+    radius_sq, _ = _half_geometry(h, w)
+    mask = radius_sq > radius ** 2
+    mask.setflags(write=False)
+    return mask
+
+
+@functools.lru_cache(maxsize=32)
+def radial_bins(h: int, w: int) -> np.ndarray:
+    """Integer radius of every half-spectrum bin, for radial profiles."""
+    radius_sq, _ = _half_geometry(h, w)
+    bins = np.sqrt(radius_sq).astype(np.intp)
+    bins.setflags(write=False)
+    return bins
+
+
+class Spectrum:
+    """
+    Shared frequency-domain view of one grayscale image.
+    - One real-input FFT (rfft2, multi-threaded) instead of a full complex fft2 per layer
+    - Rows are fftshifted so the zero frequency sits at row h // 2, column 0
+    - Log-magnitudes are memoized per epsilon
+    - Statistics are weighted so they equal those of the full shifted fft2
+      spectrum of the same input, to floating-point rounding (test_spectral.py)
+    """
+
+    def __init__(self, gray: np.ndarray, workers: Optional[int] = None):
+        self.shape = gray.shape
+        import scipy.fft # Deferred: only layers that need a spectrum pay for importing scipy
+        workers = settings.FFT_WORKERS if workers is None else workers
+        with span("fft"):
+            half = scipy.fft.rfft2(gray, workers=workers)
+            self.magnitude = np.fft.fftshift(np.abs(half), axes=0)
+        self._log: Dict[float, np.ndarray] = {}
+
+    def log_magnitude(self, eps: float = 1e-8) -> np.ndarray:
+        """20 * log(|F| + eps), as the layers have always scaled it."""
+        if eps not in self._log:
+            self._log[eps] = 20 * np.log(self.magnitude + eps)
+        return self._log[eps]
+
+    def high_pass_stats(self, radius: float, eps: float = 1e-8, peak_sigmas: Optional[float] = None) -> Dict[str, float]:
+        """
+        Mean / max / std of the log-magnitude outside `radius`. With
+        peak_sigmas, also counts bins above mean + peak_sigmas * std.
+        """
+        h, w = self.shape
+        _, weights = _half_geometry(h, w)
+        mask = radial_mask(h, w, radius)
+        values = self.log_magnitude(eps)[mask]
+        value_weights = weights[mask]
+
+        total = value_weights.sum()
+        mean = float(np.dot(values, value_weights) / total)
+        std = float(np.sqrt(np.dot((values - mean) ** 2, value_weights) / total))
+        stats = {"mean": mean, "max": float(values.max()), "std": std}
+
+        if peak_sigmas is not None:
+            threshold = mean + peak_sigmas * std
+            peaks = float(value_weights[values > threshold].sum())
+            # Low frequencies count as zero-valued bins, as in a masked full spectrum
+            if threshold < 0:
+                peaks += h * w - total
+            stats["peaks"] = int(peaks)
+        return stats
+
+    def radial_profile(self, eps: float = 1e-8) -> np.ndarray:
+        """Mean log-magnitude per integer radius (index = radius in frequency bins)."""
+        h, w = self.shape
+        _, weights = _half_geometry(h, w)
+        bins = radial_bins(h, w).ravel()
+        w_flat = weights.ravel()
+        sums = np.bincount(bins, weights=self.log_magnitude(eps).ravel() * w_flat)
+        counts = np.bincount(bins, weights=w_flat)
+        return sums / np.maximum(counts, 1e-12)
+
+
+def tiled_high_pass_stats(gray: np.ndarray, radius: float, eps: float = 1e-8,
+                          side: Optional[int] = None, overlap: Optional[int] = None) -> Dict[str, float]:
+    """
+    high_pass_stats() of an image too large to transform in one piece.
+    Overlapping equal-sized windows are transformed one at a time and their
+    statistics pooled. Each window is put on the whole image's scale: the
+    radius covers the same band of normalized frequencies, and log-magnitudes
+    are offset by the sqrt(N) growth of |F| with the number of pixels.
+    """
+    h, w = gray.shape
+    side = tile_side(SPECTRUM_BYTES_PER_PIXEL) if side is None else side
+    overlap = settings.TILE_OVERLAP if overlap is None else overlap
+
+    moments = Moments()
+    for y0, y1, x0, x1 in iter_windows(gray.shape, side, overlap):
+        th, tw = y1 - y0, x1 - x0
+        area_ratio = (h * w) / float(th * tw)
+        tile_radius = radius / np.sqrt(area_ratio)
+        stats = Spectrum(gray[y0:y1, x0:x1]).high_pass_stats(tile_radius, eps)
+        # Pool by the number of full-spectrum bins each window contributed
+        weight = _half_geometry(th, tw)[1][radial_mask(th, tw, tile_radius)].sum()
+        offset = 10 * np.log(area_ratio)
+        moments.push_stats(weight, stats["mean"] + offset, stats["std"], stats["max"] + offset)
+    return {"mean": moments.mean, "max": moments.max, "std": moments.std}
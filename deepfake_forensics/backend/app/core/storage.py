@@ -0,0 +1,237 @@
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from starlette.staticfiles import StaticFiles
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Top-level directories of the layout; anything else under the root is legacy
+KINDS = ("originals", "ela", "profiles")
+
+# Flat "ela_<name>" images written before the sharded layout
+_LEGACY_ELA_NAME = re.compile(r"^ela_[^/\\]+$")
+
+# "<kind>/<sha256><ext>", the public name of a stored object
+_OBJECT_NAME = re.compile(r"^(?P<kind>[a-z]+)/(?P<hash>[0-9a-f]{64})(?P<ext>\.[A-Za-z0-9]+)?$")
+
+
+class StorageManager:
+    """
+    Content-addressed storage for uploads and derived artifacts.
+    - Objects live at <root>/<kind>/<aa>/<bb>/<sha256><ext> (hash-prefix shards),
+      so identical uploads are stored once and no directory grows unbounded
+    - Originals being analysed are pinned; released originals are deleted
+      right away when STORAGE_KEEP_ORIGINALS is off
+    - A background sweeper enforces retention: files untouched for longer
+      than the TTL go first, then least recently used files until the total
+      is under the quota. Serving a file counts as a use.
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root or settings.UPLOAD_DIR
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def path(self, kind: str, content_hash: str, ext: str = "") -> str:
+        return os.path.join(self.root, kind, content_hash[:2], content_hash[2:4], f"{content_hash}{ext.lower()}")
+
+    def find(self, kind: str, content_hash: str) -> Optional[str]:
+        """Path of the stored object with this hash, whatever its extension; None when absent."""
+        directory = os.path.dirname(self.path(kind, content_hash))
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return None
+        for name in names:
+            if os.path.splitext(name)[0] == content_hash:
+                return os.path.join(directory, name)
+        return None
+
+    def resolve(self, name: str, kinds: Sequence[str] = KINDS) -> Optional[str]:
+        """
+        Maps a public "<kind>/<hash><ext>" name to its sharded path relative
+        to the root; None when it is not an object of one of `kinds`.
+        """
+        match = _OBJECT_NAME.match(name.replace(os.sep, "/"))
+        if match is None or match.group("kind") not in kinds:
+            return None
+        full = self.path(match.group("kind"), match.group("hash"), match.group("ext") or "")
+        return os.path.relpath(full, self.root)
+
+    def temp_file(self) -> Tuple[int, str]:
+        """A new temporary file (fd, path) on the store's filesystem, for adopt_upload()."""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        return tempfile.mkstemp(dir=self.tmp_dir)
+
+    def adopt_upload(self, tmp: str, content_hash: str, ext: str) -> str:
+        """
+        Moves a fully written temp_file() holding an upload with this hash
+        into the store. Returns its path, pinned; call release() when done with it.
+        """
+        target = self.path("originals", content_hash, ext)
+        with self._lock:
+            self._pins[target] = self._pins.get(target, 0) + 1
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.exists(target):
+                # Same bytes already stored
+                os.remove(tmp)
+                self.touch(target)
+            else:
+                os.replace(tmp, target)
+        return target
+
+    def write(self, kind: str, content_hash: str, ext: str, data: bytes) -> str:
+        """Atomically stores a derived artifact and returns its path."""
+        target = self.path(kind, content_hash, ext)
+        with self._lock:
+            # The temp file keeps the shard directory from being pruned meanwhile
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+        return target
+
+    def release(self, path: Optional[str]):
+        """Drops one pin on an original; deletes it if unpinned and originals are not kept."""
+        if not path:
+            return
+        with self._lock:
+            count = self._pins.get(path, 0) - 1
+            if count > 0:
+                self._pins[path] = count
+                return
+            self._pins.pop(path, None)
+            if not settings.STORAGE_KEEP_ORIGINALS:
+                self._delete(path)
+
+    def touch(self, path: str):
+        """Marks a file as used (its mtime is the LRU clock)."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def sweep(self) -> Dict[str, int]:
+        """One retention pass. Returns counts of files and bytes removed and kept."""
+        ttl = settings.STORAGE_TTL_HOURS * 3600
+        quota = settings.STORAGE_QUOTA_MB * 1024 * 1024
+        now = time.time()
+
+        files: List[Tuple[float, int, str]] = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+
+        removed = removed_bytes = 0
+        total = sum(size for _, size, _ in files)
+        files.sort() # Least recently used first
+        for mtime, size, path in files:
+            expired = ttl > 0 and now - mtime > ttl
+            # Uploads still being received only expire by age
+            over_quota = quota > 0 and total > quota and os.path.dirname(path) != self.tmp_dir
+            if not (expired or over_quota):
+                continue
+            with self._lock:
+                # Never delete an original that an analysis is still reading
+                if path in self._pins or not self._delete(path):
+                    continue
+            removed += 1
+            removed_bytes += size
+            total -= size
+
+        self._prune_empty_dirs()
+        return {"removed_files": removed, "removed_bytes": removed_bytes,
+                "kept_files": len(files) - removed, "kept_bytes": total}
+
+    def start_sweeper(self):
+        if self._sweeper is not None or settings.STORAGE_SWEEP_INTERVAL_SECONDS <= 0:
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="storage-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+    def _sweep_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Storage sweep error")
+            self._stop.wait(settings.STORAGE_SWEEP_INTERVAL_SECONDS)
+
+    def _delete(self, path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _prune_empty_dirs(self):
+        with self._lock:
+            self._prune_empty_dirs_locked()
+
+    def _prune_empty_dirs_locked(self):
+        for kind in KINDS:
+            for directory, _, _ in os.walk(os.path.join(self.root, kind), topdown=False):
+                if directory != os.path.join(self.root, kind):
+                    try:
+                        os.rmdir(directory) # Only succeeds when empty
+                    except OSError:
+                        pass
+
+
+def public_kinds() -> Tuple[str, ...]:
+    """Storage kinds served under /uploads: STORAGE_PUBLIC_KINDS, plus profiles when profiling is on."""
+    kinds = set(settings.STORAGE_PUBLIC_KINDS)
+    if settings.PROFILING_ENABLED:
+        kinds.add("profiles")
+    return tuple(kind for kind in KINDS if kind in kinds)
+
+
+class StorageStaticFiles(StaticFiles):
+    """
+    Serves /uploads/<kind>/<sha256><ext> from the sharded layout for the
+    public kinds only (by default the ELA images; users' originals are never
+    served unless listed in STORAGE_PUBLIC_KINDS). Legacy flat ELA images
+    still resolve as-is. Every hit counts as a use for the LRU.
+    """
+
+    def __init__(self, manager: StorageManager, kinds: Optional[Sequence[str]] = None, **kwargs):
+        super().__init__(directory=manager.root, **kwargs)
+        self.manager = manager
+        self.kinds = tuple(public_kinds() if kinds is None else kinds)
+
+    def lookup_path(self, path: str):
+        resolved = self.manager.resolve(path, self.kinds)
+        if resolved is None:
+            if "ela" not in self.kinds or not _LEGACY_ELA_NAME.match(path):
+                return "", None
+            resolved = path
+        full_path, stat_result = super().lookup_path(resolved)
+        if stat_result is not None:
+            self.manager.touch(full_path)
+        return full_path, stat_result
+
+
+storage = StorageManager()
@@ -0,0 +1,128 @@
+import numpy as np
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+from app.core.config import settings
+
+
+def budget_bytes() -> int:
+    """Working-memory ceiling for one large-image transform."""
+    return int(settings.IMAGE_MEMORY_BUDGET_MB * 1024 * 1024)
+
+
+def fits_budget(shape: Tuple[int, ...], bytes_per_pixel: float) -> bool:
+    """True when a whole-image pass needing bytes_per_pixel per pixel stays under budget."""
+    return shape[0] * shape[1] * bytes_per_pixel <= budget_bytes()
+
+
+def tile_side(bytes_per_pixel: float, align: int = 1, minimum: int = 64) -> int:
+    """Largest square tile side (a multiple of `align`) whose working set fits the budget."""
+    side = int(np.sqrt(budget_bytes() / float(bytes_per_pixel)))
+    side = max(minimum, side)
+    return max(align, side - side % align)
+
+
+class Tile(NamedTuple):
+    """A core region plus the padded region that has to be read to compute it."""
+    y0: int
+    y1: int
+    x0: int
+    x1: int
+    py0: int
+    py1: int
+    px0: int
+    px1: int
+
+    def crop(self, img: np.ndarray) -> np.ndarray:
+        """View of the padded region."""
+        return img[self.py0:self.py1, self.px0:self.px1]
+
+    def core(self, result: np.ndarray) -> np.ndarray:
+        """The part of a padded-region result that belongs to this tile."""
+        return result[self.y0 - self.py0:self.y1 - self.py0, self.x0 - self.px0:self.x1 - self.px0]
+
+
+def iter_tiles(shape: Tuple[int, ...], side: int, halo: int = 0,
+               rows_only: bool = False, align: int = 1) -> Iterator[Tile]:
+    """
+    Partitions an image into tiles of at most side x side (full-width bands
+    with rows_only), starting on multiples of `align`. Each tile is padded by
+    `halo` pixels of real neighbours, so a filter with that radius gives
+    exactly the whole-image result on the tile's core.
+    """
+    h, w = shape[:2]
+    col_step = w if rows_only else side
+    if rows_only:
+        # Keep roughly side * side pixels per band
+        side = (side * side) // max(w, 1)
+    side = max(align, side - side % align)
+    for y0 in range(0, h, side):
+        y1 = min(h, y0 + side)
+        for x0 in range(0, w, col_step):
+            x1 = min(w, x0 + col_step)
+            yield Tile(y0, y1, x0, x1,
+                       max(0, y0 - halo), min(h, y1 + halo),
+                       max(0, x0 - halo), min(w, x1 + halo))
+
+
+def iter_windows(shape: Tuple[int, ...], side: int, overlap: int = 0) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Equal-sized, possibly overlapping analysis windows (y0, y1, x0, x1) covering
+    the image. The last window in each direction is snapped to the edge so all
+    windows have the same shape, which keeps per-window spectra comparable.
+    """
+    h, w = shape[:2]
+    wh, ww = min(side, h), min(side, w)
+
+    def starts(length, size):
+        step = max(1, size - overlap)
+        positions = list(range(0, length - size + 1, step))
+        if positions[-1] != length - size:
+            positions.append(length - size)
+        return positions
+
+    for y0 in starts(h, wh):
+        for x0 in starts(w, ww):
+            yield y0, y0 + wh, x0, x0 + ww
+
+
+class Moments:
+    """
+    Streaming mean / std / max over many arrays (or pre-computed partial
+    statistics), accumulated in float64 so float32 tiles lose no precision.
+    """
+
+    def __init__(self):
+        self.count = 0.0
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self.max: Optional[float] = None
+
+    def push(self, values: np.ndarray):
+        if values.size == 0:
+            return
+        self.count += values.size
+        self._sum += float(np.sum(values, dtype=np.float64))
+        self._sum_sq += float(np.sum(np.square(values, dtype=np.float64)))
+        self._push_max(float(values.max()))
+
+    def push_stats(self, count: float, mean: float, std: float, maximum: float):
+        """Merges a partial result described by its weight, mean, std and max."""
+        if count <= 0:
+            return
+        self.count += count
+        self._sum += count * mean
+        self._sum_sq += count * (std ** 2 + mean ** 2)
+        self._push_max(maximum)
+
+    @property
+    def mean(self) -> float:
+        return self._sum / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        if not self.count:
+            return 0.0
+        return float(np.sqrt(max(self._sum_sq / self.count - self.mean ** 2, 0.0)))
+
+    def _push_max(self, value: float):
+        self.max = value if self.max is None else max(self.max, value)
@@ -0,0 +1,161 @@
+import hashlib
+import os
+from typing import Dict, List, Optional, Union
+
+import python_multipart
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.media import VIDEO_EXTENSIONS
+from app.core.storage import storage
+
+
+class Upload:
+    """
+    One uploaded file, received straight from the request stream.
+    - Images up to IN_MEMORY_UPLOAD_MAX_BYTES are kept in memory (data) and
+      never touch the disk
+    - Videos, and images past that size, are written through to upload
+      storage as they arrive (path, pinned; release with storage.release)
+    The SHA-256 is computed in the same pass.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.ext = os.path.splitext(filename)[1]
+        self.data: Optional[bytes] = None
+        self.path: Optional[str] = None
+        self.content_hash: Optional[str] = None
+        self.size = 0
+        self._digest = hashlib.sha256()
+        # In-memory chunks; None once the upload goes to disk
+        self._chunks: Optional[List[bytes]] = None if self.is_video else []
+        self._fd: Optional[int] = None
+        self._tmp: Optional[str] = None
+
+    @property
+    def is_video(self) -> bool:
+        return self.ext.lower() in VIDEO_EXTENSIONS
+
+    @property
+    def media(self) -> Union[bytes, str]:
+        """What the orchestrator analyses: the bytes, or the stored original's path."""
+        return self.data if self.data is not None else self.path
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        self._digest.update(chunk)
+        if self._chunks is not None and self.size <= settings.IN_MEMORY_UPLOAD_MAX_BYTES:
+            self._chunks.append(chunk)
+        else:
+            await run_in_threadpool(self._write_through, chunk)
+
+    async def finish(self):
+        self.content_hash = self._digest.hexdigest()
+        if self._chunks is not None:
+            self.data = b"".join(self._chunks)
+            self._chunks = None
+        else:
+            self.path = await run_in_threadpool(self._store)
+
+    def discard(self):
+        """Drops a partly received upload."""
+        self._chunks = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._tmp is not None and os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+    def _write_through(self, chunk: bytes):
+        if self._fd is None:
+            self._fd, self._tmp = storage.temp_file()
+            # Past the in-memory limit: what was held so far goes first
+            for held in self._chunks or ():
+                os.write(self._fd, held)
+            self._chunks = None
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(self._fd, view):]
+
+    def _store(self) -> str:
+        if self._fd is None:
+            self._write_through(b"") # Empty video
+        os.close(self._fd)
+        self._fd = None
+        path = storage.adopt_upload(self._tmp, self.content_hash, self.ext)
+        self._tmp = None
+        return path
+
+
+async def receive_upload(request: Request, field: str = "file") -> Upload:
+    """
+    Reads the file in form field `field` from a multipart/form-data request
+    body as it streams in (other fields are ignored). Raises ValueError for
+    a malformed request or a missing file.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise ValueError("Expected a multipart/form-data upload")
+
+    headers: Dict[bytes, bytes] = {}
+    header = {"field": b"", "value": b""}
+    part = {"upload": None}
+    uploads: List[Upload] = []
+    received: List[bytes] = []
+
+    def on_part_begin():
+        headers.clear()
+        part["upload"] = None
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        headers[header["field"].lower()] = header["value"]
+        header["field"] = header["value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(headers.get(b"content-disposition", b""))
+        if options.get(b"name") == field.encode() and b"filename" in options and not uploads:
+            part["upload"] = Upload(options[b"filename"].decode("utf-8", "replace"))
+            uploads.append(part["upload"])
+
+    def on_part_data(data, start, end):
+        if part["upload"] is not None:
+            received.append(data[start:end])
+
+    parser = python_multipart.MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            # Callbacks are synchronous; the upload may need a thread to write to disk
+            for data in received:
+                await uploads[0].write(data)
+            received.clear()
+        parser.finalize()
+        if not uploads:
+            raise ValueError(f"No file in form field '{field}'")
+        await uploads[0].finish()
+    except FormParserError as e:
+        for upload in uploads:
+            upload.discard()
+        raise ValueError(f"Invalid multipart data: {e}")
+    except BaseException:
+        for upload in uploads:
+            upload.discard()
+        raise
+    return uploads[0]
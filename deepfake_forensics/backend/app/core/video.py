@@ -0,0 +1,235 @@
+import threading
+from collections import deque
+import numpy as np
+from typing import Deque, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.profiling import span
+
+SAMPLING_STRATEGIES = ("first", "uniform", "keyframes")
+
+
+class _Subscription:
+    """One consumer's frame selection, and the frames decoded for it but not read yet."""
+
+    def __init__(self, strategy: str, max_frames: Optional[int], stride: int):
+        self.strategy = strategy
+        self.max_frames = max_frames
+        self.stride = stride
+        self.buffer: Deque[Tuple[int, np.ndarray]] = deque()
+        self.taken = 0 # Frames handed to the buffer (or yielded, when replaying)
+        self.started = False
+        self.closed = False
+        # Overflowed its buffer before it started reading: served by its own pass
+        self.detached = False
+
+    @property
+    def full(self) -> bool:
+        return self.max_frames is not None and self.taken >= self.max_frames
+
+    def wants(self, index: int) -> bool:
+        """Whether frame `index` is selected (keyframes: subject to the frame's flag)."""
+        if self.closed or self.detached or self.full:
+            return False
+        return self.strategy != "uniform" or index % self.stride == 0
+
+
+class FrameSource:
+    """
+    One streaming decoder per video request, read in a single forward pass.
+    - Opens the container once and keeps frame 0 in memory for the
+      single-frame layers
+    - Consumers declare their selection with subscribe() (the orchestrator
+      does so before any layer runs) and read it with frames():
+        "first":     the first N frames
+        "uniform":   N frames spread evenly over the whole clip; frames in
+                     between are skipped with grab() and never converted
+        "keyframes": only frames the demuxer flags as keyframes (falls back
+                     to "uniform" when the backend cannot report them)
+    - The capture never seeks: whichever consumer needs a frame next decodes
+      forward, and every frame another subscriber selected is queued for it.
+      A reading consumer whose queue holds VIDEO_FRAME_BUFFER frames holds the
+      pass back until it catches up.
+    - A subscriber that has not started reading when its queue overflows, or
+      one that subscribes after the pass has moved on, is served by a pass
+      of its own over a second capture (counted in `passes`)
+    """
+
+    def __init__(self, path: str, buffer_frames: Optional[int] = None):
+        import cv2 # Deferred like the rest of the decoding stack; see app.core.media
+        self.path = path
+        self.buffer_frames = max(1, settings.VIDEO_FRAME_BUFFER if buffer_frames is None else buffer_frames)
+        self._cond = threading.Condition()
+        self._cap = cv2.VideoCapture(path)
+        self.is_opened = self._cap.isOpened()
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) if self.is_opened else 0.0
+        self.frame_count = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT)) if self.is_opened else 0
+        self.passes = 1 if self.is_opened else 0
+
+        self._subs: List[_Subscription] = []
+        self._next_index = 0
+        self._decoding = False
+        self._ended = True
+
+        self.first_frame: Optional[np.ndarray] = None
+        self._keyframes_supported = False
+        if self.is_opened:
+            with span("decode"):
+                ret, frame = self._cap.read()
+            if ret:
+                self.first_frame = frame
+                self._next_index = 1
+                self._ended = False
+                # Frame 0 is always a keyframe; a backend that can tell will say so
+                self._keyframes_supported = self._cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) == 1
+
+    def subscribe(self, strategy: str = "first", max_frames: Optional[int] = None) -> _Subscription:
+        """Declares a selection ahead of reading it, so the shared pass keeps its frames."""
+        if strategy == "keyframes" and not self._keyframes_supported:
+            strategy = "uniform"
+        if strategy == "uniform" and self.frame_count <= 0:
+            strategy = "first"
+        stride = 1
+        if strategy == "uniform" and max_frames:
+            stride = max(1, self.frame_count // max_frames)
+
+        sub = _Subscription(strategy, max_frames, stride)
+        with self._cond:
+            if self._next_index > 1:
+                sub.detached = True # The pass is past frames it would select
+            elif self.first_frame is not None and sub.wants(0):
+                sub.buffer.append((0, self.first_frame))
+                sub.taken = 1
+            self._subs.append(sub)
+        return sub
+
+    def frames(self, strategy: str = "first", max_frames: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields (frame_index, BGR frame) pairs; max_frames=None streams the whole clip."""
+        if self.first_frame is None:
+            return
+        sub = self._claim(strategy, max_frames)
+        try:
+            if sub.detached:
+                yield from self._replay(sub)
+                return
+            while True:
+                item = self._take(sub)
+                if item is None:
+                    return
+                yield item
+        finally:
+            with self._cond:
+                sub.closed = True
+                sub.buffer.clear()
+                self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._ended = True
+            self._cap.release()
+            self._cond.notify_all()
+
+    def _claim(self, strategy: str, max_frames: Optional[int]) -> _Subscription:
+        """The declared, unread subscription matching the selection, else a new one."""
+        declared = self.subscribe(strategy, max_frames)
+        with self._cond:
+            self._subs.remove(declared)
+            for sub in self._subs:
+                if (not sub.started and not sub.closed and sub.strategy == declared.strategy
+                        and sub.max_frames == max_frames):
+                    sub.started = True
+                    return sub
+            declared.started = True
+            self._subs.append(declared)
+            return declared
+
+    def _blocked(self) -> bool:
+        """A reading subscriber that wants the next frame has a full queue."""
+        index = self._next_index
+        return any(sub.started and sub.wants(index) and len(sub.buffer) >= self.buffer_frames
+                   for sub in self._subs)
+
+    def _take(self, sub: _Subscription) -> Optional[Tuple[int, np.ndarray]]:
+        """Next selected frame for sub, decoding forward when its queue is empty; None when done."""
+        while True:
+            with self._cond:
+                while True:
+                    if sub.buffer:
+                        item = sub.buffer.popleft()
+                        self._cond.notify_all()
+                        return item
+                    if sub.full or self._ended:
+                        return None
+                    if not self._decoding and not self._blocked():
+                        self._decoding = True
+                        break
+                    self._cond.wait()
+                index = self._next_index
+                wanted = [s for s in self._subs if s.wants(index)]
+            # Only this thread touches the capture until _decoding is cleared
+            frame, is_key = self._advance(wanted)
+            with self._cond:
+                self._decoding = False
+                self._next_index += 1
+                if frame is False:
+                    self._ended = True
+                elif frame is not None:
+                    self._deliver(index, frame, is_key)
+                self._cond.notify_all()
+
+    def _advance(self, wanted: List[_Subscription]):
+        """Reads the next frame: (frame, is_keyframe), (None, _) when skipped, (False, _) at the end."""
+        import cv2
+        with span("decode"):
+            if not self._cap.grab():
+                return False, False
+            is_key = False
+            decode = any(sub.strategy != "keyframes" for sub in wanted)
+            if any(sub.strategy == "keyframes" for sub in wanted):
+                is_key = self._cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) == 1
+                decode = decode or is_key
+            if not decode:
+                return None, is_key
+            ret, frame = self._cap.retrieve()
+            return (frame if ret else False), is_key
+
+    def _deliver(self, index: int, frame: np.ndarray, is_key: bool):
+        for sub in self._subs:
+            if not sub.wants(index) or (sub.strategy == "keyframes" and not is_key):
+                continue
+            sub.buffer.append((index, frame))
+            sub.taken += 1
+            if not sub.started and len(sub.buffer) > self.buffer_frames:
+                # Nobody is reading it yet: give the memory back, it replays later
+                sub.detached = True
+                sub.buffer.clear()
+                sub.taken = 0
+
+    def _replay(self, sub: _Subscription) -> Iterator[Tuple[int, np.ndarray]]:
+        """Serves a detached subscriber from a capture of its own, from the start."""
+        import cv2
+        cap = cv2.VideoCapture(self.path)
+        with self._cond:
+            self.passes += 1
+        sub.detached = False
+        sub.taken = 0
+        try:
+            index = 0
+            while not sub.full:
+                with span("decode"):
+                    if not cap.grab():
+                        return
+                    wanted = sub.wants(index)
+                    if wanted and sub.strategy == "keyframes":
+                        wanted = cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) == 1
+                    frame = None
+                    if wanted:
+                        ret, frame = cap.retrieve()
+                        if not ret:
+                            return
+                if wanted:
+                    sub.taken += 1
+                    yield index, frame
+                index += 1
+        finally:
+            cap.release()
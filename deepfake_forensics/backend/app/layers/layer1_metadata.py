@@ -1,8 +1,27 @@
+import importlib
 import os
 import json
 import exifread
 import magic
-from typing import Dict, Any
+from typing import Dict, Any, Union
+from app.core.media import MediaContext
+
+# Result of the one attempt per process to import c2pa: the module, or the ImportError
+_c2pa = None
+
+
+def _load_c2pa():
+    """Imports c2pa once per process; a missing library is remembered too."""
+    global _c2pa
+    if _c2pa is None:
+        try:
+            _c2pa = importlib.import_module("c2pa")
+        except ImportError as e:
+            _c2pa = e
+    if isinstance(_c2pa, ImportError):
+        raise _c2pa
+    return _c2pa
+
 
 class MetadataAnalyzer:
     """
@@ -13,23 +32,27 @@ class MetadataAnalyzer:
     - File tampering heuristics
     """
 
-    def analyze(self, file_path: str) -> Dict[str, Any]:
+    def analyze(self, media: Union[MediaContext, str]) -> Dict[str, Any]:
+        ctx = MediaContext.of(media)
         results = {
             "score": 0.0,
             "details": {},
             "anomalies": []
         }
         
-        if not os.path.exists(file_path):
+        if ctx.data is None and not os.path.exists(ctx.file_path):
             results["anomalies"].append("File not found")
             return results
 
         # 1. File Header Analysis (Magic numbers)
-        mime_type = magic.from_file(file_path, mime=True)
+        if ctx.data is not None:
+            mime_type = magic.from_buffer(bytes(ctx.data[:2048]), mime=True)
+        else:
+            mime_type = magic.from_file(ctx.file_path, mime=True)
         results["details"]["mime_type"] = mime_type
         
         # 2. EXIF Analysis
-        exif_data = self._get_exif_data(file_path)
+        exif_data = self._get_exif_data(ctx)
         results["details"]["exif_count"] = len(exif_data)
         
         # Check for missing metadata (common in AI generation)
@@ -51,7 +74,7 @@ class MetadataAnalyzer:
         # 3. C2PA / Content Credentials (Stub)
         # Real implementation would use a library like c2pa-python
         # 3. C2PA / Content Credentials
-        c2pa_result = self._check_c2pa(file_path)
+        c2pa_result = self._check_c2pa(ctx)
         results["details"]["c2pa"] = c2pa_result
         
         if c2pa_result.get("verified"):
@@ -67,15 +90,15 @@ class MetadataAnalyzer:
         
         return results
 
-    def _get_exif_data(self, file_path: str) -> Dict[str, Any]:
+    def _get_exif_data(self, ctx: MediaContext) -> Dict[str, Any]:
         try:
-            with open(file_path, 'rb') as f:
+            with ctx.open_stream() as f:
                 tags = exifread.process_file(f)
                 return tags
         except Exception as e:
             return {}
 
-    def _check_c2pa(self, file_path: str) -> Dict[str, Any]:
+    def _check_c2pa(self, ctx: MediaContext) -> Dict[str, Any]:
         """
         Verifies C2PA Content Credentials.
         Returns a dictionary with status and details.
@@ -83,11 +106,13 @@ class MetadataAnalyzer:
         try:
             # Attempt to read C2PA manifest
             # Note: c2pa-python API might vary, using standard pattern
-            import c2pa
+            c2pa = _load_c2pa()
             
             # Create a reader
             try:
-                manifest = c2pa.read_file(file_path)
+                # c2pa reads from a path; in-memory uploads get a scoped one
+                with ctx.scoped_path() as path:
+                    manifest = c2pa.read_file(path)
                 if manifest:
                     return {
                         "verified": True,
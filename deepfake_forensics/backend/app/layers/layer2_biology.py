@@ -1,6 +1,179 @@
 import cv2
 import numpy as np
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Union
+from app.core.config import settings
+from app.core.media import MediaContext
+from app.core.profiling import span
+
+class FaceTracker:
+    """
+    Detect-then-track face ROI for video streams.
+    - Runs the Haar detector on a downscaled frame every `detect_interval`
+      frames, or as soon as tracking is lost
+    - In between, follows the face with normalized template matching inside
+      a small search window around the previous box (also downscaled)
+    - Returns boxes in full-resolution frame coordinates
+    """
+
+    def __init__(self, face_cascade, detect_interval: int = 10, max_side: int = 320,
+                 min_match: float = 0.6, search_margin: float = 0.5):
+        self.face_cascade = face_cascade
+        self.detect_interval = max(1, detect_interval)
+        self.max_side = max_side
+        self.min_match = min_match
+        self.search_margin = search_margin
+        self.detections = 0
+        self._box: Optional[Tuple[int, int, int, int]] = None # In downscaled coordinates
+        self._template: Optional[np.ndarray] = None
+        self._since_detect = 0
+
+    def update(self, frame: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.max_side / float(max(h, w)))
+        small = frame if scale == 1.0 else cv2.resize(
+            frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA
+        )
+        small_gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        tracked = self._box is not None and self._track(small_gray)
+        if not tracked or self._since_detect >= self.detect_interval:
+            # A periodic re-detection that finds nothing keeps a still-valid track
+            if not self._detect(small_gray) and not tracked:
+                self._box = None
+                self._template = None
+
+        if self._box is None:
+            return None
+        x, y, bw, bh = self._box
+        return (int(x / scale), int(y / scale), int(bw / scale), int(bh / scale))
+
+    def _detect(self, small_gray: np.ndarray) -> bool:
+        self.detections += 1
+        self._since_detect = 0
+        with span("face_detection"):
+            faces = self.face_cascade.detectMultiScale(small_gray, 1.3, 5)
+        if len(faces) == 0:
+            return False
+        x, y, w, h = (int(v) for v in faces[0])
+        self._box = (x, y, w, h)
+        self._template = small_gray[y:y+h, x:x+w].copy()
+        return True
+
+    def _track(self, small_gray: np.ndarray) -> bool:
+        self._since_detect += 1
+        x, y, w, h = self._box
+        mx, my = int(w * self.search_margin), int(h * self.search_margin)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(small_gray.shape[1], x + w + mx), min(small_gray.shape[0], y + h + my)
+        window = small_gray[y0:y1, x0:x1]
+        if window.shape[0] < h or window.shape[1] < w:
+            return False
+
+        match = cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (bx, by) = cv2.minMaxLoc(match)
+        if best < self.min_match:
+            return False
+        self._box = (x0 + bx, y0 + by, w, h)
+        return True
+
+class RunningStats:
+    """Welford running mean / population std in O(1) memory."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def push(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self._m2 / self.count)) if self.count else 0.0
+
+class RPPGEstimator:
+    """
+    Streaming rPPG estimator with constant memory.
+    - push() one green-channel ROI mean per frame that contains a face
+    - Keeps only the last `window_seconds` of samples in a ring buffer
+    - Every `hop_seconds`, resamples the window onto a uniform grid,
+      detrends it and takes a Welch spectrum; the strongest peak in the
+      0.7-4 Hz band is that window's heart-rate estimate
+    - Summaries (signal std, heart-rate mean/std, pulse SNR) are running
+      statistics, so video length does not change memory use
+    """
+
+    BAND_HZ = (0.7, 4.0)
+
+    def __init__(self, fps: float, window_seconds: float = 10.0, hop_seconds: float = 1.0):
+        self.fps = fps if fps and fps > 0 else 30.0
+        self.window_seconds = window_seconds
+        self.hop_seconds = hop_seconds
+        capacity = int(np.ceil(window_seconds * self.fps)) + 1
+        self._times = np.zeros(capacity)
+        self._values = np.zeros(capacity)
+        self._size = 0
+        self._head = 0
+        self._next_window_end = None
+
+        self.signal = RunningStats()
+        self.heart_rate = RunningStats()
+        self.snr = RunningStats()
+
+    def push(self, t: float, value: float):
+        self.signal.push(value)
+        self._times[self._head] = t
+        self._values[self._head] = value
+        self._head = (self._head + 1) % len(self._times)
+        self._size = min(self._size + 1, len(self._times))
+
+        if self._next_window_end is None:
+            self._next_window_end = t + self.window_seconds - 1.0 / self.fps
+        if t >= self._next_window_end:
+            self._analyze_window()
+            self._next_window_end = t + self.hop_seconds
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "samples": self.signal.count,
+            "windows": self.heart_rate.count,
+            "heart_rate_bpm": round(self.heart_rate.mean, 2) if self.heart_rate.count else None,
+            "heart_rate_std_bpm": round(self.heart_rate.std, 2) if self.heart_rate.count else None,
+            "pulse_snr": round(self.snr.mean, 3) if self.snr.count else None,
+        }
+
+    def _window(self) -> Tuple[np.ndarray, np.ndarray]:
+        order = (np.arange(self._size) + self._head - self._size) % len(self._times)
+        return self._times[order], self._values[order]
+
+    def _analyze_window(self):
+        from scipy import signal
+
+        times, values = self._window()
+        # Sampling may be strided or have gaps where no face was found
+        fs = 1.0 / np.median(np.diff(times)) if len(times) > 1 else 0.0
+        if fs < 2 * self.BAND_HZ[1]:
+            return # Too sparse to resolve the pulse band
+        grid = np.arange(times[0], times[-1], 1.0 / fs)
+        if len(grid) < 2 * fs:
+            return
+        detrended = signal.detrend(np.interp(grid, times, values))
+
+        nperseg = min(len(detrended), int(4 * fs))
+        # Zero-padding to 60 s puts the frequency grid at 1 bpm
+        freqs, power = signal.welch(detrended, fs=fs, nperseg=nperseg, nfft=max(nperseg, int(60 * fs)))
+        band = (freqs >= self.BAND_HZ[0]) & (freqs <= self.BAND_HZ[1])
+        band_power = power[band]
+        if band_power.size == 0 or band_power.sum() <= 0:
+            return
+        peak = int(np.argmax(band_power))
+        self.heart_rate.push(float(freqs[band][peak] * 60.0))
+        # Share of band power within +/-0.1 Hz of the peak
+        near = np.abs(freqs[band] - freqs[band][peak]) <= 0.1
+        self.snr.push(float(band_power[near].sum() / band_power.sum()))
 
 class BiologicalAnalyzer:
     """
@@ -16,7 +189,7 @@ class BiologicalAnalyzer:
         # In a real deployment, use a better detector like MTCNN or RetinaFace
         self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
 
-    def analyze_video(self, video_path: str) -> Dict[str, Any]:
+    def analyze_video(self, media: Union[MediaContext, str]) -> Dict[str, Any]:
         """
         Analyzes a video for biological signals.
         For images, this is less effective but can check for skin tone consistency.
@@ -27,27 +200,39 @@ class BiologicalAnalyzer:
             "anomalies": []
         }
         
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
+        # Shared single-pass decoder; frame 0 is already in memory
+        source = MediaContext.of(media).video
+        if not source.is_opened:
             results["anomalies"].append("Could not open video file")
             return results
 
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
-        # Analyze a subset of frames for efficiency
-        max_frames = 300
-        frames_to_read = min(frame_count, max_frames)
+        fps = source.fps
         
-        green_signals = []
+        # Analyze a subset of frames for efficiency (0 = whole clip)
+        max_frames = settings.VIDEO_MAX_FRAMES or None
+        tracker = None
+        if settings.FACE_ROI_MODE == "track":
+            tracker = FaceTracker(
+                self.face_cascade,
+                detect_interval=settings.FACE_DETECT_INTERVAL,
+                max_side=settings.FACE_DETECT_MAX_SIDE
+            )
+        estimator = RPPGEstimator(
+            fps,
+            window_seconds=settings.RPPG_WINDOW_SECONDS,
+            hop_seconds=settings.RPPG_HOP_SECONDS
+        )
+        frame_fps = fps if fps > 0 else 30.0
         
-        for i in range(frames_to_read):
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+        for i, frame in source.frames(settings.VIDEO_SAMPLING_STRATEGY, max_frames):
+            if tracker is not None:
+                box = tracker.update(frame)
+                faces = [box] if box is not None else []
+            else:
+                with span("color_conversion"):
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                with span("face_detection"):
+                    faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
             
             if len(faces) > 0:
                 # Take the first face
@@ -58,23 +243,17 @@ class BiologicalAnalyzer:
                 # Extract Green channel average
                 # Green channel contains strongest PPG signal
                 g_mean = np.mean(roi[:, :, 1])
-                green_signals.append(g_mean)
-            else:
-                green_signals.append(0)
-
-        cap.release()
+                if g_mean > 0:
+                    estimator.push(i / frame_fps, float(g_mean))
         
         # Analyze the signal
-        green_signals = np.array(green_signals)
-        # Remove zeros (no face detected)
-        green_signals = green_signals[green_signals > 0]
-        
-        if len(green_signals) < 30:
+        summary = estimator.summary()
+        if summary["samples"] < 30:
             results["anomalies"].append("Insufficient face data for rPPG")
             return results
 
         # Calculate variance/std dev
-        std_dev = np.std(green_signals)
+        std_dev = estimator.signal.std
         
         # AI generated videos often have very low temporal variance in skin tone (flatline)
         # Real videos have micro-fluctuations due to blood flow
@@ -87,12 +266,15 @@ class BiologicalAnalyzer:
             results["anomalies"].append("Excessive noise in skin tone")
             # Could be lighting changes, not necessarily fake, but suspicious
         
-        # FFT of the signal to find heart rate peak
-        # (Skipping full implementation for brevity, but this is where 1.0-1.6Hz check goes)
+        # Windowed spectra of the signal to track the heart rate peak (0.7-4 Hz)
+        results["details"].update(summary)
+        if summary["windows"] and summary["pulse_snr"] < settings.RPPG_MIN_PULSE_SNR:
+            results["anomalies"].append("No dominant pulse frequency in the 0.7-4 Hz band")
+            results["score"] = min(results["score"] + 0.2, 1.0)
         
         return results
 
-    def analyze_image(self, image_path: str) -> Dict[str, Any]:
+    def analyze_image(self, media: Union[MediaContext, str]) -> Dict[str, Any]:
         """
         For single images, we can't do rPPG, but we can check for biological plausibility
         like skin texture and eye consistency.
@@ -103,12 +285,12 @@ class BiologicalAnalyzer:
             "anomalies": []
         }
         
-        img = cv2.imread(image_path)
-        if img is None:
+        gray = MediaContext.of(media).gray
+        if gray is None:
             return results
             
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+        with span("face_detection"):
+            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
         
         if len(faces) == 0:
             results["details"]["faces_found"] = 0
@@ -1,7 +1,101 @@
+import logging
+
 import cv2
 import numpy as np
-import scipy.fftpack
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple, Union
+from app.core.config import settings
+from app.core.media import MediaContext
+from app.core.spectral import SPECTRUM_BYTES_PER_PIXEL, tiled_high_pass_stats
+from app.core.tiling import fits_budget, iter_tiles, tile_side
+
+logger = logging.getLogger(__name__)
+
+try:
+    import jpeglib
+    HAS_JPEGLIB = True
+except ImportError:
+    HAS_JPEGLIB = False
+
+# Orthonormal 8-point DCT-II basis; D @ block @ D.T matches the JPEG forward DCT
+_DCT_MATRIX = np.array([
+    [(np.sqrt(1 / 8) if u == 0 else np.sqrt(2 / 8)) * np.cos((2 * x + 1) * u * np.pi / 16) for x in range(8)]
+    for u in range(8)
+], dtype=np.float32)
+
+# Low-frequency AC positions (row, col) where double-quantization traces are strongest
+_DQ_POSITIONS = ((0, 1), (1, 0), (1, 1), (0, 2), (2, 0), (1, 2), (2, 1), (2, 2), (0, 3), (3, 0))
+_DQ_HIST_BINS = 40
+# float32 blocks, two matmul results and the rounded coefficients
+_BLOCK_DCT_BYTES_PER_PIXEL = 20
+# A position is only judged with enough coefficients around the predicted gaps
+_DQ_MIN_EXPECTED = 20
+# Gap strength of single-compressed images stays below ~0.1; double
+# compression (second quality higher than the first) leaves ~0.8-0.95
+_DQ_STRENGTH_FLOOR = 0.2
+_DQ_STRENGTH_SPAN = 0.4
+
+# Non-JPEG input: candidate steps of an earlier JPEG quantization, blocks
+# sampled at most, and the working set per pixel (steps x positions per block)
+_GRID_STEPS = np.arange(2, 33, dtype=np.float32)
+_GRID_MAX_BLOCKS = 16384
+_GRID_BYTES_PER_PIXEL = 100
+# A position is only judged with enough coefficients away from zero
+_GRID_MIN_COEFFS = 100
+# Phase concentration of never-compressed pixels stays around 0.15; pixels
+# from a JPEG (quality 90 or lower) saved losslessly reach 0.65-0.95
+_GRID_FLOOR = 0.3
+_GRID_SPAN = 0.3
+
+# Row-major index of each entry of a DQT segment (stored in zigzag order)
+_ZIGZAG = np.array([r * 8 + c for r, c in sorted(
+    ((r, c) for r in range(8) for c in range(8)),
+    key=lambda p: (p[0] + p[1], p[1] if (p[0] + p[1]) % 2 == 0 else p[0])
+)])
+
+# IJG standard luminance table (quality 50), for quality estimates
+_STD_LUMA_QT = np.array([
+    [16, 11, 10, 16, 24, 40, 51, 61],
+    [12, 12, 14, 19, 26, 58, 60, 55],
+    [14, 13, 16, 24, 40, 57, 69, 56],
+    [14, 17, 22, 29, 51, 87, 80, 62],
+    [18, 22, 37, 56, 68, 109, 103, 77],
+    [24, 35, 55, 64, 81, 104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99],
+], dtype=np.float64)
+
+def _read_luma_qtable(stream) -> Optional[np.ndarray]:
+    """
+    Luminance quantization table (8x8, row-major) from a JPEG header, read
+    marker by marker up to the first scan; None when not a baseline JPEG.
+    """
+    if stream.read(2) != b"\xff\xd8":
+        return None
+    tables: Dict[int, np.ndarray] = {}
+    while True:
+        marker = stream.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            break
+        if marker[1] == 0xDA: # Start of scan: every table has been seen
+            break
+        length = int.from_bytes(stream.read(2), "big")
+        segment = stream.read(length - 2)
+        if marker[1] != 0xDB:
+            continue
+        i = 0
+        while i < len(segment):
+            precision, table_id = segment[i] >> 4, segment[i] & 0x0F
+            size = 128 if precision else 64
+            values = np.frombuffer(segment[i + 1:i + 1 + size], dtype=">u2" if precision else np.uint8)
+            if len(values) != 64:
+                return None
+            table = np.empty(64, dtype=np.int64)
+            table[_ZIGZAG] = values
+            tables[table_id] = table.reshape(8, 8)
+            i += 1 + size
+    # Encoders put the luminance table first, as table 0
+    return tables.get(0)
+
 
 class MathAnalyzer:
     """
@@ -12,29 +106,29 @@ class MathAnalyzer:
     - 3D. Noise Residual Extraction (BayarConv stub)
     """
 
-    def analyze(self, image_path: str) -> Dict[str, Any]:
+    def analyze(self, media: Union[MediaContext, str]) -> Dict[str, Any]:
         results = {
             "score": 0.0,
             "details": {},
             "anomalies": []
         }
         
-        img = cv2.imread(image_path)
+        ctx = MediaContext.of(media)
+        img = ctx.bgr
         if img is None:
             return results
-            
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
         # 3A. FFT Analysis
-        fft_score = self._analyze_fft(gray)
+        fft_score = self._analyze_fft(ctx)
         results["details"]["fft_score"] = fft_score
         if fft_score > 0.7:
             results["anomalies"].append("Strong periodic artifacts in FFT (Grid patterns)")
             results["score"] += 0.4
 
         # 3B. DCT Analysis
-        dct_score = self._analyze_dct(gray)
+        dct_score, dct_details = self._analyze_dct(ctx)
         results["details"]["dct_score"] = dct_score
+        results["details"].update(dct_details)
         if dct_score > 0.6:
              results["anomalies"].append("Abnormal DCT coefficient distribution")
              results["score"] += 0.3
@@ -52,24 +146,20 @@ class MathAnalyzer:
         
         return results
 
-    def _analyze_fft(self, gray_img: np.ndarray) -> float:
+    def _analyze_fft(self, ctx: MediaContext) -> float:
         """
         Detects checkerboard artifacts and grid patterns using FFT.
+        The spectrum is shared with Layer 6 through the media context; images
+        too large for the memory budget are transformed in tiles instead.
         """
-        f = np.fft.fft2(gray_img)
-        fshift = np.fft.fftshift(f)
-        magnitude_spectrum = 20 * np.log(np.abs(fshift) + 1e-8)
-        
-        # Calculate average magnitude in high frequency regions
-        h, w = magnitude_spectrum.shape
-        center_h, center_w = h // 2, w // 2
-        
-        # Mask out the center (low frequencies)
+        # Calculate average magnitude in high frequency regions,
+        # masking out the center (low frequencies)
         mask_radius = 20
-        y, x = np.ogrid[:h, :w]
-        mask = (x - center_w)**2 + (y - center_h)**2 > mask_radius**2
-        
-        high_freq_energy = np.mean(magnitude_spectrum[mask])
+        gray = ctx.gray
+        if fits_budget(gray.shape, SPECTRUM_BYTES_PER_PIXEL):
+            high_freq_energy = ctx.spectrum().high_pass_stats(mask_radius, eps=1e-8)["mean"]
+        else:
+            high_freq_energy = tiled_high_pass_stats(gray, mask_radius, eps=1e-8)["mean"]
         
         # Simple heuristic: AI images often have unusually high energy spikes in high freq
         # A more robust method checks for specific peaks (stars)
@@ -78,31 +168,185 @@ class MathAnalyzer:
         score = min(high_freq_energy / 100.0, 1.0) 
         return score
 
-    def _analyze_dct(self, gray_img: np.ndarray) -> float:
+    def _analyze_dct(self, ctx: MediaContext) -> Tuple[float, Dict[str, Any]]:
+        """
+        Looks for double quantization in the 8x8 block DCT coefficients of a JPEG.
+        - Quantized coefficients and tables are read straight from the
+          bitstream (jpeglib), no pixel decode / re-DCT; in-memory uploads
+          are handed to it as an anonymous memory file
+        - Without jpeglib (or when it fails) the table is parsed from the
+          header and the decoded pixels are transformed and divided by it again
+        A JPEG first saved with a coarser step q1 and then with step q2 can
+        only hold the coefficient values round(k * q1 / q2): the others stay
+        (nearly) empty. For each low-frequency position the primary step q1
+        whose predicted gaps are emptiest is estimated; the score is the
+        median emptiness of those gaps. Resaving at a lower quality
+        (q1 < q2) leaves no gaps and is not detected.
+        Other images go to _analyze_block_grid().
+        """
+        details: Dict[str, Any] = {}
+        source = self._jpeg_coefficient_histograms(ctx)
+        if source is None:
+            return self._analyze_block_grid(ctx)
+        hists, qtable, details["dct_source"] = source
+        details["jpeg_quality_estimate"] = self._estimate_quality(qtable)
+
+        strengths, primary = [], []
+        for hist, (row, col) in zip(hists, _DQ_POSITIONS):
+            q2 = int(qtable[row, col])
+            best = max(((self._gap_strength(hist, q2, q1), q1) for q1 in range(q2 + 1, 4 * q2 + 8)),
+                       key=lambda item: -1.0 if item[0] is None else item[0])
+            if best[0] is not None:
+                strengths.append(best[0])
+                primary.append((row, col, best[1]))
+        if not strengths:
+            return 0.0, details
+
+        strength = float(np.median(strengths))
+        details["dq_gap_strength"] = round(strength, 4)
+        if strength > _DQ_STRENGTH_FLOOR:
+            # Median: a position may lock onto a multiple of its true primary step
+            scale = 100.0 * float(np.median([q1 / _STD_LUMA_QT[r, c] for r, c, q1 in primary]))
+            details["primary_quality_estimate"] = self._quality_from_scale(scale)
+        score = float(np.clip((strength - _DQ_STRENGTH_FLOOR) / _DQ_STRENGTH_SPAN, 0.0, 1.0))
+        return score, details
+
+    def _jpeg_coefficient_histograms(self, ctx: MediaContext) -> Optional[Tuple[np.ndarray, np.ndarray, str]]:
+        """(histograms per _DQ_POSITIONS, luminance table, source), or None when not a JPEG."""
+        if ctx.data is None and not ctx.file_path:
+            return None # Already-decoded frame (e.g. from a video)
+        with ctx.open_stream() as f:
+            qtable = _read_luma_qtable(f)
+        if qtable is None:
+            return None
+
+        if HAS_JPEGLIB and settings.JPEG_COMPRESSED_DOMAIN:
+            try:
+                with ctx.scoped_path() as path:
+                    jpeg = jpeglib.read_dct(path)
+                    blocks = jpeg.Y.reshape(-1, 8, 8)
+                    if jpeg.qt is not None:
+                        qtable = np.asarray(jpeg.qt[jpeg.quant_tbl_no[0]])
+                return self._coefficient_histograms(blocks), qtable, "jpeg_coefficients"
+            except Exception:
+                logger.warning("JPEG coefficient read failed, using pixels", exc_info=True)
+
+        gray = ctx.gray
+        if gray is None:
+            return None
+        # Full-width bands of whole block rows keep the float32 working set bounded
+        side = tile_side(_BLOCK_DCT_BYTES_PER_PIXEL, align=8)
+        step = qtable.astype(np.float32)
+        hists = sum(
+            self._coefficient_histograms(np.rint(self._block_dct(tile.crop(gray)) / step).astype(np.int32))
+            for tile in iter_tiles(gray.shape, side, rows_only=True, align=8)
+        )
+        return hists, qtable, "pixels_requantized"
+
+    def _analyze_block_grid(self, ctx: MediaContext) -> Tuple[float, Dict[str, Any]]:
         """
-        Analyzes DCT coefficients for double quantization or abnormal distributions.
+        Non-JPEG uploads (PNG, WebP, ...): vectorized block DCT of the decoded
+        gray image. Pixels that were a JPEG before being saved losslessly keep
+        their coefficients near multiples of the old quantization steps. For
+        each low-frequency position, the step in _GRID_STEPS the coefficients
+        concentrate on (phase concentration |mean(exp(2 pi i c / q))|, over
+        coefficients at least q / 2 from zero) is found; the score is the
+        median concentration. Decoded video frames always carry their codec's
+        traces and are not scored.
         """
-        # Resize to be divisible by 8
+        details: Dict[str, Any] = {"dct_source": "pixels_block_dct"}
+        if ctx.data is None and not ctx.file_path:
+            details["dct_source"] = "decoded_frame"
+            return 0.0, details
+        gray = ctx.gray
+        if gray is None:
+            return 0.0, details
+
+        rows, cols = zip(*_DQ_POSITIONS)
+        steps = _GRID_STEPS[:, None, None]
+        sums = np.zeros((len(_GRID_STEPS), len(_DQ_POSITIONS)), np.complex128)
+        counts = np.zeros(sums.shape, np.int64)
+        # Every stride-th block: the statistic needs thousands of blocks, not millions
+        n_blocks = (gray.shape[0] // 8) * (gray.shape[1] // 8)
+        stride = max(1, -(-n_blocks // _GRID_MAX_BLOCKS))
+        side = tile_side(_GRID_BYTES_PER_PIXEL, align=8)
+        for tile in iter_tiles(gray.shape, side, rows_only=True, align=8):
+            coeffs = self._block_dct(tile.crop(gray))[::stride][:, rows, cols] # (N, positions)
+            used = np.abs(coeffs)[None] >= steps / 2 # (steps, N, positions)
+            phase = coeffs[None] * (2 * np.pi / steps)
+            sums += np.where(used, np.cos(phase), 0.0).sum(axis=1) + 1j * np.where(used, np.sin(phase), 0.0).sum(axis=1)
+            counts += used.sum(axis=1)
+
+        valid = counts >= _GRID_MIN_COEFFS
+        concentration = np.where(valid, np.abs(sums) / np.maximum(counts, 1), 0.0)
+        judged = valid.any(axis=0)
+        if not judged.any():
+            return 0.0, details
+        strength = float(np.median(concentration.max(axis=0)[judged]))
+        details["dct_grid_concentration"] = round(strength, 4)
+        if strength > _GRID_FLOOR:
+            best = _GRID_STEPS[concentration.argmax(axis=0)]
+            scale = 100.0 * float(np.median([q / _STD_LUMA_QT[r, c]
+                                             for q, (r, c), ok in zip(best, _DQ_POSITIONS, judged) if ok]))
+            details["prior_jpeg_quality_estimate"] = self._quality_from_scale(scale)
+        score = float(np.clip((strength - _GRID_FLOOR) / _GRID_SPAN, 0.0, 1.0))
+        return score, details
+
+    def _block_dct(self, gray_img: np.ndarray) -> np.ndarray:
+        """Orthonormal DCT of every 8x8 block, as JPEG would compute it: (N, 8, 8)."""
         h, w = gray_img.shape
         h = (h // 8) * 8
         w = (w // 8) * 8
-        gray_img = gray_img[:h, :w]
-        
-        # Compute block-wise DCT
-        # This is a simplified global DCT check
-        dct = cv2.dct(np.float32(gray_img)/255.0)
-        
-        # Check histogram of coefficients
-        # AI images might have different kurtosis in DCT space
-        # Here we use a placeholder logic: check for sparsity
-        # Real images are sparse in DCT, AI might be less so or have specific artifacts
-        
-        abs_dct = np.abs(dct)
-        mean_energy = np.mean(abs_dct)
-        
-        # Very rough heuristic
-        score = 0.5 # Neutral by default
-        return score
+        blocks = gray_img[:h, :w].astype(np.float32) - 128.0
+        blocks = blocks.reshape(h // 8, 8, w // 8, 8).swapaxes(1, 2).reshape(-1, 8, 8)
+        return _DCT_MATRIX @ blocks @ _DCT_MATRIX.T
+
+    def _coefficient_histograms(self, blocks: np.ndarray) -> np.ndarray:
+        """Counts of |coefficient| = 0.._DQ_HIST_BINS at each of _DQ_POSITIONS."""
+        n_bins = _DQ_HIST_BINS + 2
+        rows, cols = zip(*_DQ_POSITIONS)
+        values = np.minimum(np.abs(blocks[:, rows, cols].astype(np.int32)), n_bins - 1).astype(np.intp)
+        # One bincount for all positions: offset each position into its own bin range
+        offsets = np.arange(len(_DQ_POSITIONS)) * n_bins
+        hists = np.bincount((values + offsets).ravel(), minlength=n_bins * len(_DQ_POSITIONS))
+        return hists.reshape(len(_DQ_POSITIONS), n_bins)[:, :_DQ_HIST_BINS + 1]
+
+    @staticmethod
+    def _gap_strength(hist: np.ndarray, q2: int, q1: int) -> Optional[float]:
+        """
+        How empty the values a q1-then-q2 quantization cannot produce are,
+        against their reachable neighbours: 1 = empty, 0 = as full as the
+        neighbours. None when the histogram is too sparse to tell.
+        """
+        counts = np.asarray(hist[1:], dtype=np.float64)
+        values = np.arange(1, len(counts) + 1)
+        k = np.arange(int(np.ceil((len(counts) + 1) * q2 / q1)) + 2)
+        filled = np.isin(values, np.floor(k * q1 / q2 + 0.5))
+        populated = values[counts >= 5]
+        in_range = values <= (populated.max() if len(populated) else 0)
+        gaps = np.flatnonzero(~filled & in_range)
+        if len(gaps) < 2 or np.count_nonzero(filled & in_range) < 3:
+            return None
+
+        expected = 0.0
+        for i in gaps:
+            neighbours = [counts[j] for j in (i - 1, i + 1) if 0 <= j < len(counts) and filled[j]]
+            expected += np.mean(neighbours) if neighbours else 0.0
+        if expected < _DQ_MIN_EXPECTED:
+            return None
+        return 1.0 - min(counts[gaps].sum() / expected, 1.0)
+
+    def _estimate_quality(self, qtable: Optional[np.ndarray]) -> Optional[int]:
+        """IJG quality factor that best explains the luminance table."""
+        if qtable is None:
+            return None
+        return self._quality_from_scale(100.0 * float(np.mean(qtable / _STD_LUMA_QT)))
+
+    @staticmethod
+    def _quality_from_scale(scale: float) -> int:
+        """Inverse of the IJG quality scaling (table = standard table * scale / 100)."""
+        quality = (200.0 - scale) / 2.0 if scale <= 100.0 else 5000.0 / scale
+        return int(np.clip(round(quality), 1, 100))
 
     def _analyze_cfa(self, img: np.ndarray) -> float:
         """
@@ -1,5 +1,17 @@
+import logging
+import os
+import threading
+import time
+import warnings
 import cv2
 import numpy as np
+from typing import Dict, Any, Iterator, List, Optional, Sequence
+from app.core.config import settings
+from app.core.batching import DynamicBatcher
+from app.core.media import MediaContext
+from app.core.profiling import span
+
+logger = logging.getLogger(__name__)
 
 try:
     import torch
@@ -14,11 +26,11 @@ if HAS_TORCH:
         """
         Layer 4: Hybrid AI Model (CNN + Transformer)
         """
-        def __init__(self):
+        def __init__(self, pretrained: bool = False):
             super(HybridForensicsModel, self).__init__()
             
-            # Branch A: CNN
-            resnet = models.resnet50(pretrained=True)
+            # Branch A: CNN (ImageNet weights are only downloaded when asked for)
+            resnet = models.resnet50(weights=models.ResNet50_Weights.IMAGENET1K_V1 if pretrained else None)
             self.cnn_features = nn.Sequential(*list(resnet.children())[:-1]) # Remove FC
             self.cnn_dim = 2048
             
@@ -45,54 +57,299 @@ if HAS_TORCH:
             output = self.fusion(combined)
             return output
 
+# Position of each torchvision ResNet block inside HybridForensicsModel.cnn_features
+_RESNET_FEATURE_INDEX = {"conv1": 0, "bn1": 1, "layer1": 4, "layer2": 5, "layer3": 6, "layer4": 7}
+
+def _load_state_dict(path: str) -> Dict[str, Any]:
+    """Reads a checkpoint on CPU, memory-mapped when the file format allows it."""
+    try:
+        return torch.load(path, map_location="cpu", weights_only=True, mmap=True)
+    except RuntimeError:
+        # Legacy (non-zipfile) checkpoints cannot be memory-mapped
+        return torch.load(path, map_location="cpu", weights_only=True)
+
+def _to_model_keys(state_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Accepts a HybridForensicsModel checkpoint or a plain torchvision ResNet-50 one."""
+    if any(key.startswith(("cnn_features.", "fusion.")) for key in state_dict):
+        return state_dict
+    mapped = {}
+    for key, value in state_dict.items():
+        block, _, rest = key.partition(".")
+        if block in _RESNET_FEATURE_INDEX:
+            mapped[f"cnn_features.{_RESNET_FEATURE_INDEX[block]}.{rest}"] = value
+    return mapped
+
+# Model input: RGB, 224 x 224, normalized with the ImageNet statistics
+INPUT_SIZE = 224
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# Images used to calibrate the static int8 backbone
+_CALIBRATION_IMAGES = 8
+_CALIBRATION_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+QUANTIZATION_MODES = ("none", "head", "full")
+
 class AIModelAnalyzer:
-    def __init__(self):
+    """
+    Layer 4 entry point. The network is not built until it is first needed
+    (or warmup() is called): weights come from settings.MODEL_WEIGHTS_PATH,
+    memory-mapped where possible, and are never downloaded unless
+    MODEL_ALLOW_DOWNLOAD is set.
+    - With a trained checkpoint, tensors are scored by the network under
+      torch.inference_mode, in channels-last layout, optionally quantized to
+      int8 (MODEL_QUANTIZATION)
+    - Without torch or trained weights, images are scored by blur/entropy
+      heuristics instead; an untrained network would return random scores
+    """
+
+    def __init__(self, quantization: str = None):
+        self.quantization = quantization or settings.MODEL_QUANTIZATION
+        if self.quantization not in QUANTIZATION_MODES:
+            logger.warning("Unknown MODEL_QUANTIZATION %r; using fp32", self.quantization)
+            self.quantization = "none"
+        self.batcher = None
+        self._transform = None
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._status: Dict[str, Any] = {"loaded": False, "warmed": False, "trained": False}
+        self._warned_heuristic = False
         if HAS_TORCH:
-            self.model = HybridForensicsModel()
-            self.model.eval()
+            if settings.MODEL_BATCHING_ENABLED:
+                # Tensors from concurrent requests share one forward pass
+                self.batcher = DynamicBatcher(
+                    self._forward,
+                    max_batch_size=settings.MODEL_BATCH_MAX_SIZE,
+                    max_wait_ms=settings.MODEL_BATCH_MAX_WAIT_MS
+                )
         else:
             print("Warning: PyTorch not found. Layer 4 will run in dummy mode.")
 
-    def analyze(self, image_tensor):
+    @property
+    def uses_torch(self) -> bool:
+        """
+        Whether analyze_detailed() takes tensors from to_tensor() (else a
+        MediaContext): true once trained weights have loaded, or with
+        MODEL_ALLOW_UNTRAINED. Loads the model on first call when weights are configured.
+        """
+        if not HAS_TORCH:
+            return False
+        if settings.MODEL_ALLOW_UNTRAINED:
+            return True
+        if not settings.MODEL_WEIGHTS_PATH:
+            self._warn_heuristic("MODEL_WEIGHTS_PATH is not set")
+            return False
+        self.load_model()
+        if not self._status["trained"]:
+            self._warn_heuristic(self._status.get("weights_error", "the checkpoint has no trained fusion head"))
+        return self._status["trained"]
+
+    def _warn_heuristic(self, reason: str):
+        if not self._warned_heuristic:
+            self._warned_heuristic = True
+            logger.warning("Layer 4 has no trained model (%s); scoring with blur/entropy heuristics", reason)
+
+    @property
+    def model(self):
+        if self._model is None:
+            self.load_model()
+        return self._model
+
+    def load_model(self):
+        """Builds the network once; safe to call from several threads."""
+        with self._model_lock:
+            if self._model is not None or not HAS_TORCH:
+                return self._model
+            started = time.perf_counter()
+            weights_path = settings.MODEL_WEIGHTS_PATH
+            has_weights = bool(weights_path) and os.path.exists(weights_path)
+            # Seeded, so untrained weights at least agree between workers and runs
+            with torch.random.fork_rng(devices=[]):
+                torch.manual_seed(0)
+                model = HybridForensicsModel(pretrained=settings.MODEL_ALLOW_DOWNLOAD and not has_weights)
+
+            if has_weights:
+                try:
+                    result = model.load_state_dict(_to_model_keys(_load_state_dict(weights_path)), strict=False, assign=True)
+                    self._status["weights"] = weights_path
+                    self._status["missing_keys"] = len(result.missing_keys)
+                    self._status["unexpected_keys"] = len(result.unexpected_keys)
+                    # A plain ResNet checkpoint leaves the fusion head untrained
+                    self._status["trained"] = not any(key.startswith("fusion.") for key in result.missing_keys)
+                except Exception as e:
+                    logger.exception("Could not load model weights from %s", weights_path)
+                    self._status["weights_error"] = str(e)
+            else:
+                if weights_path:
+                    logger.error("Model weights not found at %s", weights_path)
+                    self._status["weights_error"] = f"weights not found at {weights_path}"
+                self._status["weights"] = "imagenet" if settings.MODEL_ALLOW_DOWNLOAD else None
+            if not self._status["trained"]:
+                logger.warning("Layer 4 network has no trained weights; its scores are random%s",
+                               "" if settings.MODEL_ALLOW_UNTRAINED else " and it will not score uploads")
+
+            model.eval()
+            if settings.MODEL_INFERENCE_THREADS > 0:
+                # Per process: every pool worker runs its own model
+                torch.set_num_threads(settings.MODEL_INFERENCE_THREADS)
+            self._model = self._optimize(model)
+            self._status["quantization"] = self.quantization
+            self._status["channels_last"] = settings.MODEL_CHANNELS_LAST
+            self._status["threads"] = torch.get_num_threads()
+            self._status["loaded"] = True
+            self._status["load_ms"] = round(1000.0 * (time.perf_counter() - started), 1)
+            return self._model
+
+    def _optimize(self, model):
+        """Applies the configured CPU inference optimizations to a loaded fp32 model."""
+        if self.quantization in ("head", "full"):
+            from torch.ao.quantization import quantize_dynamic
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore") # torch.ao deprecation notices, once per worker
+                # Linear layers only: int8 weights, activations quantized on the fly
+                model.fusion = quantize_dynamic(model.fusion, {nn.Linear}, dtype=torch.qint8)
+        if self.quantization == "full":
+            # Convolutions have no dynamic int8 kernels; the backbone is
+            # quantized statically, with activation ranges observed on sample images
+            from torch.ao.quantization import get_default_qconfig_mapping
+            from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+            example = torch.zeros(1, 3, 224, 224)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                prepared = prepare_fx(model.cnn_features, get_default_qconfig_mapping("x86"), (example,))
+                with torch.inference_mode():
+                    for batch in self._calibration_batches():
+                        prepared(batch)
+                model.cnn_features = convert_fx(prepared)
+        if settings.MODEL_CHANNELS_LAST:
+            model = model.to(memory_format=torch.channels_last)
+        return model
+
+    def _calibration_batches(self) -> Iterator["torch.Tensor"]:
+        """Images from MODEL_CALIBRATION_DIR, else deterministic synthetic images."""
+        from PIL import Image
+        directory = settings.MODEL_CALIBRATION_DIR
+        names = []
+        if directory and os.path.isdir(directory):
+            names = sorted(n for n in os.listdir(directory) if n.lower().endswith(_CALIBRATION_EXTENSIONS))
+        self._status["calibration"] = directory if names else "synthetic"
+        if names:
+            for name in names[:_CALIBRATION_IMAGES]:
+                img = cv2.imread(os.path.join(directory, name))
+                if img is not None:
+                    yield self.to_tensor(Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)))
+            return
+        # Smooth gradients plus increasing sensor-like noise span the usual input range
+        rng = np.random.RandomState(0)
+        ramp = np.linspace(0, 255, 224, dtype=np.float32)
+        base = np.stack([np.add.outer(ramp, ramp[::-1]) / 2,
+                         np.tile(ramp, (224, 1)),
+                         np.tile(ramp[:, None], (1, 224))], axis=2)
+        for i in range(_CALIBRATION_IMAGES):
+            img = np.clip(base * rng.uniform(0.3, 1.0) + rng.normal(0, 5 + 5 * i, base.shape), 0, 255)
+            yield self.to_tensor(Image.fromarray(img.astype(np.uint8)))
+
+    def warmup(self) -> Dict[str, Any]:
+        """Loads the model and runs one dummy inference so the first request is not slow."""
+        if self.uses_torch and not self._status["warmed"]:
+            model = self.model
+            started = time.perf_counter()
+            self._forward(torch.zeros(1, 3, 224, 224))
+            self._status["warmup_ms"] = round(1000.0 * (time.perf_counter() - started), 1)
+            self._status["warmed"] = True
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        if not HAS_TORCH:
+            return {"loaded": False, "warmed": False, "torch": False, "scoring": "heuristic"}
+        scoring = "network" if self._status["trained"] or settings.MODEL_ALLOW_UNTRAINED else "heuristic"
+        return {**self._status, "torch": True, "scoring": scoring}
+
+    def to_tensor(self, img_pil):
+        """Preprocesses a PIL RGB image into a (1, 3, 224, 224) model input."""
+        if self._transform is None:
+            from torchvision import transforms
+            self._transform = transforms.Compose([
+                transforms.Resize((INPUT_SIZE, INPUT_SIZE)),
+                transforms.ToTensor(),
+                transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+            ])
+        return self._transform(img_pil).unsqueeze(0)
+
+    def frames_to_tensor(self, frames: Sequence[np.ndarray]) -> "torch.Tensor":
+        """
+        Preprocesses BGR frames into one (K, 3, 224, 224) batch. Only the
+        resize is per frame; color order, scaling and normalization run once
+        over the whole stack.
+        """
+        batch = np.empty((len(frames), INPUT_SIZE, INPUT_SIZE, 3), dtype=np.uint8)
+        for i, frame in enumerate(frames):
+            cv2.resize(frame, (INPUT_SIZE, INPUT_SIZE), dst=batch[i], interpolation=cv2.INTER_AREA)
+        tensor = torch.from_numpy(batch[..., ::-1].copy()).permute(0, 3, 1, 2).float().div_(255.0)
+        mean = torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1)
+        std = torch.tensor(IMAGENET_STD).view(1, 3, 1, 1)
+        return tensor.sub_(mean).div_(std)
+
+    def analyze_frames(self, frames: Sequence[np.ndarray], indices: Optional[List[int]] = None) -> Dict[str, Any]:
+        """
+        Scores video frames in one forward pass (or one batcher submission)
+        and aggregates them per settings.VIDEO_MODEL_AGGREGATION, so a
+        manipulated stretch is not hidden by a clean first frame.
         """
-        Runs the hybrid model on the input tensor.
-        For this version, we implement robust statistical forensics:
-        1. Laplacian Variance: Detects blurriness (deepfakes often have inconsistent blur).
-        2. Histogram Analysis: Detects abnormal pixel value distributions.
+        result = self.analyze_detailed(self.frames_to_tensor(frames), aggregate=False)
+        scores = np.asarray(result.pop("frame_scores"), dtype=np.float64)
+        top_k = np.sort(scores)[::-1][:max(1, settings.VIDEO_MODEL_TOP_K)]
+        aggregates = {"mean": float(scores.mean()), "max": float(scores.max()), "topk": float(top_k.mean())}
+        mode = settings.VIDEO_MODEL_AGGREGATION if settings.VIDEO_MODEL_AGGREGATION in aggregates else "topk"
+
+        result["score"] = aggregates[mode]
+        result["details"].update({
+            "frames": len(scores),
+            "frame_indices": indices if indices is not None else list(range(len(scores))),
+            "frame_scores": [round(float(s), 4) for s in scores],
+            "aggregation": mode,
+            "mean": round(aggregates["mean"], 4),
+            "max": round(aggregates["max"], 4),
+            "top_k_mean": round(aggregates["topk"], 4),
+        })
+        return result
+
+    def _forward(self, batch):
+        model = self.model
+        if settings.MODEL_CHANNELS_LAST:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        with torch.inference_mode():
+            return model(batch).view(-1)
+
+    def analyze_detailed(self, image_input, aggregate: bool = True) -> Dict[str, Any]:
+        """
+        Like analyze(), but returns {"score", "details"}. When batching is enabled,
+        tensors are scored through the dynamic batcher and the details carry
+        the batch size and queue wait of this request. With aggregate=False,
+        the per-row scores of a multi-image tensor are returned as "frame_scores".
         """
-        # We can run statistical checks regardless of PyTorch presence
-        # But we need the image data. 
-        # If image_tensor is a torch tensor, we need to convert it.
-        # If HAS_TORCH is false, the orchestrator might pass something else?
-        # In orchestrator.py, it passes a tensor ONLY if HAS_TORCH is true.
-        # If HAS_TORCH is false, orchestrator sets l4_score = 0.5 directly and doesn't call analyze.
-        
-        # So I need to update Orchestrator to call analyze even if HAS_TORCH is false, 
-        # OR update Layer 4 to accept a file path or numpy array instead of a tensor.
-        
-        # Given the current architecture, Orchestrator handles image loading.
-        # If I want Layer 4 to work without Torch, I should modify it to accept a numpy array or file path.
-        # But to minimize changes, I will assume Orchestrator passes a Tensor if Torch exists.
-        
-        # Wait, if HAS_TORCH is False, Orchestrator currently does:
-        # else: l4_score = 0.5
-        
-        # So I MUST update Orchestrator to allow Layer 4 to run without Torch.
-        # And I must update Layer 4 to accept a numpy array or path.
-        
-        # Let's change Layer 4 to accept `image_input` which can be a Tensor or a Path/Numpy array.
-        # For simplicity, let's make Layer 4 accept the file path, like other layers.
-        # This is a better design anyway.
-        pass
+        if HAS_TORCH and isinstance(image_input, torch.Tensor):
+            details = {"quantization": self.quantization}
+            # Profiled requests: with batching, this is queue wait plus the batch forward
+            with span("model_forward"):
+                if self.batcher is not None:
+                    scores, details["batch"] = self.batcher.submit(image_input).result()
+                else:
+                    scores = self._forward(image_input)
+            if not aggregate:
+                return {"score": float(scores.mean()), "details": details, "frame_scores": scores.tolist()}
+            return {"score": float(scores.mean()), "details": details}
+        return {"score": self.analyze(image_input), "details": {"scoring": "heuristic"}}
 
     def analyze_from_path(self, image_path):
+        return self.analyze_from_context(MediaContext(image_path))
+
+    def analyze_from_context(self, ctx):
         try:
-            img = cv2.imread(image_path)
-            if img is None:
+            gray = ctx.gray
+            if gray is None:
                 return 0.5
             
             # 1. Laplacian Variance (Blur Detection)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
             laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
             
             # 2. Histogram Analysis (Entropy/Distribution)
@@ -125,24 +382,14 @@ class AIModelAnalyzer:
             return 0.5
 
     def analyze(self, image_input):
-        # Adapter to handle both Tensor (legacy/torch) and Path
+        """
+        Scores a preprocessed tensor with the network, or a MediaContext /
+        path with the statistical heuristics (the path used without torch).
+        """
         if HAS_TORCH and isinstance(image_input, torch.Tensor):
-             # Convert tensor to numpy
-             img_np = image_input.squeeze(0).cpu().numpy().transpose(1, 2, 0)
-             # Denormalize roughly to 0-255
-             img_np = (img_np * 255).astype(np.uint8)
-             # Use the numpy logic (duplicated for now or refactored)
-             # Let's just use the logic here
-             gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
-             laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-             hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
-             hist = hist / hist.sum()
-             entropy = -np.sum(hist * np.log2(hist + 1e-7))
-             blur_score = 1.0 - min(laplacian_var / 500.0, 1.0)
-             entropy_score = 1.0 - min(entropy / 8.0, 1.0)
-             combined_score = (blur_score * 0.6) + (entropy_score * 0.4)
-             return float(max(0.0, min(combined_score, 1.0)))
-             
+            return float(self._forward(image_input).mean())
+        elif isinstance(image_input, MediaContext):
+            return float(self.analyze_from_context(image_input))
         elif isinstance(image_input, str):
             return float(self.analyze_from_path(image_input))
         else:
@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
-from typing import Dict, Any
+from typing import Dict, Any, Union
+from app.core.media import MediaContext
+from app.core.spectral import Spectrum
 
 class EarlySignatureAnalyzer:
     """
@@ -9,7 +11,7 @@ class EarlySignatureAnalyzer:
     - Grid Artifact Detection (Periodic patterns from GANs/Diffusion upsamplers)
     """
     
-    def analyze(self, image_path: str) -> Dict[str, Any]:
+    def analyze(self, media: Union[MediaContext, str]) -> Dict[str, Any]:
         results = {
             "score": 0.0,
             "details": {},
@@ -17,38 +19,38 @@ class EarlySignatureAnalyzer:
         }
         
         try:
-            # Load image in grayscale
-            img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-            if img is None:
+            # Grayscale view shared with the other layers. It is converted from
+            # the colour decode (COLOR_BGR2GRAY), not decoded with
+            # IMREAD_GRAYSCALE as this layer once did; the two differ by up to
+            # one level per pixel, which can move the peak count noticeably.
+            ctx = MediaContext.of(media)
+            if ctx.gray is None:
                 return results
 
-            # Resize for consistent analysis if too large
-            if img.shape[0] > 1024 or img.shape[1] > 1024:
-                img = cv2.resize(img, (1024, 1024))
+            # Analyze a fixed-size pyramid level if too large (aspect ratio preserved)
+            img = ctx.downscaled(1024, gray=True)
+            if img is ctx.gray:
+                # Same image as Layer 3: reuse its spectrum
+                spectrum = ctx.spectrum()
+            else:
+                spectrum = Spectrum(img)
             
             # --- 1. Frequency Domain Analysis (FFT) ---
             # AI generators (GANs/Diffusion) often leave high-frequency artifacts
             # visible as bright spots or star patterns in the FFT magnitude spectrum.
             
-            f = np.fft.fft2(img)
-            fshift = np.fft.fftshift(f)
-            magnitude_spectrum = 20 * np.log(np.abs(fshift) + 1e-7)
-            
             # Analyze high frequencies (outer region of the spectrum)
-            h, w = magnitude_spectrum.shape
-            center_h, center_w = h // 2, w // 2
+            h, w = spectrum.shape
             
             # Mask out the low frequencies (center)
             mask_radius = int(min(h, w) * 0.15)
-            y, x = np.ogrid[:h, :w]
-            mask = (x - center_w)**2 + (y - center_h)**2 > mask_radius**2
-            
-            high_freq_spectrum = magnitude_spectrum * mask
             
             # Calculate mean energy of high frequencies
             # Real images usually have decaying energy. High energy here implies artifacts.
-            high_freq_mean = np.mean(high_freq_spectrum[mask])
-            high_freq_max = np.max(high_freq_spectrum[mask])
+            # Threshold for peak detection (e.g., 3 std devs above mean)
+            stats = spectrum.high_pass_stats(mask_radius, eps=1e-7, peak_sigmas=3)
+            high_freq_mean = stats["mean"]
+            high_freq_max = stats["max"]
             
             # Heuristic: If high freq energy is abnormally high relative to image size/content
             # This is a simplification.
@@ -57,9 +59,7 @@ class EarlySignatureAnalyzer:
             # We can detect peaks in the FFT spectrum that are off-center.
             # Find peaks in the high_freq_spectrum
             
-            # Threshold for peak detection (e.g., 3 std devs above mean)
-            threshold = np.mean(high_freq_spectrum[mask]) + 3 * np.std(high_freq_spectrum[mask])
-            peaks = np.sum(high_freq_spectrum > threshold)
+            peaks = stats["peaks"]
             
             # Scoring
             # More peaks = more likely artificial (checkerboard artifacts)
@@ -77,6 +77,7 @@ class EarlySignatureAnalyzer:
             results["score"] = round(final_score, 3)
             results["details"]["fft_high_freq_mean"] = float(high_freq_mean)
             results["details"]["fft_peaks"] = int(peaks)
+            results["details"]["fft_radial_slope"] = self._radial_slope(spectrum, mask_radius)
             
             if final_score > 0.6:
                 results["anomalies"].append("High-frequency periodic artifacts detected (Grid/Checkerboard)")
@@ -86,3 +87,17 @@ class EarlySignatureAnalyzer:
             results["details"]["error"] = str(e)
             
         return results
+
+    def _radial_slope(self, spectrum: Spectrum, min_radius: int) -> float:
+        """
+        Slope of the radial log-magnitude profile against log radius over the
+        high-frequency band. Natural images decay steadily; flat or rising
+        tails point at synthetic high-frequency content.
+        """
+        profile = spectrum.radial_profile(eps=1e-7)
+        max_radius = min(spectrum.shape) // 2
+        radii = np.arange(max(min_radius, 1), max_radius)
+        if len(radii) < 2:
+            return 0.0
+        slope, _ = np.polyfit(np.log(radii), profile[radii], 1)
+        return float(slope)
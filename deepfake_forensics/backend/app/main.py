@@ -1,14 +1,21 @@
 from app.core.config import settings
 from app.api import endpoints
 from app.core.database import engine, Base
+from app.core.artifacts import ela_artifacts
+from app.core.cache import result_cache
+from app.core.jobs import job_manager
+from app.core.log_writer import analysis_log
+from app.core.metrics import metrics
+from app.core.storage import StorageStaticFiles, storage
 from app import models
 import os
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 # Create tables
 models.Base.metadata.create_all(bind=engine)
+models.migrate(engine)
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -25,13 +32,45 @@ if settings.ALLOWED_ORIGINS:
         allow_headers=["*"],
     )
 
-# Mount uploads directory to serve ELA images
-if not os.path.exists("uploads"):
-    os.makedirs("uploads")
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Mount uploads directory to serve stored originals and artifacts
+if not os.path.exists(settings.UPLOAD_DIR):
+    os.makedirs(settings.UPLOAD_DIR)
+app.mount("/uploads", StorageStaticFiles(storage), name="uploads")
 
 @app.get("/")
 def root():
     return {"message": "Welcome to the Universal Deepfake Forensics System API"}
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: the API process is up and serving."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: analysis workers are running with their model loaded and warmed."""
+    readiness = job_manager.readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus text format: per-layer latency, errors, bytes, queue depths, peak memory."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 app.include_router(endpoints.router, prefix=settings.API_V1_STR)
+
+@app.on_event("startup")
+def start_background_work():
+    storage.start_sweeper()
+    if settings.MODEL_WARMUP:
+        # Returns immediately; /readyz reports when the workers are warm
+        job_manager.warmup()
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    job_manager.shutdown()
+    storage.stop_sweeper()
+    # Flush analysis history, cached results and ELA originals still queued
+    analysis_log.stop()
+    result_cache.shutdown()
+    ela_artifacts.shutdown()
@@ -1,9 +1,32 @@
-from sqlalchemy import Column, Integer, String, Float, JSON, DateTime
+from typing import Any, Dict
+from sqlalchemy import Column, Integer, String, Float, JSON, DateTime, Index, UniqueConstraint, inspect, text
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from app.core.database import Base
 
+# Stored like SQLite's CURRENT_TIMESTAMP (whole seconds), so rows from the
+# server default and from Python compare consistently in keyset pagination
+Timestamp = DateTime(timezone=True).with_variant(sqlite.DATETIME(
+    storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+), "sqlite")
+
+# Layer score key -> AnalysisLog column holding a copy of it (for SQL statistics)
+LAYER_SCORE_COLUMNS = {
+    "metadata": "score_metadata",
+    "biology_rppg": "score_biology_rppg",
+    "math_forensics": "score_math_forensics",
+    "ai_model": "score_ai_model",
+    "physics": "score_physics",
+    "early_signature": "score_early_signature",
+}
+
 class AnalysisLog(Base):
     __tablename__ = "analysis_logs"
+    __table_args__ = (
+        # Keyset pagination walks (timestamp, id) newest first
+        Index("ix_analysis_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_analysis_logs_verdict_timestamp", "verdict", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
@@ -11,4 +34,59 @@ class AnalysisLog(Base):
     verdict = Column(String)
     confidence = Column(Float)
     layer_scores = Column(JSON)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(Timestamp, server_default=func.now())
+
+    # Per-layer scores, materialized from layer_scores
+    score_metadata = Column(Float)
+    score_biology_rppg = Column(Float)
+    score_math_forensics = Column(Float)
+    score_ai_model = Column(Float)
+    score_physics = Column(Float)
+    score_early_signature = Column(Float)
+
+    @staticmethod
+    def score_columns(layer_scores: Dict[str, Any]) -> Dict[str, float]:
+        """Column values for the per-layer scores of one result."""
+        return {column: float(layer_scores[key]) for key, column in LAYER_SCORE_COLUMNS.items()
+                if layer_scores.get(key) is not None}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "media_type": self.media_type,
+            "verdict": self.verdict,
+            "confidence": self.confidence,
+            "layer_scores": self.layer_scores,
+            "timestamp": self.timestamp.isoformat(sep=" ") if self.timestamp else None,
+        }
+
+class CachedResult(Base):
+    __tablename__ = "cached_results"
+    __table_args__ = (UniqueConstraint("content_hash", "pipeline_version"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String, index=True) # SHA-256 of the uploaded bytes
+    pipeline_version = Column(String)
+    result = Column(JSON)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+def migrate(engine):
+    """
+    Brings databases created by older versions up to date: adds the
+    per-layer score columns (filled from the layer_scores JSON) and the
+    indexes that create_all() only builds for new tables.
+    """
+    table = AnalysisLog.__table__
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    added = [column for column in LAYER_SCORE_COLUMNS.values() if column not in existing]
+    with engine.begin() as conn:
+        for column in added:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column} FLOAT"))
+        if added and engine.dialect.name == "sqlite":
+            conn.execute(text(f"UPDATE {table.name} SET " + ", ".join(
+                f"{column} = json_extract(layer_scores, '$.{key}')" for key, column in LAYER_SCORE_COLUMNS.items()
+            ) + " WHERE layer_scores IS NOT NULL"))
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
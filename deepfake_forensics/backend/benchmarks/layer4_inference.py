@@ -0,0 +1,139 @@
+"""
+Layer 4 CPU inference benchmark: fp32 against int8 quantization.
+
+Run from the backend directory:
+    python -m benchmarks.layer4_inference [--corpus DIR] [--runs N] [--threads N] [--json FILE]
+
+Every mode scores the same corpus with the same weights (MODEL_WEIGHTS_PATH,
+or one seeded random initialisation). Reported per mode: model load time,
+per-image latency (p50 / p95), and agreement with the fp32 scores. When the
+corpus has "real/" and "fake/" subdirectories, accuracy against those labels
+is reported too. Without --corpus a deterministic synthetic corpus is used.
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.layers.layer4_hybrid_model import QUANTIZATION_MODES, AIModelAnalyzer
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+LABELS = {"real": 0, "fake": 1}
+
+
+def synthetic_corpus(count=24, size=256):
+    """Deterministic stand-in images: noise, gradients, grids and blurred copies."""
+    rng = np.random.RandomState(1234)
+    images = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            img = rng.normal(128, 40, (size, size, 3))
+        elif kind == 1:
+            ramp = np.linspace(0, 255, size)
+            img = np.dstack([np.add.outer(ramp, ramp) / 2] * 3) + rng.normal(0, 8, (size, size, 3))
+        elif kind == 2:
+            cells = (np.add.outer(np.arange(size) // 8, np.arange(size) // 8) % 2) * 255
+            img = np.dstack([cells] * 3).astype(np.float64)
+        else:
+            img = cv2.GaussianBlur(rng.normal(128, 60, (size, size, 3)), (0, 0), 3)
+        images.append((f"synthetic_{i:02d}", None, np.clip(img, 0, 255).astype(np.uint8)))
+    return images
+
+
+def load_corpus(directory):
+    """(name, label or None, BGR image) for every image under directory."""
+    images = []
+    for root, _, names in os.walk(directory):
+        label = LABELS.get(os.path.basename(root).lower())
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                img = cv2.imread(os.path.join(root, name))
+                if img is not None:
+                    images.append((os.path.relpath(os.path.join(root, name), directory), label, img))
+    return images
+
+
+def run_mode(mode, corpus, runs):
+    from PIL import Image
+    import torch
+
+    analyzer = AIModelAnalyzer(quantization=mode)
+    started = time.perf_counter()
+    analyzer.warmup()
+    load_seconds = time.perf_counter() - started
+
+    tensors = [analyzer.to_tensor(Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))) for _, _, img in corpus]
+    scores = [analyzer.analyze(t) for t in tensors]
+    latencies = []
+    for _ in range(runs):
+        for t in tensors:
+            started = time.perf_counter()
+            analyzer.analyze(t)
+            latencies.append(time.perf_counter() - started)
+
+    return {
+        "mode": mode,
+        "load_s": round(load_seconds, 3),
+        "p50_ms": round(1000 * float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(1000 * float(np.percentile(latencies, 95)), 2),
+        "scores": scores,
+        "status": analyzer.status(),
+    }
+
+
+def compare(result, reference, labels):
+    scores = np.array(result["scores"])
+    ref = np.array(reference["scores"])
+    result["max_abs_diff"] = round(float(np.abs(scores - ref).max()), 5)
+    result["mean_abs_diff"] = round(float(np.abs(scores - ref).mean()), 5)
+    # Same side of the decision threshold as fp32
+    result["label_agreement"] = round(float(np.mean((scores > 0.5) == (ref > 0.5))), 4)
+    labelled = [i for i, label in enumerate(labels) if label is not None]
+    if labelled:
+        truth = np.array([labels[i] for i in labelled])
+        result["accuracy"] = round(float(np.mean((scores[labelled] > 0.5) == truth)), 4)
+    result["speedup"] = round(reference["p50_ms"] / result["p50_ms"], 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="image directory (optionally with real/ and fake/ subdirectories)")
+    parser.add_argument("--runs", type=int, default=3, help="timed passes over the corpus per mode")
+    parser.add_argument("--threads", type=int, help="intra-op threads (MODEL_INFERENCE_THREADS)")
+    parser.add_argument("--modes", default=",".join(QUANTIZATION_MODES))
+    parser.add_argument("--json", help="write the full results to this file")
+    args = parser.parse_args()
+
+    # Latency and quantization agreement are measured on the network even
+    # without a trained checkpoint (seeded weights; accuracy is then meaningless)
+    settings.MODEL_ALLOW_UNTRAINED = True
+    if args.threads is not None:
+        settings.MODEL_INFERENCE_THREADS = args.threads
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    if not corpus:
+        parser.error(f"no images found in {args.corpus}")
+    labels = [label for _, label, _ in corpus]
+
+    modes = [m for m in args.modes.split(",") if m]
+    results = [run_mode(mode, corpus, args.runs) for mode in modes]
+    for result in results:
+        compare(result, results[0], labels)
+
+    print(f"{len(corpus)} images, {args.runs} runs, reference: {results[0]['mode']}")
+    columns = ["mode", "load_s", "p50_ms", "p95_ms", "speedup", "mean_abs_diff", "max_abs_diff", "label_agreement", "accuracy"]
+    print(" ".join(f"{c:>15}" for c in columns))
+    for result in results:
+        print(" ".join(f"{str(result.get(c, '-')):>15}" for c in columns))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"images": [name for name, _, _ in corpus], "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
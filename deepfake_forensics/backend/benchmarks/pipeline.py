@@ -0,0 +1,308 @@
+"""
+End-to-end and per-layer benchmark of the forensics pipeline.
+
+Run from the backend directory:
+    python -m benchmarks.pipeline [--sizes all] [--formats jpg,png,webp] [--runs N] [--large-runs N]
+                                  [--json FILE] [--record] [--baseline auto|FILE] [--threshold 0.2]
+
+The corpus is generated deterministically with test_pipeline.create_dummy_image
+(noise and grid patterns at every size and format) plus short synthetic
+videos, so two runs on the same machine score the same files. For every
+corpus item the suite measures ForensicsOrchestrator.analyze_media end to
+end, and each layer on its own (on a fresh MediaContext, so a layer's time
+includes decoding and the views it needs): p50 / p95 latency, throughput and
+peak resident memory. Large images (12mp, 50mp) are benchmarked as JPEG
+only, with --large-runs timed runs, each in a fresh process, so a full run
+fits in a few GB of RAM.
+
+Timings only compare within one machine class (OS, architecture, CPU
+count), so baselines are kept per class in benchmarks/baselines/<class>.json.
+--record writes this run as the baseline of the machine it runs on.
+With --baseline auto (that file) or --baseline FILE (any --json output),
+the run fails with exit status 1 when any p50 latency or peak memory exceeds
+the baseline by more than --threshold (a fraction). Latency changes below
+--min-delta-ms are ignored as noise. A baseline of another machine class is
+refused (exit status 2); record one on this machine first.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.core.media import MediaContext
+from app.core.metrics import peak_memory
+from app.core.orchestrator import ForensicsOrchestrator
+from test_pipeline import create_dummy_image
+
+# Named resolutions, (width, height)
+SIZES = {
+    "224": (224, 224),
+    "1mp": (1280, 800),
+    "2mp": (1920, 1080),
+    "12mp": (4000, 3000),
+    "50mp": (8660, 5774),
+}
+FORMATS = ("jpg", "png", "webp")
+# Sizes of at least this many pixels are benchmarked in LARGE_FORMATS only, with --large-runs
+LARGE_PIXELS = 10_000_000
+LARGE_FORMATS = ("jpg",)
+PATTERNS = ("noise", "grid")
+# Short clips: (name, (width, height), frames, fps)
+VIDEOS = [
+    ("clip_320x240", (320, 240), 30, 15),
+    ("clip_640x360", (640, 360), 60, 30),
+]
+SEED = 1234
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def create_dummy_video(filename, size, frames, fps):
+    """Noise background with a bright square drifting across it; deterministic per SEED."""
+    width, height = size
+    rng = np.random.RandomState(SEED)
+    background = np.clip(rng.normal(128, 30, (height, width, 3)), 0, 255).astype(np.uint8)
+    side = max(8, min(width, height) // 4)
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    for i in range(frames):
+        frame = background.copy()
+        x = int((width - side) * i / max(1, frames - 1))
+        y = (height - side) // 2
+        frame[y:y + side, x:x + side] = 220
+        writer.write(frame)
+    writer.release()
+    return filename
+
+
+def build_corpus(directory, sizes, formats, videos=True):
+    """Writes the corpus into directory; returns one entry (name, path, kind, pixels, bytes, sha256) per file."""
+    corpus = []
+    for size in sizes:
+        large = SIZES[size][0] * SIZES[size][1] >= LARGE_PIXELS
+        for pattern in PATTERNS:
+            for fmt in formats:
+                if large and fmt not in LARGE_FORMATS:
+                    continue
+                name = f"{pattern}_{size}.{fmt}"
+                path = os.path.join(directory, name)
+                if not os.path.exists(path):
+                    # create_dummy_image's noise comes from OpenCV's global RNG
+                    cv2.setRNGSeed(SEED)
+                    create_dummy_image(path, pattern, SIZES[size])
+                corpus.append(_entry(name, path, "image", SIZES[size][0] * SIZES[size][1]))
+    if videos:
+        for name, size, frames, fps in VIDEOS:
+            path = os.path.join(directory, f"{name}.mp4")
+            if not os.path.exists(path):
+                create_dummy_video(path, size, frames, fps)
+            corpus.append(_entry(f"{name}.mp4", path, "video", size[0] * size[1] * frames))
+    return corpus
+
+
+def _entry(name, path, kind, pixels):
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return {"name": name, "path": path, "kind": kind, "pixels": pixels,
+            "bytes": os.path.getsize(path), "sha256": digest}
+
+
+def measure(fn, runs, pixels):
+    """Times fn() runs times; peak RSS is the highest seen during any run."""
+    latencies = []
+    peak = 0.0
+    for _ in range(runs):
+        peak_memory.reset()
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+        peak = max(peak, peak_memory.read())
+    mean = float(np.mean(latencies))
+    return {
+        "p50_ms": round(1000 * float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(1000 * float(np.percentile(latencies, 95)), 3),
+        "mean_ms": round(1000 * mean, 3),
+        "items_per_s": round(1.0 / mean, 3) if mean > 0 else None,
+        "mpix_per_s": round(pixels / 1e6 / mean, 3) if mean > 0 else None,
+        "peak_rss_mb": round(peak / (1024 * 1024), 1),
+    }
+
+
+def run_layer(orch, name, path):
+    """Runs one layer on a fresh context, as the orchestrator would."""
+    ctx = MediaContext(path)
+    try:
+        return dict(orch._layer_tasks(ctx))[name]()
+    finally:
+        ctx.close()
+
+
+def run(corpus, runs, large_runs, layers=True):
+    """
+    Benchmarks the corpus in fresh processes: one for the small items, one
+    per large image. The parent holds no decoded media, and a large image's
+    peak memory is its own. Returns the results and the environment they
+    were measured in.
+    """
+    groups = [([item for item in corpus if not _is_large(item)], runs)]
+    groups += [([item], large_runs) for item in corpus if _is_large(item)]
+    spawn = multiprocessing.get_context("spawn")
+    results, env = {}, None
+    for items, item_runs in groups:
+        if items:
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                group_results, env = pool.submit(run_items, items, item_runs, layers).result()
+            results.update(group_results)
+    return results, env
+
+
+def _is_large(item):
+    return item["kind"] == "image" and item["pixels"] >= LARGE_PIXELS
+
+
+def run_items(items, runs, layers=True):
+    # Layers run one after another so their timings do not interfere
+    settings.LAYER_EXECUTION_MODE = "sequential"
+    orch = ForensicsOrchestrator()
+    # Untimed pass: imports, model loading and other first-use costs
+    for item in items:
+        orch.analyze_media(item["path"])
+
+    results = {}
+    for item in items:
+        path, pixels = item["path"], item["pixels"]
+        results[f"e2e/{item['name']}"] = measure(lambda: orch.analyze_media(path), runs, pixels)
+        if not layers:
+            continue
+        ctx = MediaContext(path)
+        names = [name for name, _ in orch._layer_tasks(ctx)]
+        ctx.close()
+        for name in names:
+            results[f"layer/{name}/{item['name']}"] = measure(lambda: run_layer(orch, name, path), runs, pixels)
+    return results, environment()
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Regressions of this run against a baseline run, as printable lines."""
+    regressions = []
+    for key, base in baseline.get("results", {}).items():
+        current = results.get(key)
+        if current is None:
+            continue
+        delta_ms = current["p50_ms"] - base["p50_ms"]
+        if delta_ms > min_delta_ms and current["p50_ms"] > base["p50_ms"] * (1 + threshold):
+            regressions.append(f"{key}: p50 {base['p50_ms']} -> {current['p50_ms']} ms")
+        if base.get("peak_rss_mb") and current["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{key}: peak RSS {base['peak_rss_mb']} -> {current['peak_rss_mb']} MB")
+    return regressions
+
+
+def machine_class() -> str:
+    """Timings are only comparable within one class: OS, architecture and CPU count."""
+    return f"{platform.system().lower()}-{platform.machine().lower()}-{os.cpu_count()}cpu"
+
+
+def environment():
+    info = {
+        "machine_class": machine_class(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "layer_execution_mode": settings.LAYER_EXECUTION_MODE,
+        "enabled_layers": sorted(settings.ENABLED_LAYERS),
+        "model_quantization": settings.MODEL_QUANTIZATION,
+        "model_weights": bool(settings.MODEL_WEIGHTS_PATH),
+    }
+    if "torch" in sys.modules:
+        info["torch"] = sys.modules["torch"].__version__
+        info["torch_threads"] = sys.modules["torch"].get_num_threads()
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="all", help=f"comma-separated from {','.join(SIZES)}, or 'all'")
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--no-video", action="store_true", help="leave the synthetic videos out")
+    parser.add_argument("--no-layers", action="store_true", help="end-to-end timings only")
+    parser.add_argument("--runs", type=int, default=5, help="timed runs per corpus item")
+    parser.add_argument("--large-runs", type=int, default=2, help="timed runs per 12mp / 50mp image")
+    parser.add_argument("--corpus-dir", help="keep the generated corpus here (default: a temporary directory)")
+    parser.add_argument("--json", help="write the results (usable as a --baseline) to this file")
+    parser.add_argument("--record", action="store_true", help="save the results as this machine class's baseline")
+    parser.add_argument("--baseline", help="'auto' (this machine class's baseline) or an earlier --json file "
+                                           "to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown / memory growth (fraction)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="latency changes below this are noise")
+    args = parser.parse_args()
+
+    sizes = list(SIZES) if args.sizes == "all" else [s for s in args.sizes.split(",") if s]
+    formats = [f for f in args.formats.split(",") if f]
+    unknown = [s for s in sizes if s not in SIZES] + [f for f in formats if f not in FORMATS]
+    if unknown:
+        parser.error(f"unknown sizes/formats: {', '.join(unknown)}")
+    baseline_path = os.path.join(BASELINE_DIR, f"{machine_class()}.json")
+    if args.baseline and args.baseline != "auto":
+        baseline_path = args.baseline
+    baseline = None
+    if args.baseline:
+        if not os.path.exists(baseline_path):
+            print(f"No baseline at {baseline_path}; record one on this machine with --record")
+            sys.exit(2)
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        recorded_on = baseline.get("environment", {}).get("machine_class")
+        if recorded_on != machine_class():
+            print(f"Baseline {baseline_path} was recorded on {recorded_on or 'an unknown machine class'}, "
+                  f"this machine is {machine_class()}; record a baseline here with --record")
+            sys.exit(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.corpus_dir or tmp
+        os.makedirs(directory, exist_ok=True)
+        corpus = build_corpus(directory, sizes, formats, videos=not args.no_video)
+        results, env = run(corpus, args.runs, args.large_runs, layers=not args.no_layers)
+
+    print(f"{len(corpus)} items, {args.runs} runs each ({args.large_runs} for large images)")
+    columns = ["p50_ms", "p95_ms", "items_per_s", "mpix_per_s", "peak_rss_mb"]
+    width = max(len(key) for key in results)
+    print(f"{'':<{width}} " + " ".join(f"{c:>12}" for c in columns))
+    for key, result in results.items():
+        print(f"{key:<{width}} " + " ".join(f"{str(result[c]):>12}" for c in columns))
+
+    report = {
+        "environment": env,
+        "runs": args.runs,
+        "large_runs": args.large_runs,
+        "corpus": [{k: v for k, v in item.items() if k != "path"} for item in corpus],
+        "results": results,
+    }
+    outputs = [args.json] if args.json else []
+    if args.record:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        outputs.append(os.path.join(BASELINE_DIR, f"{machine_class()}.json"))
+    for output in outputs:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.threshold:.0%} against {baseline_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Tests never touch the development database or upload directory; set before
+# app.core.config is imported
+_tmp = tempfile.mkdtemp(prefix="forensics-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/forensics.db")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_tmp, "uploads"))
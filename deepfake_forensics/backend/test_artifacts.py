@@ -0,0 +1,47 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from app.core.artifacts import ELAArtifacts
+from app.core.config import settings
+from app.core.storage import storage
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "root", str(tmp_path))
+    monkeypatch.setattr(storage, "tmp_dir", str(tmp_path / "tmp"))
+    return storage
+
+
+def jpeg_bytes():
+    img = np.random.RandomState(0).randint(0, 255, (64, 64, 3)).astype(np.uint8)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+def test_in_memory_original_survives_a_restart(store, monkeypatch):
+    monkeypatch.setattr(settings, "ELA_PERSIST_SOURCES", True)
+    content_hash = "a" * 64
+    artifacts = ELAArtifacts()
+    artifacts.register(content_hash, jpeg_bytes(), "upload.jpg")
+    artifacts.shutdown()
+    assert os.path.exists(store.path("originals", content_hash, ".jpg"))
+
+    # A fresh process (or another worker) never saw the upload in memory
+    path = ELAArtifacts().path(content_hash)
+    assert path == store.path("ela", content_hash, ".png")
+    assert cv2.imread(path) is not None
+
+
+def test_originals_not_written_by_default(store):
+    content_hash = "b" * 64
+    artifacts = ELAArtifacts()
+    artifacts.register(content_hash, jpeg_bytes(), "upload.jpg")
+    artifacts.flush()
+    assert store.find("originals", content_hash) is None
+    # Still rendered from memory in this process, gone after a restart
+    assert artifacts.path(content_hash) is not None
+    os.remove(store.path("ela", content_hash, ".png"))
+    assert ELAArtifacts().path(content_hash) is None
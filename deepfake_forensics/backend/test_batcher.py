@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from app.core.batching import DynamicBatcher
+
+torch = pytest.importorskip("torch")
+
+
+def test_concurrent_inputs_share_a_batch():
+    calls = []
+
+    def forward(batch):
+        calls.append(len(batch))
+        return batch * 2
+
+    batcher = DynamicBatcher(forward, max_batch_size=16, max_wait_ms=200)
+    futures = [batcher.submit(torch.full((n, 1), float(i))) for i, n in enumerate((1, 2, 3))]
+    results = [future.result(timeout=10) for future in futures]
+
+    assert calls == [6]
+    for i, (n, (rows, info)) in enumerate(zip((1, 2, 3), results)):
+        # Every caller gets back exactly its own rows
+        assert rows.shape == (n, 1)
+        assert torch.all(rows == 2 * i)
+        assert info["batch_size"] == 6
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["requests"] == 3 and stats["rows"] == 6
+    assert stats["batch_size_histogram"] == {6: 1}
+
+
+def test_batches_are_capped_at_max_batch_size():
+    calls = []
+    release = threading.Event()
+
+    def forward(batch):
+        calls.append(len(batch))
+        release.wait(10)
+        return batch
+
+    batcher = DynamicBatcher(forward, max_batch_size=4, max_wait_ms=50)
+    # The first batch blocks in forward() while the rest queue up behind it
+    first = batcher.submit(torch.zeros(1, 1))
+    futures = [batcher.submit(torch.zeros(1, 1)) for _ in range(9)]
+    release.set()
+    for future in [first] + futures:
+        future.result(timeout=10)
+    assert sum(calls) == 10
+    assert max(calls) <= 4
+
+
+def test_forward_error_reaches_every_caller():
+    def forward(batch):
+        raise RuntimeError("model failed")
+
+    batcher = DynamicBatcher(forward, max_batch_size=8, max_wait_ms=100)
+    futures = [batcher.submit(torch.zeros(1, 1)) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model failed"):
+            future.result(timeout=10)
+
+
+def test_multi_row_input_that_does_not_fit_opens_the_next_batch():
+    calls = []
+
+    def forward(batch):
+        calls.append(len(batch))
+        return batch
+
+    batcher = DynamicBatcher(forward, max_batch_size=8, max_wait_ms=200)
+    # 3 rows, then an 8-frame video that would overflow their batch, then 2 rows
+    futures = [batcher.submit(torch.full((n, 1), float(n))) for n in (3, 8, 2)]
+    results = [future.result(timeout=10) for future in futures]
+    assert calls == [3, 8, 2]
+    for n, (rows, _) in zip((3, 8, 2), results):
+        assert rows.shape == (n, 1) and torch.all(rows == n)
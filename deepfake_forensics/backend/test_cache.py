@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from app import models
+from app.core.cache import ResultCache, cacheable
+from app.core.config import settings
+from app.core.database import engine
+
+RESULT = {"confidence": 0.25, "layer_scores": {"math_forensics": 0.5}, "details": {}}
+
+
+@pytest.fixture
+def cache():
+    models.Base.metadata.create_all(bind=engine)
+    cache = ResultCache(max_items=8, persistent=True)
+    yield cache
+    cache.shutdown()
+
+
+def run(cache, key, result):
+    """Submits one analysis through the cache and finishes it with result."""
+    future = Future()
+    shared, _ = cache.get_or_submit(key, lambda: future)
+    future.set_result(result)
+    cache.flush()
+    return shared
+
+
+def test_result_written_off_the_completing_thread(cache, monkeypatch):
+    threads = []
+    store = cache._store
+    monkeypatch.setattr(cache, "_store", lambda key, result: (threads.append(threading.current_thread()), store(key, result)))
+    run(cache, ("a" * 64, "test"), RESULT)
+    assert threads and threads[0] is not threading.current_thread()
+    assert threads[0].name.startswith("result-cache-writer")
+    assert cache.get(("a" * 64, "test"))["confidence"] == 0.25
+    # Persistent tier: a fresh cache finds it in the database
+    assert ResultCache(persistent=True).get(("a" * 64, "test"))["confidence"] == 0.25
+
+
+def test_identical_uploads_share_one_run(cache):
+    key = ("b" * 64, "test")
+    submitted = []
+
+    def submit():
+        submitted.append(Future())
+        return submitted[-1]
+
+    first, shared_first = cache.get_or_submit(key, submit)
+    second, shared_second = cache.get_or_submit(key, submit)
+    assert first is second and not shared_first and shared_second
+    assert len(submitted) == 1
+    first.set_result(RESULT)
+    cache.flush()
+    assert key not in cache._inflight
+
+
+def test_numpy_values_are_stored_as_json(cache):
+    key = ("c" * 64, "test")
+    run(cache, key, {"confidence": np.float64(0.5), "is_verified": np.bool_(False), "details": {}})
+    assert cache.get(key) == {"confidence": 0.5, "is_verified": False, "details": {}}
+
+
+def test_timed_out_results_not_cached(cache):
+    key = ("d" * 64, "test")
+    run(cache, key, {**RESULT, "details": {"timed_out_layers": ["ai_model"]}})
+    assert cache.get(key) is None
+    assert key not in cache._inflight
+
+
+def test_cascade_early_exit_is_cached(cache):
+    key = ("e" * 64, "test")
+    skipped = {"ai_model": "verdict settled: final score bounded to [0.100, 0.300]"}
+    run(cache, key, {**RESULT, "details": {"skipped_layers": skipped}})
+    assert cache.get(key)["details"]["skipped_layers"] == skipped
+
+
+def test_key_depends_on_type_and_configuration(monkeypatch):
+    base = ResultCache.key("f" * 64, ".jpg")
+    assert ResultCache.key("f" * 64, ".JPG") == base
+    assert ResultCache.key("f" * 64, ".png") != base
+    monkeypatch.setattr(settings, "LAYER_EXECUTION_MODE", "cascade")
+    cascade = ResultCache.key("f" * 64, ".jpg")
+    assert cascade != base
+    monkeypatch.setattr(settings, "ENABLED_LAYERS", {"metadata", "math_forensics"})
+    assert ResultCache.key("f" * 64, ".jpg") not in (base, cascade)
+
+
+def test_cacheable():
+    assert cacheable(RESULT)
+    assert not cacheable({"error": "File not found"})
+    assert not cacheable({**RESULT, "details": {"timed_out_layers": ["ela"]}})
+    assert cacheable({**RESULT, "details": {"skipped_layers": {"ela": "cascade"}}})
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app.core.media import MediaContext
+from app.core.orchestrator import LAYER_SCORE_RANGES, LAYER_WEIGHTS, ForensicsOrchestrator
+
+LAYERS = list(LAYER_WEIGHTS) + ["ela"]
+
+
+def analyze(scores, mode, verified=False):
+    """The orchestrator's result for layers that return the given scores."""
+    orch = ForensicsOrchestrator()
+
+    def task(name):
+        details = {"provenance_verified": True} if name == "metadata" and verified else {}
+        return lambda: {"score": scores.get(name, 0.0), "details": details, "anomalies": []}
+
+    orch._layer_tasks = lambda ctx: [(name, task(name)) for name in LAYERS]
+    return orch._analyze(MediaContext.from_array(np.zeros((8, 8, 3), np.uint8)), None, mode=mode)
+
+
+def random_scores(rng):
+    scores = {}
+    for name in LAYERS:
+        low, high = LAYER_SCORE_RANGES.get(name, (0.0, 1.0))
+        # Mostly extreme scores, so the cascade often gets to stop early
+        scores[name] = float(rng.choice([low, high, rng.uniform(low, high)]))
+    return scores
+
+
+def test_cascade_verdict_matches_running_every_layer():
+    rng = np.random.RandomState(0)
+    skipped_any = 0
+    for _ in range(300):
+        scores = random_scores(rng)
+        cascade = analyze(scores, "cascade")
+        assert cascade["verdict"] == analyze(scores, "sequential")["verdict"], scores
+        skipped_any += bool(cascade["details"].get("skipped_layers"))
+    assert skipped_any > 0
+
+
+def test_bounds_contain_every_outcome():
+    rng = np.random.RandomState(1)
+    done = {"metadata": {"score": 0.9}, "math_forensics": {"score": 0.1}}
+    pending = ["biology_rppg", "ai_model", "physics", "early_signature"]
+    low, high = ForensicsOrchestrator._score_bounds(done, pending)
+    for _ in range(500):
+        scores = {name: rng.uniform(*LAYER_SCORE_RANGES.get(name, (0.0, 1.0))) for name in pending}
+        total = sum(res["score"] * LAYER_WEIGHTS[name] for name, res in done.items())
+        total += sum(score * LAYER_WEIGHTS[name] for name, score in scores.items())
+        assert low - 1e-12 <= total / sum(LAYER_WEIGHTS.values()) <= high + 1e-12
+
+
+def test_verified_provenance_ends_the_cascade():
+    result = analyze({"metadata": 0.0}, "cascade", verified=True)
+    skipped = result["details"]["skipped_layers"]
+    assert set(skipped) == set(LAYER_WEIGHTS) - {"metadata"}
+    # ELA carries no verdict weight and always runs
+    assert "ela" not in skipped
+
+
+@pytest.mark.parametrize("score", [0.0, 1.0])
+def test_unanimous_layers_stop_early(score):
+    result = analyze({name: score for name in LAYERS}, "cascade")
+    assert result["details"]["skipped_layers"]
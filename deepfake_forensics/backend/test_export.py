@@ -0,0 +1,71 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.main import app
+from app.models import AnalysisLog
+
+# Rows of this module live in 2998: apart from test_history's rows and real ones
+START = datetime(2998, 1, 1)
+END = datetime(2999, 1, 1)
+VERDICTS = ["Real", "Suspicious / Inconclusive", "AI-Generated"]
+ROWS = 25
+
+
+@pytest.fixture(scope="module")
+def client():
+    rows = []
+    for i in range(ROWS):
+        confidence = i / ROWS
+        rows.append(dict(
+            timestamp=START + timedelta(minutes=i),
+            filename=f"export-{i}.jpg",
+            media_type="video" if i % 5 == 0 else "image",
+            verdict=VERDICTS[i % 3],
+            confidence=confidence,
+            layer_scores={"math_forensics": confidence},
+            **AnalysisLog.score_columns({"math_forensics": confidence}),
+        ))
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(AnalysisLog, rows)
+        db.commit()
+    finally:
+        db.close()
+    return TestClient(app)
+
+
+def url(path):
+    return f"{settings.API_V1_STR}{path}"
+
+
+def test_csv_export(client):
+    res = client.get(url("/export"), params={"start": START.isoformat(), "end": END.isoformat()})
+    assert res.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(res.text)))
+    # Oldest first
+    assert [row["filename"] for row in rows] == [f"export-{i}.jpg" for i in range(ROWS)]
+    assert float(rows[3]["score_math_forensics"]) == pytest.approx(3 / ROWS)
+
+
+def test_ndjson_export_filtered_and_gzipped(client, monkeypatch):
+    # Small chunks: the body is streamed in many pieces
+    monkeypatch.setattr(settings, "EXPORT_CHUNK_BYTES", 256)
+    params = {"format": "ndjson", "start": START.isoformat(), "end": END.isoformat(),
+              "verdict": ["Real", "AI-Generated"], "gzip": "true"}
+    res = client.get(url("/export"), params=params, headers={"Accept-Encoding": "identity"})
+    assert res.headers["content-encoding"] == "gzip"
+    body = res.content
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    records = [json.loads(line) for line in body.decode().splitlines()]
+    assert len(records) == len([i for i in range(ROWS) if i % 3 != 1])
+    assert {record["verdict"] for record in records} == {"Real", "AI-Generated"}
+    assert records[0]["layer_scores"] == {"math_forensics": 0.0}
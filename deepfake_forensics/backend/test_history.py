@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.main import app
+from app.models import AnalysisLog
+
+# Rows of this module live in 2999: newer than anything else in the test database
+START = datetime(2999, 1, 1)
+END = datetime(3000, 1, 1)
+VERDICTS = ["Real", "Suspicious / Inconclusive", "AI-Generated"]
+ROWS = 25
+
+
+@pytest.fixture(scope="module")
+def client():
+    rows = []
+    for i in range(ROWS):
+        confidence = i / ROWS
+        rows.append(dict(
+            # Pairs of rows share a timestamp: the cursor must break ties by id
+            timestamp=START + timedelta(minutes=i // 2),
+            filename=f"history-{i}.jpg",
+            media_type="video" if i % 5 == 0 else "image",
+            verdict=VERDICTS[i % 3],
+            confidence=confidence,
+            layer_scores={"math_forensics": confidence},
+            **AnalysisLog.score_columns({"math_forensics": confidence}),
+        ))
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(AnalysisLog, rows)
+        db.commit()
+    finally:
+        db.close()
+    return TestClient(app)
+
+
+def url(path):
+    return f"{settings.API_V1_STR}{path}"
+
+
+def test_keyset_pages_walk_every_row_once(client):
+    seen, cursor = [], None
+    while len(seen) < ROWS:
+        params = {"limit": 7, **({"cursor": cursor} if cursor else {})}
+        res = client.get(url("/history"), params=params)
+        seen += [entry for entry in res.json() if entry["filename"].startswith("history-")]
+        # A short last page has no cursor
+        cursor = res.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    names = [entry["filename"] for entry in seen[:ROWS]]
+    # Newest first: the last inserted row (latest timestamp, highest id) leads
+    assert names == [f"history-{i}.jpg" for i in reversed(range(ROWS))]
+
+
+def test_cursor_matches_offset_paging(client):
+    first = client.get(url("/history"), params={"limit": 5})
+    by_cursor = client.get(url("/history"), params={"limit": 5, "cursor": first.headers["X-Next-Cursor"]}).json()
+    by_offset = client.get(url("/history"), params={"limit": 5, "skip": 5}).json()
+    assert [e["id"] for e in by_cursor] == [e["id"] for e in by_offset]
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get(url("/history"), params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_stats_over_a_time_range(client):
+    stats = client.get(url("/stats"), params={"start": START.isoformat(), "end": END.isoformat(), "bins": 5}).json()
+    assert stats["total"] == ROWS
+    assert sum(stats["verdicts"].values()) == ROWS
+    assert stats["media_types"] == {"video": 5, "image": 20}
+    assert stats["confidence"]["histogram"] == [5, 5, 5, 5, 5]
+    assert stats["layers"]["math_forensics"]["count"] == ROWS
+    assert stats["layers"]["math_forensics"]["mean"] == pytest.approx(0.48)
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+
+# Seconds allowed for importing the orchestrator and creating one in a fresh interpreter
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.5"))
+
+# Dependencies that only the layers using them may import
+HEAVY_MODULES = ["torch", "torchvision", "scipy", "jpeglib", "c2pa", "magic", "exifread", "PIL", "cv2"]
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_fresh(code, **env):
+    """Runs code in a new interpreter (nothing cached in sys.modules) and returns its stdout."""
+    environ = dict(os.environ, PYTHONPATH=BACKEND_DIR, **env)
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=environ,
+                         capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+
+def loaded_heavy_modules():
+    return f"[m for m in {HEAVY_MODULES!r} if m in sys.modules]"
+
+
+def test_orchestrator_import_time():
+    print("Importing the orchestrator...")
+    elapsed, loaded = eval(run_fresh(
+        "import sys, time\n"
+        "started = time.perf_counter()\n"
+        "from app.core.orchestrator import ForensicsOrchestrator\n"
+        "ForensicsOrchestrator()\n"
+        f"print((time.perf_counter() - started, {loaded_heavy_modules()}))"
+    ))
+    print(f"Import + construction: {elapsed:.3f}s (budget {IMPORT_BUDGET_SECONDS}s)")
+    assert elapsed < IMPORT_BUDGET_SECONDS, f"orchestrator import took {elapsed:.3f}s"
+    assert not loaded, f"heavy modules imported eagerly: {loaded}"
+
+
+def test_disabled_layer_not_imported():
+    print("\nAnalyzing with Layer 4 disabled...")
+    loaded = eval(run_fresh(
+        "import sys, cv2, numpy as np\n"
+        "from app.core.orchestrator import ForensicsOrchestrator\n"
+        "ok, jpg = cv2.imencode('.jpg', np.full((64, 64, 3), 128, np.uint8))\n"
+        "res = ForensicsOrchestrator().analyze_media(jpg.tobytes(), filename='probe.jpg')\n"
+        "assert 'ai_model' not in res['layer_scores'], res['layer_scores']\n"
+        "print(['torch' in sys.modules, 'torchvision' in sys.modules])",
+        ENABLED_LAYERS="metadata,math_forensics,physics,early_signature,ela"
+    ))
+    print(f"torch / torchvision imported: {loaded}")
+    assert loaded == [False, False]
+
+
+def test_c2pa_import_attempted_once():
+    print("\nLoading c2pa twice...")
+    attempts = run_fresh(
+        "import importlib\n"
+        "from app.layers import layer1_metadata\n"
+        "calls = []\n"
+        "real = importlib.import_module\n"
+        "importlib.import_module = lambda name, *a: calls.append(name) or real(name, *a)\n"
+        "for _ in range(2):\n"
+        "    try:\n"
+        "        layer1_metadata._load_c2pa()\n"
+        "    except ImportError:\n"
+        "        pass\n"
+        "print(calls.count('c2pa'))"
+    )
+    print(f"import attempts: {attempts}")
+    assert attempts == "1"
+
+
+if __name__ == "__main__":
+    test_orchestrator_import_time()
+    test_disabled_layer_not_imported()
+    test_c2pa_import_attempted_once()
@@ -0,0 +1,130 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.core.jobs import JobManager
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_EXECUTOR", "thread")
+    monkeypatch.setattr(settings, "ENABLED_LAYERS", {"metadata", "math_forensics"})
+    manager = JobManager(max_workers=2, max_jobs=1)
+    yield manager
+    manager.shutdown()
+
+
+def upload():
+    ok, buf = cv2.imencode(".png", np.full((64, 64, 3), 128, np.uint8))
+    return buf.tobytes()
+
+
+def test_finished_run_leaves_the_shared_progress(manager):
+    future = manager.start(upload(), "upload.png")
+    assert "verdict" in future.result(timeout=60)
+    assert dict(manager._progress) == {}
+    assert future.progress
+
+
+def test_late_progress_does_not_return_to_the_shared_progress(manager, monkeypatch):
+    from app.core import jobs
+    manager.start(upload(), "upload.png").result(timeout=60)
+    callbacks = []
+
+    def analyze_media(media, progress=None, **kwargs):
+        # A layer abandoned on timeout keeps its callback past the return
+        callbacks.append(progress)
+        progress("metadata", "running")
+        return {"verdict": "AUTHENTIC"}
+
+    monkeypatch.setattr(jobs._worker_orchestrator, "analyze_media", analyze_media)
+    future = manager.start(upload(), "upload.png")
+    future.result(timeout=60)
+    callbacks[0]("metadata", "completed")
+    assert dict(manager._progress) == {}
+    assert future.progress == {"metadata": "running"}
+
+
+def test_tracked_run_keeps_progress_until_evicted(manager):
+    first = manager.start(upload(), "upload.png")
+    job_id = manager.track(first)
+    first.result(timeout=60)
+    assert manager.get(job_id)["progress"]
+
+    # max_jobs=1: tracking another job evicts the finished first one
+    manager.track(manager.start(upload(), "upload.png"))
+    assert manager.get(job_id) is None
+
+
+def test_run_tracked_after_it_ended_keeps_its_progress(manager):
+    future = manager.start(upload(), "upload.png")
+    future.result(timeout=60)
+    assert manager.get(manager.track(future))["progress"]
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_failed_analysis_keeps_its_layer_errors(executor, monkeypatch):
+    from app.core.metrics import LAYER_ERRORS
+    # Spawned workers read their settings from the environment
+    monkeypatch.setenv("ENABLED_LAYERS", "metadata,math_forensics")
+    monkeypatch.setattr(settings, "ENABLED_LAYERS", {"metadata", "math_forensics"})
+    monkeypatch.setattr(settings, "ANALYSIS_EXECUTOR", executor)
+    before = LAYER_ERRORS._values.get(("math_forensics", "image"), 0.0)
+    manager = JobManager(max_workers=1)
+    try:
+        # Empty bytes make the pixel layer raise, which fails the whole analysis
+        with pytest.raises(Exception):
+            manager.start(b"", "upload.png").result(timeout=120)
+    finally:
+        manager.shutdown()
+    assert LAYER_ERRORS._values.get(("math_forensics", "image"), 0.0) == before + 1
+
+
+def wait_ready(manager, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        readiness = manager.readiness()
+        if readiness["ready"]:
+            return readiness
+        time.sleep(0.1)
+    raise AssertionError(f"workers not ready: {manager.readiness()}")
+
+
+def test_thread_pool_warmup(manager, monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_WARMUP", True)
+    assert not manager.readiness()["ready"]
+    manager.warmup()
+    readiness = wait_ready(manager)
+    assert [worker["status"] for worker in readiness["workers"]] == ["ready"]
+
+
+def test_every_process_worker_warms(monkeypatch):
+    # Spawned workers read their settings from the environment
+    monkeypatch.setenv("ENABLED_LAYERS", "metadata")
+    monkeypatch.setattr(settings, "ENABLED_LAYERS", {"metadata"})
+    monkeypatch.setattr(settings, "ANALYSIS_EXECUTOR", "process")
+    monkeypatch.setattr(settings, "MODEL_WARMUP", True)
+    manager = JobManager(max_workers=2)
+    try:
+        manager.warmup()
+        readiness = wait_ready(manager)
+        pids = [worker["pid"] for worker in readiness["workers"]]
+        assert len(set(pids)) == 2
+        assert all(worker["model"]["disabled"] for worker in readiness["workers"])
+    finally:
+        manager.shutdown()
+
+
+def test_not_ready_until_every_worker_reports(monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_EXECUTOR", "process")
+    manager = JobManager(max_workers=2)
+    # As if warmup() ran and one of the two processes has reported so far
+    manager._warmups, manager._workers = [], {101: {"status": "ready", "model": {}}}
+    readiness = manager.readiness()
+    assert not readiness["ready"]
+    assert [worker["status"] for worker in readiness["workers"]] == ["ready", "starting"]
+    manager._workers[102] = {"status": "ready", "model": {}}
+    assert manager.readiness()["ready"]
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.core.media import MediaContext
+from app.layers import layer3_math
+from app.layers.layer3_math import MathAnalyzer, _read_luma_qtable
+
+
+def natural_image(seed=0, size=512):
+    """Smooth multi-scale texture with a gradient: a stand-in for a photo."""
+    rng = np.random.RandomState(seed)
+    img = np.zeros((size, size, 3), np.float32)
+    for scale in (64, 16, 4, 1):
+        noise = rng.normal(0, 1, (size // scale + 1, size // scale + 1, 3)).astype(np.float32)
+        img += cv2.resize(noise, (size, size), interpolation=cv2.INTER_CUBIC) * (8 * scale ** 0.5)
+    img += np.linspace(0, 80, size, dtype=np.float32)[None, :, None] + 90
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def compress(img, *qualities):
+    """JPEG bytes of img saved at each quality in turn."""
+    for quality in qualities:
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    return buf.tobytes()
+
+
+def dct_score(data, tmp_path=None):
+    if tmp_path is None:
+        ctx = MediaContext.from_bytes(data, "upload.jpg")
+    else:
+        path = tmp_path / "upload.jpg"
+        path.write_bytes(data)
+        ctx = MediaContext(str(path))
+    score, details = MathAnalyzer()._analyze_dct(ctx)
+    assert ctx._spilled_path is None # In-memory uploads never touch the disk
+    return score, details
+
+
+@pytest.mark.parametrize("from_file", [False, True])
+def test_double_compression_scores_above_single(tmp_path, from_file):
+    img = natural_image()
+    single = [dct_score(compress(img, q), tmp_path if from_file else None)[0] for q in (70, 90, 95)]
+    double = [dct_score(compress(img, *qs), tmp_path if from_file else None)[0] for qs in ((60, 90), (50, 85), (70, 95))]
+    assert max(single) < 0.2
+    assert min(double) > 0.8
+    assert min(double) > max(single)
+
+
+def test_primary_quality_estimate():
+    score, details = dct_score(compress(natural_image(1), 50, 85))
+    assert details["dct_source"] == ("jpeg_coefficients" if layer3_math.HAS_JPEGLIB else "pixels_requantized")
+    assert details["jpeg_quality_estimate"] == 85
+    assert abs(details["primary_quality_estimate"] - 50) <= 5
+
+
+def test_quant_table_matches_jpeglib(tmp_path):
+    if not layer3_math.HAS_JPEGLIB:
+        pytest.skip("jpeglib not installed")
+    path = tmp_path / "q.jpg"
+    path.write_bytes(compress(natural_image(), 75))
+    with open(path, "rb") as f:
+        table = _read_luma_qtable(f)
+    jpeg = layer3_math.jpeglib.read_dct(str(path))
+    assert np.array_equal(table, jpeg.qt[jpeg.quant_tbl_no[0]])
+
+
+def test_in_memory_jpeg_is_read_without_a_pixel_decode():
+    if not layer3_math.HAS_JPEGLIB:
+        pytest.skip("jpeglib not installed")
+    ctx = MediaContext.from_bytes(compress(natural_image(), 60, 90), "upload.jpg")
+    score, details = MathAnalyzer()._analyze_dct(ctx)
+    assert details["dct_source"] == "jpeg_coefficients" and score > 0.8
+    assert "bgr" not in ctx._cache and ctx._spilled_path is None
+
+
+def test_pixels_requantized_when_the_coefficient_read_fails(monkeypatch):
+    if layer3_math.HAS_JPEGLIB:
+        def fail(path):
+            raise OSError("unreadable")
+        monkeypatch.setattr(layer3_math.jpeglib, "read_dct", fail)
+    score, details = dct_score(compress(natural_image(), 60, 90))
+    assert details["dct_source"] == "pixels_requantized" and score > 0.8
+
+
+def png_of(img):
+    ok, png = cv2.imencode(".png", img)
+    return png.tobytes()
+
+
+def test_png_scored_by_block_dct():
+    img = natural_image()
+    ctx = MediaContext.from_bytes(png_of(img), "upload.png")
+    clean, details = MathAnalyzer()._analyze_dct(ctx)
+    assert details["dct_source"] == "pixels_block_dct"
+    assert 0.0 < details["dct_grid_concentration"] < 0.3 and clean == 0.0
+
+    # A JPEG saved again as PNG keeps its quantization grid
+    laundered = cv2.imdecode(np.frombuffer(compress(img, 75), np.uint8), cv2.IMREAD_COLOR)
+    ctx = MediaContext.from_bytes(png_of(laundered), "upload.png")
+    score, details = MathAnalyzer()._analyze_dct(ctx)
+    assert details["dct_grid_concentration"] > 0.6 and score > 0.8
+    assert abs(details["prior_jpeg_quality_estimate"] - 75) <= 8
@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.core.media import MediaContext
+from app.layers import layer4_hybrid_model
+from app.layers.layer4_hybrid_model import AIModelAnalyzer
+
+
+def noise_image():
+    rng = np.random.RandomState(0)
+    return rng.randint(0, 255, (224, 224, 3)).astype(np.uint8)
+
+
+def test_heuristic_without_weights(monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_WEIGHTS_PATH", "")
+    monkeypatch.setattr(settings, "MODEL_ALLOW_UNTRAINED", False)
+    analyzer = AIModelAnalyzer()
+    assert not analyzer.uses_torch
+    res = analyzer.analyze_detailed(MediaContext.from_array(noise_image()))
+    assert res["details"]["scoring"] == "heuristic"
+    # Same input, same score, in every process
+    assert res["score"] == AIModelAnalyzer().analyze_detailed(MediaContext.from_array(noise_image()))["score"]
+    assert analyzer.status()["scoring"] == "heuristic"
+    assert not analyzer.status()["loaded"]
+
+
+def test_missing_weights_fall_back(monkeypatch, tmp_path):
+    if not layer4_hybrid_model.HAS_TORCH:
+        pytest.skip("torch not installed")
+    monkeypatch.setattr(settings, "MODEL_WEIGHTS_PATH", str(tmp_path / "missing.pt"))
+    monkeypatch.setattr(settings, "MODEL_ALLOW_UNTRAINED", False)
+    analyzer = AIModelAnalyzer()
+    assert not analyzer.uses_torch
+    assert "weights_error" in analyzer.status()
+
+
+def test_untrained_network_is_seeded(monkeypatch):
+    if not layer4_hybrid_model.HAS_TORCH:
+        pytest.skip("torch not installed")
+    from PIL import Image
+    monkeypatch.setattr(settings, "MODEL_WEIGHTS_PATH", "")
+    monkeypatch.setattr(settings, "MODEL_ALLOW_UNTRAINED", True)
+    img = Image.fromarray(cv2.cvtColor(noise_image(), cv2.COLOR_BGR2RGB))
+    scores = []
+    for _ in range(2):
+        analyzer = AIModelAnalyzer(quantization="none")
+        assert analyzer.uses_torch
+        scores.append(analyzer.analyze(analyzer.to_tensor(img)))
+    assert scores[0] == pytest.approx(scores[1], abs=1e-6)
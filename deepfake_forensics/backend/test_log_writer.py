@@ -0,0 +1,131 @@
+import uuid
+
+import pytest
+
+from app import models
+from app.core.database import SessionLocal, engine
+from app.core.log_writer import AnalysisLogWriter
+from app.models import AnalysisLog
+
+
+@pytest.fixture
+def tag():
+    """A filename prefix unique to the test: the test database is shared."""
+    models.Base.metadata.create_all(bind=engine)
+    return f"log-{uuid.uuid4().hex[:8]}"
+
+
+def row(name):
+    return {"filename": name, "media_type": "image", "verdict": "Real", "confidence": 0.2, "layer_scores": {}}
+
+
+def stored(tag):
+    db = SessionLocal()
+    try:
+        return db.query(AnalysisLog).filter(AnalysisLog.filename.like(f"{tag}%")).count()
+    finally:
+        db.close()
+
+
+def test_rows_are_written_in_batches(tag):
+    writer = AnalysisLogWriter(batch_size=4, flush_seconds=60)
+    for i in range(8):
+        writer.submit(row(f"{tag}-{i}"))
+    writer.stop()
+    assert stored(tag) == 8
+    assert writer.stats()["batches"] == 2
+    assert writer.stats()["written"] == 8
+
+
+def test_stop_drains_the_queue(tag):
+    # Far from a full batch or the interval: only stop() writes these
+    writer = AnalysisLogWriter(batch_size=1000, flush_seconds=60)
+    for i in range(5):
+        writer.submit(row(f"{tag}-{i}"))
+    assert stored(tag) == 0
+    writer.stop()
+    assert stored(tag) == 5
+    assert writer.stats()["queue_depth"] == 0
+
+
+def test_flush_writes_without_waiting_for_the_interval(tag):
+    writer = AnalysisLogWriter(batch_size=1000, flush_seconds=60)
+    try:
+        assert writer.flush() # Nothing submitted yet
+        writer.submit(row(f"{tag}-a"))
+        assert writer.flush(timeout=5)
+        assert stored(tag) == 1
+        writer.submit(row(f"{tag}-b"))
+        assert writer.flush(timeout=5)
+        assert stored(tag) == 2
+        assert writer.stats()["batches"] == 2
+    finally:
+        writer.stop()
+
+
+def test_history_lists_a_just_logged_analysis(tag, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.api import endpoints
+    from app.core.config import settings
+    from app.main import app
+
+    writer = AnalysisLogWriter(batch_size=1000, flush_seconds=60)
+    monkeypatch.setattr(endpoints, "analysis_log", writer)
+    try:
+        endpoints._log_analysis(f"{tag}.png", ".png", {"verdict": "Real", "confidence": 0.3, "layer_scores": {}})
+        history = TestClient(app).get(f"{settings.API_V1_STR}/history", params={"limit": 500}).json()
+        assert f"{tag}.png" in [entry["filename"] for entry in history]
+    finally:
+        writer.stop()
+
+
+def test_flush_skips_the_round_trip_when_nothing_is_queued(tag, monkeypatch):
+    writer = AnalysisLogWriter(batch_size=1000, flush_seconds=60)
+    try:
+        writer.submit(row(f"{tag}-a"))
+        assert writer.flush(timeout=5)
+
+        def no_round_trip(*args, **kwargs):
+            raise AssertionError("flush() queued a request with nothing to write")
+        monkeypatch.setattr(writer._queue, "put", no_round_trip)
+        assert writer.flush(timeout=5)
+    finally:
+        monkeypatch.undo()
+        writer.stop()
+
+
+class LockedSession:
+    """Session whose inserts fail as on a locked database."""
+
+    def bulk_insert_mappings(self, *args):
+        raise RuntimeError("database is locked")
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_failed_write_answers_flush_at_once(tag, monkeypatch):
+    import time
+
+    from app.core import log_writer
+
+    writer = AnalysisLogWriter(batch_size=1000, flush_seconds=0.2)
+    monkeypatch.setattr(log_writer, "SessionLocal", LockedSession)
+    try:
+        writer.submit(row(f"{tag}-a"))
+        started = time.monotonic()
+        assert not writer.flush(timeout=5) # Told about the failure, not left waiting 5 s
+        assert not writer.flush(timeout=5) # Still failing: no round trip at all
+        assert time.monotonic() - started < 1.0
+
+        monkeypatch.setattr(log_writer, "SessionLocal", SessionLocal)
+        deadline = time.monotonic() + 5
+        while not writer.flush(timeout=5) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert stored(tag) == 1
+    finally:
+        writer.stop()
@@ -0,0 +1,90 @@
+import pickle
+
+import pytest
+
+from app.core.metrics import LAYER_ERRORS, Counter, Gauge, Histogram, Registry
+from app.core.orchestrator import ForensicsOrchestrator
+
+
+def registry():
+    reg = Registry()
+    reg.register(Counter("test_requests_total", "Requests.", ("verdict",)))
+    reg.register(Histogram("test_latency_seconds", "Latency.", ("layer",), buckets=(0.1, 1.0)))
+    return reg
+
+
+def test_render_prometheus_text():
+    reg = registry()
+    counter, histogram = reg._metrics["test_requests_total"], reg._metrics["test_latency_seconds"]
+    counter.inc(verdict="Real")
+    counter.inc(2, verdict='say "hi"')
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, layer="ela")
+    reg.register(Gauge("test_queue_depth", "Depth.", lambda: 3))
+    reg.register(Gauge("test_missing", "Not available.", lambda: None))
+
+    text = reg.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{verdict="Real"} 1.0' in text
+    assert 'test_requests_total{verdict="say \\"hi\\""} 2.0' in text
+    # Buckets are cumulative and end with +Inf
+    assert 'test_latency_seconds_bucket{layer="ela",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{layer="ela",le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{layer="ela",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{layer="ela"} 3' in text
+    assert 'test_latency_seconds_sum{layer="ela"} 5.55' in text
+    assert "test_queue_depth 3.0" in text
+    # A gauge without a value has no sample line
+    assert not [line for line in text.splitlines() if line.startswith("test_missing")]
+
+
+def test_worker_delta_merges_into_the_api_process():
+    worker, api = registry(), registry()
+    api._metrics["test_requests_total"].inc(verdict="Real")
+    worker._metrics["test_requests_total"].inc(verdict="Real")
+    worker._metrics["test_latency_seconds"].observe(0.5, layer="math")
+
+    # Shipped back from the pool process with the job's result
+    delta = pickle.loads(pickle.dumps(worker.drain()))
+    api.merge(delta)
+    text = api.render()
+    assert 'test_requests_total{verdict="Real"} 2.0' in text
+    assert 'test_latency_seconds_count{layer="math"} 1' in text
+    # Drained: the next delta only holds what happened since
+    assert worker.drain() == {"test_requests_total": {}, "test_latency_seconds": {}}
+
+
+def layer_errors(layer):
+    return LAYER_ERRORS._values.get((layer, "image"), 0.0)
+
+
+def test_raising_layer_counts_as_an_error():
+    def fail():
+        raise ValueError("boom")
+
+    before = layer_errors("test_raising")
+    run = ForensicsOrchestrator._instrumented("test_raising", fail, "image")
+    with pytest.raises(ValueError):
+        run()
+    assert layer_errors("test_raising") == before + 1
+
+
+def test_layer_reporting_an_error_counts_as_an_error():
+    before = layer_errors("test_reporting")
+    run = ForensicsOrchestrator._instrumented(
+        "test_reporting", lambda: {"score": 0.0, "details": {"error": "boom"}}, "image")
+    assert run()["details"]["error"] == "boom"
+    assert layer_errors("test_reporting") == before + 1
+    ForensicsOrchestrator._instrumented("test_reporting", lambda: {"score": 0.0, "details": {}}, "image")()
+    assert layer_errors("test_reporting") == before + 1
+
+
+def test_metrics_endpoint():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    res = TestClient(app).get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    assert "# TYPE forensics_analyses_total counter" in res.text
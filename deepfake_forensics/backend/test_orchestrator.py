@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.core.media import MediaContext
+from app.core.orchestrator import ForensicsOrchestrator
+
+
+def sleeper(seconds):
+    def run():
+        time.sleep(seconds)
+        return {"score": 0.5, "details": {}}
+    return run
+
+
+@pytest.fixture
+def concurrent(monkeypatch):
+    monkeypatch.setattr(settings, "LAYER_TIMEOUTS", {})
+    monkeypatch.setattr(settings, "REQUEST_DEADLINE_SECONDS", 60.0)
+    return monkeypatch
+
+
+def test_queued_layers_do_not_time_out(concurrent):
+    # One worker: each layer waits for the one before it, but runs well within its own timeout
+    concurrent.setattr(settings, "LAYER_MAX_WORKERS", 1)
+    concurrent.setattr(settings, "LAYER_TIMEOUT_SECONDS", 0.5)
+    tasks = [(name, sleeper(0.2)) for name in ("metadata", "math_forensics", "physics")]
+    results, timed_out = ForensicsOrchestrator()._run_concurrent(tasks)
+    assert timed_out == []
+    assert list(results) == ["metadata", "math_forensics", "physics"]
+
+
+def test_overrunning_layer_times_out(concurrent):
+    concurrent.setattr(settings, "LAYER_MAX_WORKERS", 2)
+    concurrent.setattr(settings, "LAYER_TIMEOUT_SECONDS", 5.0)
+    concurrent.setattr(settings, "LAYER_TIMEOUTS", {"physics": 0.2})
+    started = time.monotonic()
+    results, timed_out = ForensicsOrchestrator()._run_concurrent([("metadata", sleeper(0.05)), ("physics", sleeper(1.0))])
+    assert timed_out == ["physics"]
+    assert list(results) == ["metadata"]
+    assert time.monotonic() - started < 0.9
+
+
+def test_request_deadline_bounds_queued_layers(concurrent):
+    concurrent.setattr(settings, "LAYER_MAX_WORKERS", 1)
+    concurrent.setattr(settings, "LAYER_TIMEOUT_SECONDS", 5.0)
+    concurrent.setattr(settings, "REQUEST_DEADLINE_SECONDS", 0.3)
+    results, timed_out = ForensicsOrchestrator()._run_concurrent([("metadata", sleeper(0.6)), ("physics", sleeper(0.01))])
+    assert timed_out == ["metadata", "physics"]
+    assert results == {}
+
+
+def test_executor_created_once(concurrent):
+    orch = ForensicsOrchestrator()
+    barrier = threading.Barrier(8)
+    executors = []
+
+    def run():
+        barrier.wait()
+        orch._run_concurrent([("metadata", sleeper(0))])
+        executors.append(orch._executor)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(map(id, executors))) == 1
+
+
+def test_context_outlives_abandoned_layers(concurrent):
+    concurrent.setattr(settings, "LAYER_MAX_WORKERS", 2)
+    concurrent.setattr(settings, "LAYER_TIMEOUT_SECONDS", 0.1)
+    ctx = MediaContext.from_bytes(b"not really a jpeg", "upload.jpg")
+    spilled = ctx.local_path()
+    seen = []
+
+    def slow_layer():
+        time.sleep(0.5)
+        # Still running after the request gave up on it: the spill file must still be there
+        seen.append(os.path.exists(spilled))
+        return {"score": 0.5, "details": {}}
+
+    orch = ForensicsOrchestrator()
+    results, timed_out = orch._run_concurrent([("physics", slow_layer)], ctx)
+    assert timed_out == ["physics"]
+    ctx.close()
+    assert os.path.exists(spilled)
+    orch._executor.shutdown(wait=True)
+    assert seen == [True]
+    assert not os.path.exists(spilled)
+
+
+class FailingNetwork:
+    """Layer 4 stand-in whose network path raises; the heuristic path works."""
+    uses_torch = True
+
+    def to_tensor(self, img):
+        return "tensor"
+
+    def analyze_detailed(self, image_input):
+        if image_input == "tensor":
+            raise RuntimeError("forward failed")
+        return {"score": 0.25, "details": {"scoring": "heuristic"}}
+
+
+def test_layer4_failure_falls_back_to_heuristics_visibly(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "ENABLED_LAYERS", {"ai_model"})
+    orch = ForensicsOrchestrator()
+    orch.__dict__["layer4"] = FailingNetwork()
+    ctx = MediaContext.from_array(np.zeros((32, 32, 3), np.uint8))
+    [(name, task)] = orch._layer_tasks(ctx)
+    res = task()
+    assert name == "ai_model" and res["score"] == 0.25
+    assert res["details"] == {"scoring": "heuristic", "fallback": "network scoring failed", "error": "forward failed"}
+    assert "Layer 4 network scoring failed" in caplog.text
@@ -3,16 +3,16 @@ import cv2
 import numpy as np
 from app.core.orchestrator import ForensicsOrchestrator
 
-def create_dummy_image(filename, pattern="noise"):
-    img = np.zeros((224, 224, 3), dtype=np.uint8)
+def create_dummy_image(filename, pattern="noise", size=(224, 224)):
+    """Writes a synthetic (width, height) image; the format follows the extension."""
+    width, height = size
+    img = np.zeros((height, width, 3), dtype=np.uint8)
     if pattern == "noise":
         cv2.randn(img, (128, 128, 128), (50, 50, 50))
     elif pattern == "grid":
         # Simulate checkerboard artifact
-        for i in range(0, 224, 8):
-            for j in range(0, 224, 8):
-                if (i//8 + j//8) % 2 == 0:
-                    img[i:i+8, j:j+8] = 255
+        cells = (np.arange(height)[:, None] // 8 + np.arange(width)[None, :] // 8) % 2 == 0
+        img[cells] = 255
     
     cv2.imwrite(filename, img)
     return filename
@@ -0,0 +1,58 @@
+import pstats
+import time
+
+from app.core.profiling import RequestProfile, Trace, span
+
+
+def work():
+    with span("decode"):
+        time.sleep(0.01)
+    for _ in range(3):
+        with span("layer"):
+            with span("fft"):
+                sum(range(1000))
+
+
+def test_span_is_a_no_op_outside_a_profile():
+    with span("anything") as value:
+        assert value is None
+    assert span("a") is span("b")
+
+
+def test_trace_merges_repeated_spans():
+    with RequestProfile() as profile:
+        work()
+    tree = profile.trace.to_dict()
+    assert tree["name"] == "analysis" and tree["calls"] == 1
+    children = {child["name"]: child for child in tree["children"]}
+    assert children["decode"]["calls"] == 1
+    assert children["decode"]["ms"] >= 10
+    assert children["layer"]["calls"] == 3
+    assert children["layer"]["children"][0]["name"] == "fft"
+    assert children["layer"]["children"][0]["calls"] == 3
+    assert tree["self_ms"] >= 0
+    # The profile is over once the block exits
+    assert span("after") is span("other")
+
+
+def test_hotspots_and_dump(tmp_path):
+    with RequestProfile() as profile:
+        work()
+    functions = [row["function"] for row in profile.hotspots()]
+    assert any(function.endswith("(work)") for function in functions)
+
+    path = tmp_path / "request.prof"
+    path.write_bytes(profile.dump())
+    assert pstats.Stats(str(path)).total_calls > 0
+
+
+def test_trace_nodes():
+    trace = Trace("root")
+    with trace.span("a"):
+        with trace.span("b"):
+            pass
+    with trace.span("a"):
+        pass
+    tree = trace.to_dict()
+    assert [child["name"] for child in tree["children"]] == ["a"]
+    assert tree["children"][0]["calls"] == 2
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.layers.layer2_biology import RPPGEstimator, RunningStats
+
+
+def pulse(bpm, fps, seconds, seed=0):
+    """Green-channel ROI means: a pulse at bpm on a slow drift, with noise."""
+    rng = np.random.RandomState(seed)
+    t = np.arange(0, seconds, 1.0 / fps)
+    values = 120 + 0.5 * np.sin(2 * np.pi * bpm / 60.0 * t) + 0.05 * t + rng.normal(0, 0.1, t.size)
+    return t, values
+
+
+@pytest.mark.parametrize("bpm", [55, 72, 130])
+def test_recovers_the_heart_rate(bpm):
+    estimator = RPPGEstimator(fps=30)
+    for t, value in zip(*pulse(bpm, 30, 25)):
+        estimator.push(t, value)
+    summary = estimator.summary()
+    assert summary["heart_rate_bpm"] == pytest.approx(bpm, abs=2)
+    assert summary["heart_rate_std_bpm"] < 2
+    assert summary["pulse_snr"] > settings.RPPG_MIN_PULSE_SNR
+    # One window once 10 s are buffered, then one per 1 s hop
+    assert summary["windows"] == pytest.approx(16, abs=1)
+    assert summary["samples"] == 25 * 30
+
+
+def test_noise_has_no_dominant_pulse():
+    estimator = RPPGEstimator(fps=30)
+    rng = np.random.RandomState(0)
+    for i in range(25 * 30):
+        estimator.push(i / 30.0, 120 + rng.normal(0, 0.1))
+    assert estimator.summary()["pulse_snr"] < settings.RPPG_MIN_PULSE_SNR
+
+
+def test_memory_stays_bounded_on_long_videos():
+    estimator = RPPGEstimator(fps=30, window_seconds=10)
+    capacity = len(estimator._times)
+    for t, value in zip(*pulse(80, 30, 120)):
+        estimator.push(t, value)
+    assert len(estimator._times) == capacity
+    assert estimator.summary()["heart_rate_bpm"] == pytest.approx(80, abs=2)
+
+
+def test_gaps_without_a_face_are_bridged():
+    t, values = pulse(90, 30, 25)
+    keep = (np.arange(t.size) % 10) != 3 # Every tenth frame has no face
+    estimator = RPPGEstimator(fps=30)
+    for ti, value in zip(t[keep], values[keep]):
+        estimator.push(ti, value)
+    assert estimator.summary()["heart_rate_bpm"] == pytest.approx(90, abs=2)
+
+
+def test_too_sparse_sampling_gives_no_estimate():
+    estimator = RPPGEstimator(fps=5)
+    for t, value in zip(*pulse(72, 5, 30)):
+        estimator.push(t, value)
+    assert estimator.summary()["heart_rate_bpm"] is None
+    assert estimator.summary()["windows"] == 0
+
+
+def test_running_stats_match_numpy():
+    values = np.random.RandomState(0).normal(5, 2, 1000)
+    stats = RunningStats()
+    for value in values:
+        stats.push(value)
+    assert stats.mean == pytest.approx(values.mean())
+    assert stats.std == pytest.approx(values.std())
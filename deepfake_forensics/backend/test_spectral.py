@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from app.core.spectral import Spectrum
+
+
+def full_spectrum_stats(gray, radius, eps, peak_sigmas):
+    """The statistics as computed on the full shifted fft2 spectrum."""
+    magnitude = 20 * np.log(np.abs(np.fft.fftshift(np.fft.fft2(gray))) + eps)
+    h, w = gray.shape
+    y, x = np.ogrid[:h, :w]
+    mask = (x - w // 2) ** 2 + (y - h // 2) ** 2 > radius ** 2
+    values = magnitude[mask]
+    threshold = values.mean() + peak_sigmas * values.std()
+    return {
+        "mean": values.mean(),
+        "max": values.max(),
+        "std": values.std(),
+        # Masked-out bins are zeros in the masked spectrum
+        "peaks": int(np.sum(magnitude * mask > threshold)),
+    }
+
+
+def image(shape, seed=0):
+    rng = np.random.RandomState(seed)
+    smooth = np.cumsum(np.cumsum(rng.normal(0, 1, shape), axis=0), axis=1)
+    smooth = (smooth - smooth.min()) / np.ptp(smooth) * 200
+    return np.clip(smooth + rng.normal(0, 4, shape), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("shape", [(64, 64), (63, 65), (64, 91), (75, 48), (33, 33)])
+def test_high_pass_stats_equal_fft2(shape):
+    gray = image(shape)
+    radius = int(min(shape) * 0.15)
+    stats = Spectrum(gray, workers=1).high_pass_stats(radius, eps=1e-7, peak_sigmas=3)
+    expected = full_spectrum_stats(gray, radius, 1e-7, 3)
+    for key in ("mean", "max", "std"):
+        assert stats[key] == pytest.approx(expected[key], rel=1e-12)
+    assert stats["peaks"] == expected["peaks"]
+
+
+@pytest.mark.parametrize("shape", [(64, 64), (63, 65), (64, 91)])
+def test_radial_profile_equals_fft2(shape):
+    gray = image(shape, seed=1)
+    magnitude = 20 * np.log(np.abs(np.fft.fftshift(np.fft.fft2(gray))) + 1e-7)
+    h, w = shape
+    y, x = np.ogrid[:h, :w]
+    bins = np.sqrt((x - w // 2) ** 2 + (y - h // 2) ** 2).astype(np.intp)
+    expected = np.bincount(bins.ravel(), weights=magnitude.ravel()) / np.bincount(bins.ravel())
+
+    profile = Spectrum(gray, workers=1).radial_profile(eps=1e-7)
+    np.testing.assert_allclose(profile, expected, rtol=1e-12)
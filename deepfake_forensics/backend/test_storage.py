@@ -0,0 +1,122 @@
+import hashlib
+import os
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.storage import StorageManager, StorageStaticFiles
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_KEEP_ORIGINALS", True)
+    monkeypatch.setattr(settings, "STORAGE_TTL_HOURS", 0)
+    monkeypatch.setattr(settings, "STORAGE_QUOTA_MB", 0)
+    return StorageManager(str(tmp_path))
+
+
+def save(store, data, ext):
+    """Stores an upload the way the upload endpoint does. Returns (path, sha256)."""
+    fd, tmp = store.temp_file()
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    content_hash = hashlib.sha256(data).hexdigest()
+    return store.adopt_upload(tmp, content_hash, ext), content_hash
+
+
+def age(path, hours):
+    """Sets a file's last use `hours` ago."""
+    past = time.time() - hours * 3600
+    os.utime(path, (past, past))
+
+
+def test_identical_uploads_are_stored_once(store):
+    data = b"same bytes"
+    first, digest = save(store, data, ".JPG")
+    second, _ = save(store, data, ".jpg")
+    assert first == second
+    assert digest == hashlib.sha256(data).hexdigest()
+    # Sharded by hash prefix, extension lower-cased
+    assert first.endswith(os.path.join("originals", digest[:2], digest[2:4], f"{digest}.jpg"))
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_sweep_removes_expired_files(store, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_TTL_HOURS", 24)
+    old = store.write("ela", "a" * 64, ".png", b"old")
+    new = store.write("ela", "b" * 64, ".png", b"new")
+    age(old, 48)
+    stats = store.sweep()
+    assert stats["removed_files"] == 1
+    assert not os.path.exists(old) and os.path.exists(new)
+    # The emptied shard directories are pruned
+    assert not os.path.exists(os.path.dirname(old))
+
+
+def test_sweep_enforces_the_quota_least_recently_used_first(store, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_QUOTA_MB", 2.5)
+    paths = [store.write("ela", str(i) * 64, ".png", b"x" * (1024 * 1024)) for i in range(4)]
+    for hours, path in zip((4, 1, 3, 2), paths):
+        age(path, hours)
+    stats = store.sweep()
+    assert stats["kept_bytes"] <= 2.5 * 1024 * 1024
+    # Oldest uses go first: 4 h, then 3 h
+    assert [os.path.exists(path) for path in paths] == [False, True, False, True]
+
+
+def test_pinned_originals_survive_the_sweep(store, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_TTL_HOURS", 1)
+    path, _ = save(store, b"in use", ".png")
+    age(path, 10)
+    store.sweep()
+    assert os.path.exists(path)
+    store.release(path)
+    store.sweep()
+    assert not os.path.exists(path)
+
+
+def test_released_originals_deleted_unless_kept(store, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_KEEP_ORIGINALS", False)
+    path, _ = save(store, b"twice", ".png")
+    save(store, b"twice", ".png")
+    store.release(path)
+    assert os.path.exists(path) # Still pinned by the second upload
+    store.release(path)
+    assert not os.path.exists(path)
+
+
+def mounted(store, kinds=None):
+    app = FastAPI()
+    app.mount("/uploads", StorageStaticFiles(store, kinds), name="uploads")
+    return TestClient(app)
+
+
+def test_mount_serves_only_public_kinds(store, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_PUBLIC_KINDS", {"ela"})
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", False)
+    store.write("ela", "a" * 64, ".png", b"ela image")
+    store.write("profiles", "b" * 64, ".prof", b"profile")
+    original, digest = save(store, b"raw upload", ".jpg")
+    with open(os.path.join(store.root, "ela_legacy.png"), "wb") as f:
+        f.write(b"legacy ela")
+    with open(os.path.join(store.root, "legacy.jpg"), "wb") as f:
+        f.write(b"legacy upload")
+    client = mounted(store)
+
+    assert client.get(f"/uploads/ela/{'a' * 64}.png").content == b"ela image"
+    assert client.get("/uploads/ela_legacy.png").content == b"legacy ela"
+    # Users' uploads (sharded path or public name, old or new) and profiles stay private
+    assert client.get(f"/uploads/originals/{digest}.jpg").status_code == 404
+    assert client.get("/uploads/" + os.path.relpath(original, store.root).replace(os.sep, "/")).status_code == 404
+    assert client.get("/uploads/legacy.jpg").status_code == 404
+    assert client.get(f"/uploads/profiles/{'b' * 64}.prof").status_code == 404
+
+
+def test_profiles_served_while_profiling_is_enabled(store, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_PUBLIC_KINDS", {"ela"})
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    store.write("profiles", "b" * 64, ".prof", b"profile")
+    assert mounted(store).get(f"/uploads/profiles/{'b' * 64}.prof").content == b"profile"
@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.core.media import MediaContext
+from app.core.spectral import Spectrum, tiled_high_pass_stats
+from app.core.tiling import Moments, iter_tiles, iter_windows
+from app.layers.layer3_math import MathAnalyzer
+from app.layers.layer5_physics import PhysicsAnalyzer
+
+
+def texture(shape, seed=0):
+    rng = np.random.RandomState(seed)
+    img = cv2.GaussianBlur(rng.normal(128, 40, shape).astype(np.float32), (0, 0), 2)
+    return np.clip(img + rng.normal(0, 6, shape), 0, 255).astype(np.uint8)
+
+
+@pytest.fixture
+def tiny_budget(monkeypatch):
+    """A memory budget small enough to force many tiles."""
+    monkeypatch.setattr(settings, "IMAGE_MEMORY_BUDGET_MB", 0.05)
+
+
+@pytest.mark.parametrize("rows_only", [False, True])
+def test_haloed_tiles_match_the_whole_image(rows_only):
+    img = texture((301, 437)).astype(np.float32)
+    whole = cv2.Sobel(img, cv2.CV_32F, 1, 0, ksize=5)
+    tiled = np.zeros_like(whole)
+    for tile in iter_tiles(img.shape, 64, halo=2, rows_only=rows_only):
+        tiled[tile.y0:tile.y1, tile.x0:tile.x1] = tile.core(cv2.Sobel(tile.crop(img), cv2.CV_32F, 1, 0, ksize=5))
+    np.testing.assert_array_equal(tiled, whole)
+
+
+def test_tiles_cover_the_image_once():
+    cover = np.zeros((200, 333), np.int32)
+    for tile in iter_tiles(cover.shape, 48, align=8):
+        assert tile.y0 % 8 == 0 and tile.x0 % 8 == 0
+        cover[tile.y0:tile.y1, tile.x0:tile.x1] += 1
+    assert np.all(cover == 1)
+
+
+def test_windows_have_one_shape_and_reach_the_edges():
+    windows = list(iter_windows((300, 500), 128, overlap=32))
+    assert {(y1 - y0, x1 - x0) for y0, y1, x0, x1 in windows} == {(128, 128)}
+    assert max(y1 for _, y1, _, _ in windows) == 300
+    assert max(x1 for _, _, _, x1 in windows) == 500
+
+
+def test_moments_pool_like_one_array():
+    rng = np.random.RandomState(0)
+    parts = [rng.normal(i, 1 + i, size) for i, size in enumerate((100, 57, 1000))]
+    pushed, merged = Moments(), Moments()
+    for part in parts:
+        pushed.push(part.astype(np.float32))
+        merged.push_stats(part.size, part.mean(), part.std(), part.max())
+    everything = np.concatenate(parts)
+    for moments in (pushed, merged):
+        assert moments.mean == pytest.approx(everything.mean(), rel=1e-6)
+        assert moments.std == pytest.approx(everything.std(), rel=1e-6)
+        assert moments.max == pytest.approx(everything.max(), rel=1e-6)
+
+
+def test_gradient_direction_tiled_equals_whole(monkeypatch, tiny_budget):
+    v = texture((300, 420))
+    tiled = PhysicsAnalyzer()._gradient_direction_std(v)
+    monkeypatch.setattr(settings, "IMAGE_MEMORY_BUDGET_MB", 512)
+    assert tiled == pytest.approx(PhysicsAnalyzer()._gradient_direction_std(v), rel=1e-9)
+
+
+def test_block_dct_histograms_tiled_equal_whole(monkeypatch, tiny_budget):
+    # The pixel path (coefficients read by jpeglib never go through tiles)
+    monkeypatch.setattr(settings, "JPEG_COMPRESSED_DOMAIN", False)
+    ok, buf = cv2.imencode(".jpg", cv2.cvtColor(texture((304, 400)), cv2.COLOR_GRAY2BGR),
+                           [cv2.IMWRITE_JPEG_QUALITY, 80])
+    tiled, qtable, source = MathAnalyzer()._jpeg_coefficient_histograms(MediaContext.from_bytes(buf.tobytes(), "a.jpg"))
+    assert source == "pixels_requantized"
+    monkeypatch.setattr(settings, "IMAGE_MEMORY_BUDGET_MB", 512)
+    whole, _, _ = MathAnalyzer()._jpeg_coefficient_histograms(MediaContext.from_bytes(buf.tobytes(), "a.jpg"))
+    np.testing.assert_array_equal(tiled, whole)
+
+
+def test_tiled_spectrum_of_one_window_is_exact():
+    gray = texture((96, 130))
+    radius = int(min(gray.shape) * 0.15)
+    tiled = tiled_high_pass_stats(gray, radius, side=256, overlap=0)
+    whole = Spectrum(gray, workers=1).high_pass_stats(radius)
+    for key in ("mean", "std", "max"):
+        assert tiled[key] == pytest.approx(whole[key], rel=1e-12)
+
+
+def test_tiled_spectrum_close_on_stationary_texture():
+    gray = texture((512, 512), seed=3)
+    radius = int(512 * 0.15)
+    tiled = tiled_high_pass_stats(gray, radius, side=128, overlap=32)
+    whole = Spectrum(gray, workers=1).high_pass_stats(radius)
+    # Same band of normalized frequencies, on the whole image's scale
+    assert tiled["mean"] == pytest.approx(whole["mean"], abs=1.0)
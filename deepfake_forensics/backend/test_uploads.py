@@ -0,0 +1,92 @@
+import hashlib
+import os
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.storage import storage
+from app.core.uploads import receive_upload
+
+app = FastAPI()
+
+
+@app.post("/upload")
+async def upload(request: Request):
+    try:
+        received = await receive_upload(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stored = None
+    if received.path is not None:
+        with open(received.path, "rb") as f:
+            stored = hashlib.sha256(f.read()).hexdigest()
+        storage.release(received.path)
+    return {"filename": received.filename, "in_memory": received.data is not None,
+            "hash": received.content_hash, "stored_hash": stored, "size": received.size}
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def payload(size):
+    return os.urandom(size)
+
+
+def leftover_temp_files():
+    return os.listdir(storage.tmp_dir) if os.path.isdir(storage.tmp_dir) else []
+
+
+def test_small_image_stays_in_memory(client):
+    data = payload(300_000)
+    res = client.post("/upload", files={"file": ("photo.jpg", data, "image/jpeg")}).json()
+    assert res == {"filename": "photo.jpg", "in_memory": True, "hash": hashlib.sha256(data).hexdigest(),
+                   "stored_hash": None, "size": len(data)}
+
+
+def test_image_over_the_limit_goes_to_storage(client, monkeypatch):
+    monkeypatch.setattr(settings, "IN_MEMORY_UPLOAD_MAX_BYTES", 100_000)
+    data = payload(250_000)
+    res = client.post("/upload", files={"file": ("big.png", data, "image/png")}).json()
+    assert not res["in_memory"]
+    assert res["hash"] == res["stored_hash"] == hashlib.sha256(data).hexdigest()
+    assert leftover_temp_files() == []
+
+
+def test_video_never_held_in_memory(client):
+    data = payload(50_000)
+    res = client.post("/upload", files={"file": ("clip.mp4", data, "video/mp4")},
+                      data={"note": "other fields are ignored"}).json()
+    assert not res["in_memory"]
+    assert res["stored_hash"] == hashlib.sha256(data).hexdigest()
+    assert leftover_temp_files() == []
+
+
+def test_missing_file_is_rejected(client):
+    assert client.post("/upload", data={"other": "x"}, files={"other_file": ("a.jpg", b"x")}).status_code == 400
+    assert client.post("/upload", content=b"raw", headers={"content-type": "application/octet-stream"}).status_code == 400
+
+
+def test_analyze_endpoint_reads_the_upload(monkeypatch):
+    import cv2
+    import numpy as np
+
+    from app.core.jobs import job_manager
+    from app.main import app as api
+
+    monkeypatch.setattr(settings, "ANALYSIS_EXECUTOR", "thread")
+    monkeypatch.setattr(settings, "ENABLED_LAYERS", {"metadata", "math_forensics"})
+    monkeypatch.setattr(settings, "RESULT_CACHE_ENABLED", False)
+    job_manager.shutdown()
+    ok, buf = cv2.imencode(".png", np.full((64, 64, 3), 90, np.uint8))
+    try:
+        client = TestClient(api)
+        res = client.post(f"{settings.API_V1_STR}/analyze", files={"file": ("flat.png", buf.tobytes(), "image/png")})
+        assert res.status_code == 200
+        assert "math_forensics" in res.json()["layer_scores"]
+        assert client.post(f"{settings.API_V1_STR}/analyze", data={"x": "1"}).status_code == 400
+    finally:
+        job_manager.shutdown()
@@ -0,0 +1,99 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from app.core.video import FrameSource
+
+FRAMES = 60
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    """MJPEG clip whose frame i is a flat gray of brightness 4 * i."""
+    path = str(tmp_path_factory.mktemp("video") / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30.0, (64, 48))
+    if not writer.isOpened():
+        pytest.skip("no MJPEG encoder in this OpenCV build")
+    for i in range(FRAMES):
+        writer.write(np.full((48, 64, 3), 4 * i, np.uint8))
+    writer.release()
+    return path
+
+
+class CountingCapture:
+    """Wraps a VideoCapture, counting reads and seeks."""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.grabs = 0
+        self.seeks = 0
+
+    def grab(self):
+        self.grabs += 1
+        return self.cap.grab()
+
+    def set(self, prop, value):
+        self.seeks += 1
+        return self.cap.set(prop, value)
+
+    def __getattr__(self, name):
+        return getattr(self.cap, name)
+
+
+def brightness(frame):
+    return int(round(frame.mean() / 4))
+
+
+def counted(clip, **kwargs):
+    source = FrameSource(clip, **kwargs)
+    source._cap = CountingCapture(source._cap)
+    return source
+
+
+def test_interleaved_consumers_share_one_pass(clip):
+    source = counted(clip)
+    source.subscribe("first", 40)
+    source.subscribe("uniform", 6)
+    got = {}
+
+    def consume(name, strategy, max_frames):
+        got[name] = [(i, brightness(f)) for i, f in source.frames(strategy, max_frames)]
+
+    threads = [threading.Thread(target=consume, args=args)
+               for args in (("first", "first", 40), ("uniform", "uniform", 6))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert got["first"] == [(i, i) for i in range(40)]
+    assert got["uniform"] == [(i, i) for i in range(0, FRAMES, 10)]
+    # Frame 0 came from the open; frames 1-50 were grabbed once each, never
+    # sought, and the pass stopped once no consumer wanted more
+    assert source._cap.grabs == 50 and source._cap.seeks == 0
+    assert source.passes == 1
+
+
+def test_sequential_consumers_share_one_pass(clip):
+    # As in sequential mode: Layer 2 reads its frames before Layer 4 starts
+    source = counted(clip)
+    source.subscribe("first", 40)
+    source.subscribe("uniform", 6)
+    first = [i for i, _ in source.frames("first", 40)]
+    uniform = [i for i, f in source.frames("uniform", 6)]
+    assert first == list(range(40))
+    assert uniform == list(range(0, FRAMES, 10))
+    assert source._cap.grabs == 50 and source.passes == 1
+
+
+def test_unread_subscriber_overflowing_its_buffer_replays(clip):
+    # Layer 4 first (as the cascade may order it): Layer 2's frames pile up unread
+    source = counted(clip, buffer_frames=8)
+    source.subscribe("first", 30)
+    source.subscribe("uniform", 6)
+    assert [i for i, _ in source.frames("uniform", 6)] == list(range(0, FRAMES, 10))
+    frames = [(i, brightness(f)) for i, f in source.frames("first", 30)]
+    assert frames == [(i, i) for i in range(30)]
+    assert source.passes == 2
@@ -151,10 +151,9 @@ const Dashboard = () => {
                 // Add preview URL from the file object
                 data.previewUrl = (files[i] as any).preview;
 
-                // Fix ELA URL if present
+                // ELA URL is an API path; the image is rendered when first requested
                 if (data.ela_url) {
-                    const filename = data.ela_url.split(/[/\\]/).pop();
-                    data.ela_url = `http://localhost:8000/uploads/${filename}`;
+                    data.ela_url = `http://localhost:8000${data.ela_url}`;
                 }
 
                 newResults.push(data);